@@ -1,4 +1,9 @@
 import os
+import sys
+# the repository root, so examples.utils resolves when the script is run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from examples.utils.headless import headless_args, run_headless
+import time
 import mujoco as mj
 from mujoco.glfw import glfw
 import numpy as np
@@ -46,8 +51,38 @@ def get_beta_matrix(g, f, h, s):
 
 
 
+class CallbackLatency:
+    # histogram of the controller callback wall time, filled in place every physics step
+    edges = np.array([0.0, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 1e-1, 1.0, np.inf])
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.edges) - 1, dtype=int)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[np.searchsorted(self.edges, seconds, side='right') - 1] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def report(self, budget):
+        n = self.counts.sum()
+        if n == 0:
+            return
+        print("controller callback latency over %d calls: mean %.3f ms, max %.3f ms" % (n, 1e3*self.total/n, 1e3*self.max))
+        for lo, hi, count in zip(self.edges[:-1], self.edges[1:], self.counts):
+            if count:
+                print("  %8.3f - %8.3f ms  %7d  %5.1f%%" % (1e3*lo, 1e3*hi, count, 100.0*count/n))
+        over = self.counts[np.searchsorted(self.edges, budget, side='right') - 1:].sum()
+        print("  calls over the %.3f s timestep budget: %d (%.1f%%)" % (budget, over, 100.0*over/n))
+
+
+callback_latency = CallbackLatency()
+
+
 def init_controller(model,data):
     global h, v, beta, alpha, q,q_dot, theta1, theta2, theta3, theta4, Ixx, Iyy, Izz, x, y, z, roll, pitch, yaw, droll, dpitch, dyaw,f,g,s
+    global beta_fun, alpha_fun, v_fun
     #initialize the controller here. This function is called once, in the beginning
     (Ixx, Iyy, Izz, theta1, theta2, theta3, theta4, theta1_dot, theta2_dot, theta3_dot, theta4_dot, T1, T2, T3, T4, x, y, z, roll, pitch, yaw, dx, dy, dz, droll, dpitch, dyaw) = sp.symbols('Ixx, Iyy, Izz, theta1, theta2, theta3, theta4, theta1_dot, theta2_dot, theta3_dot, theta4_dot, T1, T2, T3, T4, x, y, z, roll, pitch, yaw, dx, dy, dz, droll, dpitch, dyaw')
     q = Matrix([[x, y, z, roll, pitch, yaw]]).T
@@ -80,6 +115,14 @@ def init_controller(model,data):
 
     print(beta[:])
 
+    # compile the lie derivatives once into numpy functions of the sensor values, substituting
+    # into the sympy expressions every physics step is far too slow for the callback
+    beta_fun = sp.lambdify((theta1, theta2, theta3, theta4, Ixx, Iyy, Izz), beta, 'numpy')
+    alpha_fun = sp.lambdify((roll, pitch, yaw, droll, dpitch, dyaw, Ixx, Iyy, Izz), alpha, 'numpy')
+    q_desired = Matrix(sp.symbols('x_des, y_des, z_des, roll_des, pitch_des, yaw_des'))
+    Kp_v = sp.symbols('Kp_v')
+    v_fun = sp.lambdify((q_desired, q, Kp_v), Kp_v*(q_desired - q), 'numpy')
+
 
 
 def RotToRPY(R):
@@ -91,9 +134,9 @@ def RotToRPY(R):
 
 
 def controller(model, data):
-    global h, v, beta, alpha, q,q_dot, theta1, theta2, theta3, theta4, Ixx, Iyy, Izz, dpitch, droll, dyaw, roll, pitch, yaw, x, y, z,f,g,s
-    
-    
+    global beta_fun, alpha_fun, v_fun
+    start = time.perf_counter()
+
     tiltangle1 = data.sensordata[0]
     tiltvel1 = data.sensordata[1]
     tiltangle2 = data.sensordata[2]
@@ -121,20 +164,17 @@ def controller(model, data):
     a = np.hstack((R.T, np.zeros((3, 3))))
     rot = np.vstack((a, b))
     q_desired = rot@np.array([0, 0.0, 2, 0.0, 0.0, 0.0])
-    q_desired = Matrix([q_desired]).T
-    
-    h = q_desired - q
 
     Kp = 5
-    v = Kp * h
 
-    costs = Matrix([.1, .1, .1, .1, .5, .5, .5, .5])
+    costs = np.array([.1, .1, .1, .1, .5, .5, .5, .5])
 
-
-    beta_val = beta.subs({theta1:tiltangle1, theta2:tiltangle2, theta3:tiltangle3, theta4:tiltangle4, Ixx:1.2, Iyy:1.1, Izz:1.0})
-    v_val = v.subs({x:body_coords[0], y:body_coords[1], z:body_coords[2], roll:float(orientation[0]), pitch:float(orientation[1]), yaw:float(orientation[2])})
-    alpha_val = alpha.subs({roll:float(orientation[0]), pitch:float(orientation[1]), yaw:float(orientation[2]), Ixx:1.2, Iyy:1.1, Izz:1.0, dpitch:pitch_vel, droll:roll_vel, dyaw:yaw_vel})
-    u_val = beta_val.pinv()*(v_val-alpha_val) 
+    q_val = [body_coords[0], body_coords[1], body_coords[2], float(orientation[0, 0]), float(orientation[1, 0]), float(orientation[2, 0])]
+    beta_val = beta_fun(tiltangle1, tiltangle2, tiltangle3, tiltangle4, 1.2, 1.1, 1.0)
+    v_val = v_fun(q_desired, q_val, Kp)
+    alpha_val = alpha_fun(float(orientation[0, 0]), float(orientation[1, 0]), float(orientation[2, 0]), roll_vel, pitch_vel, yaw_vel, 1.2, 1.1, 1.0)
+    # minimum norm least squares solution, same as beta.pinv()*(v - alpha)
+    u_val = np.linalg.lstsq(beta_val, v_val - alpha_val, rcond=None)[0]
     # print(v_val)
     # print(body_coords[2], u_val[0:4])
 
@@ -188,7 +228,8 @@ def controller(model, data):
     # data.ctrl[5] = control2
     # data.ctrl[6] = control3
     # data.ctrl[7] = control4
-    
+
+    callback_latency.record(time.perf_counter() - start)
    
 
 def keyboard(window, key, scancode, act, mods):
@@ -275,23 +316,28 @@ data = mj.MjData(model)                # MuJoCo data
 cam = mj.MjvCamera()                        # Abstract camera
 opt = mj.MjvOption()                        # visualization options
 
-# Init GLFW, create window, make OpenGL context current, request v-sync
-glfw.init()
-window = glfw.create_window(1200, 900, "Demo", None, None)
-glfw.make_context_current(window)
-glfw.swap_interval(1)
-
-# initialize visualization data structures
-mj.mjv_defaultCamera(cam)
-mj.mjv_defaultOption(opt)
-scene = mj.MjvScene(model, maxgeom=10000)
-context = mj.MjrContext(model, mj.mjtFontScale.mjFONTSCALE_150.value)
-
-# install GLFW mouse and keyboard callbacks
-glfw.set_key_callback(window, keyboard)
-glfw.set_cursor_pos_callback(window, mouse_move)
-glfw.set_mouse_button_callback(window, mouse_button)
-glfw.set_scroll_callback(window, scroll)
+# --headless steps as fast as possible without a window, see examples/utils/headless.py
+args = headless_args(simend)
+simend = args.simend
+
+if not args.headless:
+    # Init GLFW, create window, make OpenGL context current, request v-sync
+    glfw.init()
+    window = glfw.create_window(1200, 900, "Demo", None, None)
+    glfw.make_context_current(window)
+    glfw.swap_interval(1)
+
+    # initialize visualization data structures
+    mj.mjv_defaultCamera(cam)
+    mj.mjv_defaultOption(opt)
+    scene = mj.MjvScene(model, maxgeom=10000)
+    context = mj.MjrContext(model, mj.mjtFontScale.mjFONTSCALE_150.value)
+
+    # install GLFW mouse and keyboard callbacks
+    glfw.set_key_callback(window, keyboard)
+    glfw.set_cursor_pos_callback(window, mouse_move)
+    glfw.set_mouse_button_callback(window, mouse_button)
+    glfw.set_scroll_callback(window, scroll)
 
 # Example on how to set camera configuration
 # cam.azimuth = 90
@@ -305,36 +351,41 @@ init_controller(model,data)
 #set the controller
 mj.set_mjcb_control(controller)
 
-while not glfw.window_should_close(window):
-    time_prev = data.time
+if args.headless:
+    run_headless(model, data, simend, render_every=args.render_every).report()
+else:
+    while not glfw.window_should_close(window):
+        time_prev = data.time
 
-    while (data.time - time_prev < 1.0/60.0):
-        mj.mj_step(model, data)
+        while (data.time - time_prev < 1.0/60.0):
+            mj.mj_step(model, data)
 
-    if (data.time>=simend):
-        break;
+        if (data.time>=simend):
+            break;
     
 
 
-    # get framebuffer viewport
-    viewport_width, viewport_height = glfw.get_framebuffer_size(
-        window)
-    viewport = mj.MjrRect(0, 0, viewport_width, viewport_height)
+        # get framebuffer viewport
+        viewport_width, viewport_height = glfw.get_framebuffer_size(
+            window)
+        viewport = mj.MjrRect(0, 0, viewport_width, viewport_height)
+
+        #print camera configuration (help to initialize the view)
+        # if (print_camera_config==1):
+        #     print('cam.azimuth =',cam.azimuth,';','cam.elevation =',cam.elevation,';','cam.distance = ',cam.distance)
+        #     print('cam.lookat =np.array([',cam.lookat[0],',',cam.lookat[1],',',cam.lookat[2],'])')
 
-    #print camera configuration (help to initialize the view)
-    # if (print_camera_config==1):
-    #     print('cam.azimuth =',cam.azimuth,';','cam.elevation =',cam.elevation,';','cam.distance = ',cam.distance)
-    #     print('cam.lookat =np.array([',cam.lookat[0],',',cam.lookat[1],',',cam.lookat[2],'])')
+        # Update scene and render
+        mj.mjv_updateScene(model, data, opt, None, cam,
+                           mj.mjtCatBit.mjCAT_ALL.value, scene)
+        mj.mjr_render(viewport, scene, context)
 
-    # Update scene and render
-    mj.mjv_updateScene(model, data, opt, None, cam,
-                       mj.mjtCatBit.mjCAT_ALL.value, scene)
-    mj.mjr_render(viewport, scene, context)
+        # swap OpenGL buffers (blocking call due to v-sync)
+        glfw.swap_buffers(window)
 
-    # swap OpenGL buffers (blocking call due to v-sync)
-    glfw.swap_buffers(window)
+        # process pending GUI events, call GLFW callbacks
+        glfw.poll_events()
 
-    # process pending GUI events, call GLFW callbacks
-    glfw.poll_events()
+    glfw.terminate()
 
-glfw.terminate()
\ No newline at end of file
+callback_latency.report(model.opt.timestep)
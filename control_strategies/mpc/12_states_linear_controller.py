@@ -5,8 +5,15 @@ import math
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import time
-from global_vars_mpc import tvp
-from global_vars_mpc import mpc_global_controller
+from global_vars_mpc import default_context
+from drone_dynamics import dynamics
+from global_vars_mpc import mpc_options
+from mpc_cache import cached_setup
+from linear_qp_controller import LinearQPController
+from rti_controller import RTIController
+from model_tools import explicit_dynamics, zoh_model, ZOHDiscretization, CachedFunction
+from horizon_tvp import HorizonTVP
+from warm_start import warm_start_opts
 
 
 
@@ -19,82 +26,19 @@ Iyy = 1.0
 Izz = 1.0
 
 
+# exec this script with mpc_context in its globals to build an independent controller
+context = globals().get('mpc_context', default_context)
+tvp = context.tvp
+
 model_type = "continuous"
 mpc_model = do_mpc.model.Model(model_type)
 mpc_controller = None
 u = None
 x = None
 
-#second order taylor series approx of sin
-def sinTE(x):
-    return x - ((x)**3)/6 #+ ((x)**5)/120
-    #return sinTE(x)
-def cosTE(x):
-    return 1 -(x**2)/2 #+ ((x)**4)/24
-    #return cosTE(x)
-
-def rotBE(r,p,y):    
-    rotBErow1 = horzcat(
-                            (cosTE(y)*cosTE(p)), 
-                            (sinTE(y)*cosTE(p)), 
-                            (-sinTE(p)))
-    rotBErow2 = horzcat(
-                            (cosTE(y)*sinTE(p) *sinTE(r) - sinTE(y)*cosTE(r)), 
-                            (sinTE(y)*sinTE(p) * sinTE(r) + cosTE(y)*cosTE(r)),
-                            (cosTE(p)*sinTE(r)))
-    rotBErow3 = horzcat(
-                            (cosTE(y)*sinTE(p) * cosTE(r) + sinTE(y)*sinTE(r)), 
-                            (sinTE(y)*sinTE(p) * cosTE(r) - cosTE(y)*sinTE(r)), 
-                            (cosTE(p)*cosTE(r)))
-    
-    rotBEm = vertcat(rotBErow1, rotBErow2,rotBErow3)
-    return rotBEm
-    
-
-def rotEB(r,p,y):
-    rotEBm = transpose(rotBE(r,p,y))
-    return rotEBm
-
-
-def f_acc(T1, T2, T3, T4, tilt1, tilt2, tilt3, tilt4,droll, dpitch,dyaw, euler_roll, euler_pitch, euler_yaw ):
-    f_acc = vertcat(
-
-    (T2*sinTE(tilt2) - T4*sinTE(tilt4) - m*g*sinTE(euler_pitch))/m, # 1
-    
-    (T1*sinTE(tilt1) - T3*sinTE(tilt3) - m*g*sinTE(euler_roll))/m, # 2
-    
-    (T1*cosTE(tilt1) + T2*cosTE(tilt2) + T3*cosTE(tilt3) + T4*cosTE(tilt4) - m*g*cosTE(euler_roll)*cosTE(euler_pitch))/m, # 3
-    
-    ((T2*cosTE(tilt2)*arm_length) - (T4*cosTE(tilt4)*arm_length) + (Iyy*dpitch*dyaw + Izz*dpitch*dyaw))/Ixx, # 4    
-    
-    (T1*cosTE(tilt1)*arm_length - T3*cosTE(tilt3)*arm_length + (-Ixx*droll*dyaw + Izz*droll*dyaw))/Iyy, # 5
-    
-    (T1*sinTE(tilt1)*arm_length + T2*sinTE(tilt2)*arm_length + T3*sinTE(tilt3)*arm_length + T4*sinTE(tilt4)*arm_length + (Ixx*droll*dpitch - Iyy*droll*dpitch))/Izz) # 6)
-    return f_acc
-#T_dot and T are for finding euler angle angular accelerations 
-
-def T_dot(euler_roll, euler_pitch, euler_yaw, droll_euler, dpitch_euler, dyaw_euler):
-    T_dot = vertcat(
-        horzcat(0,      
-            (cosTE(euler_roll)*droll_euler*tan(euler_pitch) + dpitch_euler*sinTE(euler_roll)*1/cosTE(euler_pitch)**2),
-            (-sinTE(euler_roll)*droll_euler*tan(euler_pitch) + dpitch_euler*cosTE(euler_roll)*1/cosTE(euler_pitch)**2)),
-
-        horzcat(0,      
-            (droll_euler*-sinTE(euler_roll)), 
-            (droll_euler*-cosTE(euler_roll))),
-            
-        horzcat(0,      
-            (cosTE(euler_roll)*droll_euler*1/cosTE(euler_pitch) + tan(euler_pitch)*dpitch_euler*sinTE(euler_roll)*1/cosTE(euler_pitch)),      
-            (sinTE(euler_roll)*droll_euler*1/cosTE(euler_pitch) + tan(euler_pitch)*dpitch_euler*cosTE(euler_roll)*1/cosTE(euler_pitch))))
-    return T_dot
-
-
-def T(euler_roll, euler_pitch, euler_yaw):
-    T = vertcat(
-    horzcat(1, sinTE(euler_roll)*tan(euler_pitch), cosTE(euler_roll)*tan(euler_pitch)),
-    horzcat(0,cosTE(euler_roll), - sinTE(euler_roll)),
-    horzcat(0, sinTE(euler_roll)/cosTE(euler_pitch), cosTE(euler_roll)/cosTE(euler_pitch)))
-    return T
+# model terms from the shared drone_dynamics module, sin/cos as Taylor series of mpc_options.trig_order
+dyn = dynamics(m=m, g=g, arm_length=arm_length, Ixx=Ixx, Iyy=Iyy, Izz=Izz, trig_order=mpc_options.trig_order)
+
 # STATES
 #dtheta is in terms of BODY ANGULAR VELOCITIES, while euler_ang is in terms of SPATIAL EULER ANGLES
 pos = mpc_model.set_variable('_x',  'pos', (3, 1))
@@ -116,177 +60,21 @@ last_acc = mpc_model.set_variable(var_type='_tvp', var_name='last_acc',shape=(6,
 target_velocity = mpc_model.set_variable(var_type='_tvp', var_name='target_velocity', shape=(3, 1))
 
 # Continuous variables -xyz pos, dx dy dz, and euler roll pitch yaw are spatial, while droll, dpitch, dyaw are body rates
+u_vec_cont = vertcat(u_th, u_ti)
+state_vec_cont = vertcat(pos, euler_ang, dpos, dtheta)
+result_vec_cont = vertcat(ddpos, ddtheta)
 
-
-
-#states
-xpos_cont = pos[0]
-ypos_cont = pos[1]
-zpos_cont = pos[2]
-
-euler_roll_cont = euler_ang[0]
-euler_pitch_cont = euler_ang[1]
-euler_yaw_cont = euler_ang[2]
-
-dx_cont = dpos[0]
-dy_cont = dpos[1]
-dz_cont = dpos[2] 
-
-
-droll_cont = dtheta[0]
-dpitch_cont = dtheta[1]
-dyaw_cont = dtheta[2]
-
-
-#accelerations
-ddx_cont = ddpos[0]
-ddy_cont = ddpos[1]
-ddz_cont = ddpos[2]
-
-ddroll_cont = ddtheta[0]
-ddpitch_cont = ddtheta[1]
-ddyaw_cont = ddtheta[2]
-
-
-# Inputs
-T1_cont = u_th[0]
-T2_cont = u_th[1]
-T3_cont = u_th[2]
-T4_cont = u_th[3]
-tilt1_cont = u_ti[0]
-tilt2_cont = u_ti[1]
-tilt3_cont = u_ti[2]
-tilt4_cont = u_ti[3]
-
-euler_ang_vel_cont = vertcat(
-                            (droll_cont + 
-                            dyaw_cont*cosTE(euler_roll_cont)*tan(euler_pitch_cont) + 
-                            dpitch_cont*sinTE(euler_roll_cont)*tan(euler_pitch_cont)),
-
-                            (dpitch_cont*cosTE(euler_roll_cont) - 
-                            dyaw_cont*sinTE(euler_roll_cont)),
-
-                            ((dyaw_cont*cosTE(euler_roll_cont)/(cosTE(euler_pitch_cont))) + 
-                            dpitch_cont*(sinTE(euler_roll_cont)/cosTE(euler_pitch_cont)))
-)
+euler_ang_vel_cont = dyn.euler_ang_vel(euler_ang, dtheta)
 
 mpc_model.set_rhs('pos', dpos)
 mpc_model.set_rhs('dpos', ddpos)
 mpc_model.set_rhs('euler_ang', euler_ang_vel_cont)
 mpc_model.set_rhs('dtheta', ddtheta)
 
+fspatial_acc_cont = dyn.fspatial_acc(state_vec_cont, u_vec_cont, result_vec_cont)
 
-f_bodyacc_cont = f_acc(T1_cont, T2_cont,T3_cont,T4_cont, tilt1_cont,tilt2_cont,tilt3_cont,tilt4_cont,droll_cont,dpitch_cont,dyaw_cont, euler_roll_cont,euler_pitch_cont,euler_yaw_cont )
-
-w_euler_cont = vertcat(euler_ang_vel_cont)
-droll_euler_cont = w_euler_cont[0] 
-dpitch_euler_cont = w_euler_cont[1]
-dyaw_euler_cont = w_euler_cont[2]
-
-v_b_cont = vertcat(dx_cont,dy_cont,dz_cont)#dx,dy,dz
-alpha_b_cont = vertcat(ddroll_cont, ddpitch_cont, ddyaw_cont)
-r_b_cont = vertcat(xpos_cont, ypos_cont, zpos_cont)#pos
-
-
-
-T_cont = T(euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
-T_dot_cont = T_dot(droll_euler_cont, dpitch_euler_cont, dyaw_euler_cont,euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
-
-alpha_euler_cont = T_cont@alpha_b_cont + T_dot_cont@vertcat(droll_cont, dpitch_cont, dyaw_cont)
-rotEBMatrix_cont = rotEB(euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
-
-fspatial_linear_acc_cont = vertcat((rotEBMatrix_cont@(f_bodyacc_cont[0:3])) + 2 * skew(w_euler_cont)@v_b_cont + skew(alpha_euler_cont)@r_b_cont + skew(w_euler_cont)@(skew(w_euler_cont)@r_b_cont))
-fspatial_rotation_acc_cont = vertcat(f_bodyacc_cont[3:6]) 
-fspatial_acc_cont = vertcat(fspatial_linear_acc_cont, fspatial_rotation_acc_cont)
-
-# TVP   - xyz pos, dx dy dz, and euler roll pitch yaw are spatial, while droll, dpitch, dyaw are body rates
-
-#states
-xpos_tvp = last_state[0]
-ypos_tvp = last_state[1]
-zpos_tvp = last_state[2]
-
-euler_roll_tvp = last_state[3]
-euler_pitch_tvp = last_state[4]
-euler_yaw_tvp = last_state[5]
-
-dx_tvp = last_state[6]
-dy_tvp = last_state[7]
-dz_tvp = last_state[8] 
-
-droll_tvp = last_state[9]
-dpitch_tvp = last_state[10]
-dyaw_tvp = last_state[11]
-
-
-#accelerations
-ddx_tvp = last_acc[0]
-ddy_tvp = last_acc[1]
-ddz_tvp = last_acc[2]
-
-ddroll_tvp = last_acc[3]
-ddpitch_tvp = last_acc[4]
-ddyaw_tvp = last_acc[5]
-
-
-# Inputs
-T1_tvp = last_input[0]
-T2_tvp = last_input[1]
-T3_tvp = last_input[2]
-T4_tvp = last_input[3]
-tilt1_tvp = last_input[4]
-tilt2_tvp = last_input[5]
-tilt3_tvp = last_input[6]
-tilt4_tvp = last_input[7]
-
-#would have to change to add roll and pitch for g term (still from last state input ig)
-f_bodyacc_tvp = f_acc(T1_tvp, T2_tvp,T3_tvp,T4_tvp, tilt1_tvp,tilt2_tvp,tilt3_tvp,tilt4_tvp,droll_tvp,dpitch_tvp,dyaw_tvp, euler_roll_tvp,euler_pitch_tvp,euler_yaw_tvp )
-
-
-euler_ang_vel_tvp = vertcat(
-                                (droll_tvp + dyaw_tvp*cosTE(euler_roll_tvp)*tan(euler_pitch_tvp) + dpitch_tvp*sinTE(euler_roll_tvp)*tan(euler_pitch_tvp)),
-
-                                (dpitch_tvp*cosTE(euler_roll_tvp) - dyaw_tvp*sinTE(euler_roll_tvp)),
-
-                                ((dyaw_tvp*cosTE(euler_roll_tvp)/(cosTE(euler_pitch_tvp))) + dpitch_tvp*(sinTE(euler_roll_tvp)/cosTE(euler_pitch_tvp)))
-)
-
-w_euler_tvp = vertcat(euler_ang_vel_tvp)
-droll_euler_tvp = w_euler_tvp[0] 
-dpitch_euler_tvp = w_euler_tvp[1]
-dyaw_euler_tvp = w_euler_tvp[2]
-
-v_b_tvp = vertcat(dx_tvp,dy_tvp,dz_tvp)#dx,dy,dz
-alpha_b_tvp = vertcat(ddroll_tvp, ddpitch_tvp, ddyaw_tvp)
-r_b_tvp = vertcat(xpos_tvp, ypos_tvp, zpos_tvp)#pos
-
-
-
-T_tvp = T(euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
-T_dot_tvp = T_dot(droll_euler_tvp, dpitch_euler_tvp, dyaw_euler_tvp,euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
-
-alpha_euler_tvp = T_tvp@alpha_b_tvp + T_dot_tvp@vertcat(droll_tvp,dpitch_tvp,dyaw_tvp)
-rotEBMatrix_tvp = rotEB(euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
-
-fspatial_linear_acc_tvp = vertcat((rotEBMatrix_tvp@(f_bodyacc_tvp[0:3])) + 2 * skew(w_euler_tvp)@v_b_tvp + skew(alpha_euler_tvp)@r_b_tvp + skew(w_euler_tvp)@(skew(w_euler_tvp)@r_b_tvp))
-#spatial_linear_acc_tvp = vertcat((rotEBMatrix_tvp@(f_bodyacc_tvp[0:3])))
-fspatial_rotation_acc_tvp = vertcat(f_bodyacc_tvp[3:6]) 
-fspatial_acc_tvp = vertcat(fspatial_linear_acc_tvp, fspatial_rotation_acc_tvp)
-#print(fspatial_acc_tvp)
-#print("/n")
-#print(fspatial_acc_cont)
-
-u_vec_cont = vertcat(
-    u_th,
-    u_ti
-)
-state_vec_cont = vertcat(
-    pos,
-    euler_ang,
-    dpos,
-    dtheta
-)
-result_vec_cont = vertcat(ddx_cont, ddy_cont, ddz_cont, ddroll_cont, ddpitch_cont, ddyaw_cont)
+# TVP   - the same accelerations at the last measured state, input and acceleration
+fspatial_acc_tvp = dyn.fspatial_acc(last_state, last_input, last_acc)
 
 A = jacobian(last_acc -fspatial_acc_tvp, last_state)
 print((A.shape))
@@ -297,10 +85,25 @@ print(C.shape)
 
 
 
+numeric_linearization = (mpc_options.linearization == 'numeric' and mpc_options.backend == 'ipopt'
+                         and mpc_options.discretization == 'collocation')
+if numeric_linearization:
+    # A, B, C and the residual only depend on the tvps: evaluate them once per step (see linearization_tvp
+    # below) and hand them to the NLP as tvp matrices, which leaves euler_lagrange linear in x, u and z
+    linearize = Function('linearize', [last_state, last_input, last_acc],
+                         [cse(A), cse(B), cse(C), cse(last_acc - fspatial_acc_tvp)],
+                         ['last_state', 'last_input', 'last_acc'], ['A', 'B', 'C', 'r'])
+    A = mpc_model.set_variable(var_type='_tvp', var_name='lin_A', shape=A.shape)
+    B = mpc_model.set_variable(var_type='_tvp', var_name='lin_B', shape=B.shape)
+    C = mpc_model.set_variable(var_type='_tvp', var_name='lin_C', shape=C.shape)
+    residual = mpc_model.set_variable(var_type='_tvp', var_name='lin_r', shape=(6, 1))
+else:
+    residual = last_acc - fspatial_acc_tvp
+
 #euler_lagrange =  (result_vec_cont -fspatial_acc_cont)
-euler_lagrange = C@(result_vec_cont-last_acc) +(A@(state_vec_cont-last_state)) +(B@(u_vec_cont-last_input)) +(last_acc - fspatial_acc_tvp)  
+euler_lagrange = C@(result_vec_cont-last_acc) +(A@(state_vec_cont-last_state)) +(B@(u_vec_cont-last_input)) +residual
 
-mpc_model.set_alg('euler_lagrange', euler_lagrange)
+mpc_model.set_alg('euler_lagrange', cse(euler_lagrange))
 
 
 
@@ -313,10 +116,28 @@ diff = ((dpos[0]-target_velocity[0])**2 +
 
 mpc_model.set_expression('diff', diff)
 
+if mpc_options.backend == 'rti':
+    # RTI linearizes the nonlinear model itself along its prediction: the accelerations solve
+    # result_vec_cont = fspatial_acc_cont instead of the euler_lagrange linearization at the last state.
+    # Built before mpc_model.setup(), which replaces the model symbols.
+    nonlinear_dynamics = explicit_dynamics(state_vec_cont, u_vec_cont, result_vec_cont,
+                                           vertcat(dpos, euler_ang_vel_cont, result_vec_cont),
+                                           result_vec_cont - fspatial_acc_cont)
+
 mpc_model.setup()
 
-mpc_controller = do_mpc.controller.MPC(mpc_model)
-n_horizon = 4
+controller_model = mpc_model
+if mpc_options.backend == 'qp':
+    mpc_controller = LinearQPController(mpc_model)
+elif mpc_options.backend == 'rti':
+    mpc_controller = RTIController(mpc_model, nonlinear_dynamics)
+else:
+    if mpc_options.discretization == 'zoh':
+        # IPOPT over a discrete-time model (no collocation points, no algebraic states): the exact
+        # zero-order hold of mpc_model linearized at the latest measurement, see zoh_tvp below
+        controller_model = zoh_model(mpc_model)
+    mpc_controller = do_mpc.controller.MPC(controller_model)
+n_horizon = mpc_options.n_horizon
 
 setup_mpc = {
     'n_horizon': n_horizon,
@@ -332,15 +153,20 @@ setup_mpc = {
     'nlpsol_opts': {'ipopt.linear_solver': 'mumps', 'ipopt.print_level':0}
 }
 
+if mpc_options.warm_start:
+    setup_mpc['nlpsol_opts'].update(warm_start_opts)
+
 mpc_controller.set_param(**setup_mpc)
+if mpc_options.backend == 'qp':
+    mpc_controller.set_param(formulation=mpc_options.qp_formulation)
 
-mterm = mpc_model.aux['diff'] # terminal cost
-lterm = mpc_model.aux['diff'] # stage cost
+mterm = controller_model.aux['diff'] # terminal cost
+lterm = controller_model.aux['diff'] # stage cost
 
 mpc_controller.set_objective(mterm=mterm, lterm=lterm)
 # Input force is implicitly restricted through the objective.
-mpc_controller.set_rterm(u_th=0.1)
-mpc_controller.set_rterm(u_ti=0.01)
+rterm_weights = {'u_th': 0.1, 'u_ti': 0.01}
+mpc_controller.set_rterm(**rterm_weights)
 
 tilt_limit = pi/(2.2)
 thrust_limit = 30
@@ -363,22 +189,66 @@ u0 = np.array([m*g/4,m*g/4,m*g/4,m*g/4,0.0,0.0,0.0,0.0]).T
 drone_acceleration = np.array([[0.0],[0.0],[0.0],[0.0],[0.0],[0.0]])
 mpc_controller.x0 = x0
 mpc_controller.u0 = u0
-mpc_controller.z0 = drone_acceleration
+if controller_model.n_z:
+    mpc_controller.z0 = drone_acceleration
 
 
 
-controller_tvp_template = mpc_controller.get_tvp_template()
-def controller_tvp_fun(t_now):
-    for k in range(n_horizon+1):
-        controller_tvp_template['_tvp',k,'last_state'] = tvp.x
-        controller_tvp_template['_tvp',k,'last_input'] = tvp.u
-        controller_tvp_template['_tvp',k,'last_acc'] = tvp.drone_accel
-        controller_tvp_template['_tvp',k,'target_velocity'] = tvp.target_velocity
-
-
-        return controller_tvp_template
+# every stage gets the latest measurement and target from tvp.buffer, which holds one stage of the
+# template in the order of the model's tvp entries; per-stage previews go through context.reference
+assert mpc_model.tvp.keys()[1:5] == ['last_state', 'last_input', 'last_acc', 'target_velocity']
+controller_tvp_fun = HorizonTVP(mpc_controller, tvp)
 mpc_controller.set_tvp_fun(controller_tvp_fun)
-mpc_controller.setup()
 
-mpc_global_controller.controller = mpc_controller
+if numeric_linearization:
+    # the linearization at the latest tvp data, held over the horizon like the symbolic one; the four
+    # entries share one CachedFunction, which only re-evaluates when tvp.buffer changed
+    linearization = CachedFunction(linearize)
+    n_stages = controller_tvp_fun.n_stages
+
+    def linearization_tvp(i):
+        def profile(t_now):
+            matrices = linearization(tvp.x, tvp.u, tvp.drone_accel)
+            return np.broadcast_to(matrices[i].ravel(order='F'), (n_stages, matrices[i].size))
+        return profile
+
+    for i, name in enumerate(('lin_A', 'lin_B', 'lin_C', 'lin_r')):
+        controller_tvp_fun.preview(name, linearization_tvp(i))
+
+if controller_model is not mpc_model:
+    # the discretized linearization at the latest tvp data, held over the horizon like the QP backend's;
+    # the three entries share one ZOHDiscretization, which only recomputes when tvp.buffer changed
+    zoh = ZOHDiscretization(mpc_model, setup_mpc['t_step'])
+    n_stages = controller_tvp_fun.n_stages
+
+    def zoh_tvp(i):
+        def profile(t_now):
+            matrices = zoh(tvp.x, tvp.u, tvp.buffer, np.zeros(mpc_model.n_p))
+            return np.broadcast_to(matrices[i].ravel(order='F'), (n_stages, matrices[i].size))
+        return profile
+
+    for i, name in enumerate(('zoh_Ad', 'zoh_Bd', 'zoh_dd')):
+        controller_tvp_fun.preview(name, zoh_tvp(i))
+
+# everything that ends up in the IPOPT solver; bounds are passed at solve time and are not part of the key
+mpc_params = {
+    'm': m, 'g': g, 'arm_length': arm_length,
+    'Ixx': Ixx, 'Iyy': Iyy, 'Izz': Izz,
+    'setup_mpc': setup_mpc,
+    'rterm': rterm_weights,
+    'discretization': mpc_options.discretization,
+    'linearization': numeric_linearization,
+    'trig_order': mpc_options.trig_order,
+}
+setup_time = cached_setup(mpc_controller, mpc_params,
+                          source_path=["control_strategies/mpc/12_states_linear_controller.py",
+                                       "control_strategies/mpc/drone_dynamics.py",
+                                       "control_strategies/mpc/model_tools.py",
+                                       "control_strategies/mpc/horizon_tvp.py"],
+                          use_cache=mpc_options.use_cache,
+                          codegen=mpc_options.codegen)
+print("MPC setup time: ", setup_time)
+
+context.controller = mpc_controller
+context.reference = controller_tvp_fun
 
@@ -8,6 +8,8 @@ import time
 from global_vars_mpc import tvp
 from global_vars_mpc import mpc_global_controller
 
+# own copy of the model terms, a variant with other parameters and all 12 states algebraic; the closed loop
+# scripts take theirs from drone_dynamics.py
 m = 1.8  # drone_mass
 g = 9.81
 arm_length = .2286
@@ -193,7 +195,7 @@ r_b_cont = vertcat(xpos_cont, ypos_cont, zpos_cont)#pos
 
 
 T_cont = T(euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
-T_dot_cont = T_dot(droll_euler_cont, dpitch_euler_cont, dyaw_euler_cont,euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
+T_dot_cont = T_dot(euler_roll_cont, euler_pitch_cont, euler_yaw_cont, droll_euler_cont, dpitch_euler_cont, dyaw_euler_cont)
 
 alpha_euler_cont = T_cont@alpha_b_cont + T_dot_cont@vertcat(droll_cont, dpitch_cont, dyaw_cont)
 rotEBMatrix_cont = rotEB(euler_roll_cont, euler_pitch_cont, euler_yaw_cont)
@@ -267,7 +269,7 @@ r_b_tvp = vertcat(xpos_tvp, ypos_tvp, zpos_tvp)#pos
 
 
 T_tvp = T(euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
-T_dot_tvp = T_dot(droll_euler_tvp, dpitch_euler_tvp, dyaw_euler_tvp,euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
+T_dot_tvp = T_dot(euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp, droll_euler_tvp, dpitch_euler_tvp, dyaw_euler_tvp)
 
 alpha_euler_tvp = T_tvp@alpha_b_tvp + T_dot_tvp@vertcat(droll_tvp,dpitch_tvp,dyaw_tvp)
 rotEBMatrix_tvp = rotEB(euler_roll_tvp, euler_pitch_tvp, euler_yaw_tvp)
@@ -0,0 +1,92 @@
+import os
+import time
+
+import numpy as np
+
+# Many independent instances of one do_mpc controller (initial state sweeps, a small swarm) solved in a
+# single call. The controller's casadi solver function is mapped over the instances with casadi's
+# map, so the instances run in casadi's thread pool (or OpenMP) instead of one make_step after the
+# other. Every instance gets its own column of the solver inputs: initial state, previous input,
+# tvp values of all stages and the primal/dual guess from its last solution.
+
+
+class BatchMPC:
+    """Solves n_instances copies of a set up do_mpc MPC in one mapped solver call.
+
+    make_step(x0, tvp) takes an (n_instances, n_x) stack of states and the tvp values per instance,
+    laid out like the model's tvp entries: (n_instances, n_tvp) rows held over the horizon, or
+    (n_instances, n_horizon+1, n_tvp) per-stage values. Without tvp every instance uses the values
+    of mpc's tvp function. Returns the (n_instances, n_u) first inputs.
+    parallelization is the casadi map mode ('serial', 'thread' or 'openmp'), n_threads caps the
+    threads of 'thread' (the number of cores by default).
+    """
+
+    def __init__(self, mpc, n_instances, parallelization='thread', n_threads=None):
+        self.mpc = mpc
+        self.n_instances = n_instances
+        if parallelization == 'thread':
+            n_threads = n_threads or os.cpu_count()
+            self.S = mpc.S.map(n_instances, parallelization, min(n_threads, n_instances))
+        else:
+            self.S = mpc.S.map(n_instances, parallelization)
+        model = mpc.model
+        self.n_tvp = model.n_tvp
+        self.n_stages = len(mpc.opt_p.f['_tvp'])//self.n_tvp
+        self.x0_index = np.array(mpc.opt_p.f['_x0'])
+        self.u_prev_index = np.array(mpc.opt_p.f['_u_prev'])
+        self.tvp_index = np.array(mpc.opt_p.f['_tvp'])
+        self.u0_index = np.array(mpc.opt_x.f['_u', 0, 0])
+        self.u_scaling = np.array(mpc._u_scaling.cat).ravel()
+        self.bounds = {'lbx': mpc._lb_opt_x.cat, 'ubx': mpc._ub_opt_x.cat,
+                       'lbg': mpc.nlp_cons_lb, 'ubg': mpc.nlp_cons_ub}
+        self.set_initial_guess()
+
+    def set_initial_guess(self):
+        """Start every instance from the controller's current guess and initial input."""
+        mpc = self.mpc
+        tile = lambda value: np.tile(np.array(value, dtype=float).reshape(-1, 1), (1, self.n_instances))
+        self.p = tile(mpc.opt_p_num.cat)
+        self.x_guess = tile(mpc.opt_x_num.cat)
+        self.lam_x = tile(np.zeros(mpc.opt_x.shape[0]))
+        self.lam_g = tile(np.zeros(mpc.nlp_cons_lb.shape[0]))
+        self.u_prev = tile(mpc._u0.cat).T
+        self.solved = False
+        self.t0 = 0.0
+        self.t_wall = None
+
+    def _stage_tvp(self, tvp):
+        if tvp is None:
+            stages = np.array(self.mpc.tvp_fun(self.t0).master).reshape(1, self.n_stages*self.n_tvp)
+            return np.broadcast_to(stages, (self.n_instances, stages.shape[1]))
+        tvp = np.asarray(tvp, dtype=float)
+        if tvp.shape == (self.n_instances, self.n_tvp):
+            tvp = np.broadcast_to(tvp[:, None, :], (self.n_instances, self.n_stages, self.n_tvp))
+        if tvp.shape != (self.n_instances, self.n_stages, self.n_tvp):
+            raise ValueError("expected tvp of shape %s or %s, got %s" % ((self.n_instances, self.n_tvp),
+                             (self.n_instances, self.n_stages, self.n_tvp), tvp.shape))
+        return tvp.reshape(self.n_instances, -1)
+
+    def make_step(self, x0, tvp=None):
+        start = time.perf_counter()
+        x0 = np.asarray(x0, dtype=float)
+        if x0.shape != (self.n_instances, len(self.x0_index)):
+            raise ValueError("expected x0 of shape %s, got %s" % ((self.n_instances, len(self.x0_index)), x0.shape))
+        self.p[self.x0_index] = x0.T
+        self.p[self.u_prev_index] = self.u_prev.T
+        self.p[self.tvp_index] = self._stage_tvp(tvp).T
+
+        args = dict(self.bounds, x0=self.x_guess, p=self.p)
+        if self.solved:
+            args.update(lam_x0=self.lam_x, lam_g0=self.lam_g)
+        sol = self.S(**args)
+        # each instance's solution is its guess for the next call, like do_mpc's solve
+        self.x_guess = np.array(sol['x'])
+        self.lam_x = np.array(sol['lam_x'])
+        self.lam_g = np.array(sol['lam_g'])
+        self.solved = True
+
+        u0 = self.x_guess[self.u0_index].T*self.u_scaling
+        self.u_prev = u0
+        self.t0 += self.mpc.settings.t_step
+        self.t_wall = time.perf_counter() - start
+        return u0
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from batch_mpc import BatchMPC
+from closed_loop import build
+from global_vars_mpc import MPCContext
+
+# Wall time of one controller step for n instances (random velocities, attitudes and target velocities
+# around hover): make_step on one do_mpc controller in a loop, the mapped solver evaluated serially and
+# the mapped solver on casadi's thread pool. Also checks that the batch returns the loop's inputs.
+# Run from the repository root:
+#   python control_strategies/mpc/batch_mpc_benchmark.py [n_instances ...]
+
+
+def instances(mpc_controller, n, seed=0):
+    rng = np.random.default_rng(seed)
+    x0 = np.zeros((n, 12))
+    x0[:, 3:5] = rng.uniform(-0.1, 0.1, (n, 2))
+    x0[:, 6:9] = rng.uniform(-0.3, 0.3, (n, 3))
+    tvp = np.tile(mpc_controller.context.tvp.buffer, (n, 1))
+    tvp[:, :12] = x0
+    tvp[:, 26:29] = rng.uniform(-0.3, 0.3, (n, 3))
+    return x0, tvp
+
+
+def loop_step(mpc_controller, x0, tvp):
+    """One make_step per instance, each from the controller's initial guess like a fresh batch."""
+    u_init = np.array(mpc_controller.u0.cat).ravel()
+    u0 = np.zeros((x0.shape[0], u_init.size))
+    for i in range(x0.shape[0]):
+        mpc_controller.u0 = u_init
+        mpc_controller.flags['initial_run'] = False
+        mpc_controller.set_initial_guess()
+        mpc_controller.context.tvp.buffer[:] = tvp[i]
+        u0[i] = np.ravel(mpc_controller.make_step(x0[i].reshape(-1, 1)))
+    mpc_controller.u0 = u_init
+    return u0
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [1, 10, 100, 500]
+    mpc_controller, _, _ = build(MPCContext(), backend='ipopt', warm_start=False)
+    mpc_controller.set_initial_guess()
+    print("%d cores" % os.cpu_count())
+    print("instances | make_step loop ms | map serial ms | map thread ms | per instance ms | max |du|")
+    for n in sizes:
+        x0, tvp = instances(mpc_controller, n)
+        start = time.perf_counter()
+        u_loop = loop_step(mpc_controller, x0, tvp)
+        t_loop = time.perf_counter() - start
+        times = {}
+        for parallelization in ('serial', 'thread'):
+            batch = BatchMPC(mpc_controller, n, parallelization)
+            u_batch = batch.make_step(x0, tvp)
+            times[parallelization] = batch.t_wall
+        print("%9d | %17.1f | %13.1f | %13.1f | %15.2f | %.1e" % (
+            n, 1e3*t_loop, 1e3*times['serial'], 1e3*times['thread'], 1e3*min(times.values())/n,
+            np.max(np.abs(u_batch - u_loop))))
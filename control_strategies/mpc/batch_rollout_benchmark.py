@@ -0,0 +1,65 @@
+import sys
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+from global_vars_mpc import global_simulator
+from batch_rollout import BatchRollout
+
+# Rollouts/sec of the batched NumPy integrator vs. do_mpc's IDAS simulator (12_states_nonlin_sim.py)
+# on random hover-like initial states and constant inputs, plus the deviation between both.
+# Run from the repository root: python control_strategies/mpc/batch_rollout_benchmark.py [n_steps]
+
+m = 2.0
+g = 9.81
+
+
+def sample(n, rng):
+    x0 = np.zeros((n, 12))
+    x0[:, 3:5] = rng.uniform(-0.2, 0.2, (n, 2))    # roll, pitch
+    x0[:, 6:9] = rng.uniform(-0.5, 0.5, (n, 3))    # dpos
+    x0[:, 9:12] = rng.uniform(-0.2, 0.2, (n, 3))   # dtheta
+    u = np.empty((n, 8))
+    u[:, 0:4] = m*g/4*rng.uniform(0.8, 1.2, (n, 4))
+    u[:, 4:8] = rng.uniform(-0.2, 0.2, (n, 4))
+    return x0, u
+
+
+def idas_rollouts(x0, u, n_steps):
+    with open("control_strategies/mpc/12_states_nonlin_sim.py") as f:
+        exec(f.read(), {})
+    simulator = global_simulator.sim
+    traj = np.empty((x0.shape[0], n_steps + 1, 12))
+    for r in range(x0.shape[0]):
+        simulator.reset_history()
+        simulator.x0 = x0[r]
+        simulator.set_initial_guess()
+        traj[r, 0] = x0[r]
+        for i in range(n_steps):
+            traj[r, i+1] = np.array(simulator.make_step(u[r].reshape(8, 1))).ravel()
+    return traj
+
+
+if __name__ == '__main__':
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    rng = np.random.default_rng(0)
+
+    n_idas = 20
+    x0, u = sample(n_idas, rng)
+    start = time.perf_counter()
+    reference = idas_rollouts(x0, u, n_steps)
+    idas_rate = n_idas/(time.perf_counter() - start)
+    print("IDAS simulator      %10.1f rollouts/s" % idas_rate)
+
+    for method in ('rk4', 'dopri5'):
+        engine = BatchRollout(method=method)
+        error = np.abs(engine.rollout(x0, u, n_steps) - reference).max()
+        print("%-6s max |x - x_idas| over %d rollouts: %.2e" % (method, n_idas, error))
+        for n in (1, 100, 1000, 10000):
+            xb, ub = sample(n, rng)
+            start = time.perf_counter()
+            engine.rollout(xb, ub, n_steps)
+            rate = n/(time.perf_counter() - start)
+            print("%-6s N=%-6d %10.1f rollouts/s (%.0fx IDAS)" % (method, n, rate, rate/idas_rate))
@@ -0,0 +1,81 @@
+import subprocess
+import time
+
+import numpy as np
+
+import global_vars_mpc
+from global_vars_mpc import default_context
+from global_vars_mpc import mpc_options
+
+# Shared setup for the benchmark scripts: build controller + nonlinear simulator with a given set of
+# mpc_options and run the closed loop of mpc_test_script.py without printing or plotting.
+# Paths are relative to the repository root, like in the other mpc scripts.
+
+dt = .04
+
+
+def read_script(path, revision=None):
+    """Source of a script of the working tree, or as of a git revision."""
+    if revision is None:
+        with open(path) as f:
+            return f.read()
+    return subprocess.run(['git', 'show', revision + ':' + path], capture_output=True, text=True, check=True).stdout
+
+
+def build(context=None, revision=None, **options):
+    """Exec the controller and simulator scripts with mpc_options overridden by options.
+
+    The overrides only hold while the scripts run, mpc_options is restored afterwards so that one
+    build does not change the next. The pair registers with context (default_context if None); pass
+    a fresh MPCContext to keep several pairs with their own tvp data side by side. With revision the
+    scripts are taken from that git revision, the modules they import still come from the working
+    tree. Returns controller, simulator and estimator, the context is reachable as controller.context.
+    """
+    for name in options:
+        if not hasattr(mpc_options, name):
+            raise ValueError("unknown mpc option " + name)
+    previous = {name: getattr(mpc_options, name) for name in options}
+    context = context if context is not None else default_context
+    context.tvp.x = global_vars_mpc.x0
+    context.tvp.u = global_vars_mpc.u0
+    context.tvp.drone_accel = global_vars_mpc.drone_acceleration
+    try:
+        for name, value in options.items():
+            setattr(mpc_options, name, value)
+        exec(read_script("control_strategies/mpc/12_states_linear_controller.py", revision), {'mpc_context': context})
+        exec(read_script("control_strategies/mpc/12_states_nonlin_sim.py", revision), {'mpc_context': context})
+    finally:
+        for name, value in previous.items():
+            setattr(mpc_options, name, value)
+    context.controller.context = context
+    return context.controller, context.sim, context.est
+
+
+def closed_loop_latency(mpc_controller, simulator, estimator, n_steps, target_velocity):
+    """Per-step make_step wall times (s) of an n_steps velocity tracking run from rest."""
+    tvp = mpc_controller.context.tvp
+    tvp.target_velocity = target_velocity
+    mpc_controller.set_initial_guess()
+    simulator.set_initial_guess()
+    x0 = np.zeros((12, 1))
+    last_x0_dot = np.zeros((6, 1))
+    latency = np.zeros(n_steps)
+    for i in range(n_steps):
+        start = time.perf_counter()
+        u0 = mpc_controller.make_step(x0)
+        latency[i] = time.perf_counter() - start
+
+        x0 = estimator.make_step(simulator.make_step(u0))
+        tvp.x = x0
+        tvp.u = u0
+        np.subtract(x0[6:12], last_x0_dot, out=tvp.drone_accel)
+        tvp.drone_accel /= dt
+        last_x0_dot[:] = x0[6:12]
+    return latency
+
+
+def latency_summary(name, latency):
+    # the first step includes the solver's cold start, report it separately
+    return "%-12s first step %.1f ms | per step mean %.1f ms, median %.1f ms, p95 %.1f ms, max %.1f ms" % (
+        name, 1e3*latency[0], 1e3*latency[1:].mean(), 1e3*np.median(latency[1:]),
+        1e3*np.percentile(latency[1:], 95), 1e3*latency[1:].max())
@@ -0,0 +1,231 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import casadi
+import do_mpc
+
+from closed_loop import build, dt
+from global_vars_mpc import MPCContext
+from trajectories import circle
+
+# Reproducible closed loop scenarios for the velocity tracking MPC: controller plus nonlinear simulator,
+# headless, from rest at hover. Every scenario records solve time percentiles, solver iterations, the
+# velocity tracking RMSE against its reference and input bound violations into a JSON report; with
+# --baseline the report is diffed against a stored one and regressions set the exit code.
+# Run from the repository root:
+#   python control_strategies/mpc/closed_loop_benchmark.py [--backend ipopt|qp|rti] [--out report.json]
+#       [--save-baseline control_strategies/mpc/closed_loop_baseline.json | --baseline ...] [scenario ...]
+
+# the targets of mpc_test_script.py
+desired_velocities = np.array([[0.01, 0.0, 0.0], [0.2, 0.0, 0.0], [0.2, 0.2, 0.0]])
+
+
+def constant(velocity):
+    velocity = np.asarray(velocity, dtype=float)
+    return lambda t: np.broadcast_to(velocity, (len(t), 3))
+
+
+def step(velocity, t_step):
+    velocity = np.asarray(velocity, dtype=float)
+    return lambda t: (t[:, None] >= t_step)*velocity
+
+
+def circle_velocity(radius, period):
+    traj = circle(radius, period)
+    return lambda t: traj.sample(t)[1]
+
+
+# name -> (target velocity as a vectorized function of time, number of steps, preview the reference)
+scenarios = {
+    'hover': (constant([0.0, 0.0, 0.0]), 40, False),
+    'step_velocity': (step([0.5, 0.0, 0.0], 0.4), 60, False),
+    'desired_velocity_0': (constant(desired_velocities[0]), 40, False),
+    'desired_velocity_1': (constant(desired_velocities[1]), 40, False),
+    'desired_velocity_2': (constant(desired_velocities[2]), 40, False),
+    'circle': (circle_velocity(1.0, 12.0), 150, True),
+}
+
+# metric -> (relative tolerance, absolute tolerance) before an increase counts as a regression
+regression_tolerance = {
+    'solve_ms_p50': (0.25, 0.5),
+    'solve_ms_p95': (0.25, 1.0),
+    'feedback_ms_p50': (0.25, 0.2),
+    'iterations_mean': (0.1, 0.5),
+    'tracking_rmse': (0.1, 1e-3),
+    'bound_violations': (0.0, 0.0),
+    'solver_failures': (0.0, 0.0),
+    'diverged': (0.0, 0.0),
+}
+
+
+def input_bounds(mpc_controller):
+    if hasattr(mpc_controller, '_u_lb'):
+        return np.array(mpc_controller._u_lb.cat).ravel(), np.array(mpc_controller._u_ub.cat).ravel()
+    return mpc_controller.bounds.vector('lower', '_u'), mpc_controller.bounds.vector('upper', '_u')
+
+
+def percentile(values, q):
+    # a scenario that diverges at its first step leaves nothing to summarize, report NaN instead of raising
+    return np.percentile(values, q) if len(values) else np.nan
+
+
+def run_scenario(name, backend='ipopt', history=None, **options):
+    """Run one scenario on a freshly built controller/simulator pair, returns its metrics.
+
+    A dict passed as history receives the simulated states 'x' and inputs 'u', one row per step.
+    """
+    target, n_steps, preview = scenarios[name]
+    mpc_controller, simulator, estimator = build(MPCContext(), backend=backend, **options)
+    context = mpc_controller.context
+    tvp = context.tvp
+    n_stages = context.reference.n_stages
+    if preview:
+        context.reference.preview('target_velocity', lambda t_now: target(t_now + dt*np.arange(n_stages)))
+    u_lb, u_ub = input_bounds(mpc_controller)
+
+    mpc_controller.set_initial_guess()
+    simulator.set_initial_guess()
+    x0 = np.zeros((12, 1))
+    last_x0_dot = np.zeros((6, 1))
+    solve_time = np.zeros(n_steps)
+    iterations = []
+    failures = 0
+    violation = np.zeros(n_steps)
+    velocity_error = np.zeros((n_steps, 3))
+    for i in range(n_steps):
+        t_now = i*dt
+        tvp.target_velocity = target(np.array([t_now]))[0]
+        start = time.perf_counter()
+        u0 = mpc_controller.make_step(x0)
+        solve_time[i] = time.perf_counter() - start
+        stats = mpc_controller.solver_stats
+        if stats.get('iter_count', -1) >= 0:
+            iterations.append(stats['iter_count'])
+        failures += not stats.get('success', True)
+        u = np.array(u0, dtype=float).ravel()
+        violation[i] = max(0.0, np.max(u_lb - u), np.max(u - u_ub))
+
+        try:
+            x0 = estimator.make_step(simulator.make_step(u0))
+        except RuntimeError:
+            # the integrator gives up once the state has diverged far enough, stop the scenario there
+            n_done = i
+            break
+        tvp.x = x0
+        tvp.u = u0
+        np.subtract(x0[6:12], last_x0_dot, out=tvp.drone_accel)
+        tvp.drone_accel /= dt
+        last_x0_dot[:] = x0[6:12]
+        velocity_error[i] = np.ravel(x0[6:9]) - target(np.array([t_now + dt]))[0]
+    else:
+        n_done = n_steps
+
+    if history is not None:
+        history['x'] = np.array(simulator.data['_x'])
+        history['u'] = np.array(simulator.data['_u'])
+    solve_ms = 1e3*solve_time[1:n_done + 1]  # the first step includes the cold start, reported separately
+    violation = violation[:n_done + 1]
+    velocity_error = velocity_error[:n_done]
+    phases = {}
+    if hasattr(mpc_controller, 'feedback'):
+        # RTI: latency from the measurement to u0 and the preparation that follows it
+        for phase in ('feedback', 'preparation'):
+            phase_ms = 1e3*mpc_controller.data['t_' + phase].ravel()[1:n_done + 1]
+            phases[phase + '_ms_p50'] = percentile(phase_ms, 50)
+            phases[phase + '_ms_p95'] = percentile(phase_ms, 95)
+    return dict(phases, **{
+        'n_steps': n_steps,
+        'diverged': n_done < n_steps,
+        'completed_steps': n_done,
+        'solve_ms_first': 1e3*solve_time[0],
+        'solve_ms_p50': percentile(solve_ms, 50),
+        'solve_ms_p90': percentile(solve_ms, 90),
+        'solve_ms_p95': percentile(solve_ms, 95),
+        'solve_ms_p99': percentile(solve_ms, 99),
+        'solve_ms_max': percentile(solve_ms, 100),
+        'iterations_mean': np.mean(iterations) if iterations else None,
+        'iterations_max': max(iterations) if iterations else None,
+        'tracking_rmse': np.sqrt(np.mean(np.sum(velocity_error**2, axis=1))) if n_done else np.nan,
+        'tracking_max': percentile(np.linalg.norm(velocity_error, axis=1), 100),
+        'bound_violations': int(np.sum(violation > 1e-6)),
+        'bound_violation_max': violation.max(),
+        'solver_failures': failures,
+    })
+
+
+def run_suite(names=None, backend='ipopt', **options):
+    names = list(scenarios) if not names else names
+    report = {
+        'meta': {'backend': backend, 'options': options, 'dt': dt, 'python': platform.python_version(),
+                 'casadi': casadi.__version__, 'do_mpc': do_mpc.__version__, 'machine': platform.machine()},
+        'scenarios': {},
+    }
+    for name in names:
+        metrics = run_scenario(name, backend, **options)
+        report['scenarios'][name] = {key: None if value is None else float(value) for key, value in metrics.items()}
+    return report
+
+
+def diff_reports(report, baseline, tolerance=regression_tolerance):
+    """(scenario, metric, baseline, current, regressed) for every compared metric of both reports."""
+    rows = []
+    for name, metrics in report['scenarios'].items():
+        if name not in baseline['scenarios']:
+            continue
+        for metric, (rel, abs_tol) in tolerance.items():
+            old, new = baseline['scenarios'][name].get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            rows.append((name, metric, old, new, new > old*(1 + rel) + abs_tol))
+    return rows
+
+
+def format_diff(rows):
+    lines = ["%-20s %-18s %10s %10s %8s" % ("scenario", "metric", "baseline", "current", "change")]
+    for name, metric, old, new, regressed in rows:
+        change = "%+.0f%%" % (100*(new - old)/old) if old else "%+.3g" % (new - old)
+        lines.append("%-20s %-18s %10.4g %10.4g %8s%s" % (name, metric, old, new, change, "  REGRESSION" if regressed else ""))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="closed loop MPC benchmark suite")
+    parser.add_argument('scenarios', nargs='*', help="any of %s, default: all" % ", ".join(scenarios))
+    parser.add_argument('--backend', default='ipopt', choices=('ipopt', 'qp', 'rti'))
+    parser.add_argument('--out', help="write the JSON report here")
+    parser.add_argument('--baseline', help="diff against this report, exit 1 on regressions")
+    parser.add_argument('--save-baseline', help="write the report as the new baseline")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(scenarios)
+    if unknown:
+        parser.error("unknown scenarios: " + ", ".join(sorted(unknown)))
+
+    report = run_suite(args.scenarios, args.backend)
+    for name, metrics in report['scenarios'].items():
+        iterations = "-" if metrics['iterations_mean'] is None else "%.1f" % metrics['iterations_mean']
+        print("%-20s p50 %6.1f ms  p95 %6.1f ms  iter %5s  rmse %.4f m/s  violations %d  failures %d%s" % (
+            name, metrics['solve_ms_p50'], metrics['solve_ms_p95'], iterations, metrics['tracking_rmse'],
+            metrics['bound_violations'], metrics['solver_failures'],
+            "  diverged after %d steps" % metrics['completed_steps'] if metrics['diverged'] else ""))
+        if 'feedback_ms_p50' in metrics:
+            print("%-20s feedback p50 %.2f ms p95 %.2f ms | preparation p50 %.2f ms p95 %.2f ms" % (
+                "", metrics['feedback_ms_p50'], metrics['feedback_ms_p95'],
+                metrics['preparation_ms_p50'], metrics['preparation_ms_p95']))
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta']['backend'] != report['meta']['backend']:
+            sys.exit("baseline was recorded with the %s backend" % baseline['meta']['backend'])
+        rows = diff_reports(report, baseline)
+        print(format_diff(rows))
+        sys.exit(1 if any(row[-1] for row in rows) else 0)
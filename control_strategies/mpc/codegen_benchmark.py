@@ -0,0 +1,21 @@
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+from closed_loop import build, closed_loop_latency, latency_summary, dt
+
+# Per-step make_step latency of the tilt-rotor MPC with IPOPT evaluating the NLP through casadi's
+# virtual machine (interpreted) vs. from the generated shared library (compiled).
+# Run from the repository root: python control_strategies/mpc/codegen_benchmark.py [n_steps]
+
+if __name__ == '__main__':
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    for name, codegen in (("interpreted", False), ("compiled", True)):
+        start = time.time()
+        mpc_controller, simulator, estimator = build(codegen=codegen)
+        print("%-12s setup %.2f s" % (name, time.time() - start))
+        latency = closed_loop_latency(mpc_controller, simulator, estimator, n_steps, [0.2, 0.0, 0.0])
+        print(latency_summary(name, latency))
+    print("t_step budget: %.1f ms" % (1e3*dt))
@@ -0,0 +1,32 @@
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+
+from closed_loop import build
+from closed_loop_benchmark import run_scenario
+from global_vars_mpc import MPCContext
+
+# IPOPT on the Radau collocation of the linearized DAE vs. on the discrete-time model from the exact
+# zero-order hold of the same linearization (mpc_options.discretization): NLP size, solve time and
+# velocity tracking on closed loop scenarios of closed_loop_benchmark.py.
+# Run from the repository root:
+#   python control_strategies/mpc/discretization_benchmark.py [scenario ...]
+
+discretizations = ('collocation', 'zoh')
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or ['hover', 'step_velocity', 'desired_velocity_1']
+    for discretization in discretizations:
+        mpc_controller, _, _ = build(MPCContext(), backend='ipopt', discretization=discretization)
+        print("%-12s %4d variables, %4d constraints" % (discretization, mpc_controller.n_opt_x,
+                                                         mpc_controller.n_opt_lagr))
+    print("%-20s %-12s %7s %7s %6s %12s" % ("scenario", "", "p50 ms", "p95 ms", "iter", "rmse m/s"))
+    for name in names:
+        for discretization in discretizations:
+            metrics = run_scenario(name, 'ipopt', discretization=discretization)
+            print("%-20s %-12s %7.2f %7.2f %6.1f %12.4f%s" % (
+                name, discretization, metrics['solve_ms_p50'], metrics['solve_ms_p95'],
+                metrics['iterations_mean'], metrics['tracking_rmse'],
+                "  diverged after %d steps" % metrics['completed_steps'] if metrics['diverged'] else ""))
@@ -0,0 +1,119 @@
+import functools
+import math
+
+from casadi import *
+
+# Symbolic tilt-rotor dynamics shared by the controller and simulator scripts. dynamics(...) builds
+# the model terms once per parameter set as casadi Functions with common subexpressions eliminated
+# and hands out the cached instance on repeated calls with the same parameters. Calling a Function on
+# the model symbols (or on the tvp entries of the last measurement) gives the expressions the scripts
+# used to assemble inline from their own copies of f_acc, rotBE, T and T_dot.
+# State rows are [pos(3), euler_ang(3), dpos(3), dtheta(3)], inputs [T1..T4, tilt1..tilt4] and the
+# accelerations ddq = [ddpos(3), ddtheta(3)], as in the do_mpc models.
+# Out of scope: 12_states_linear_controller_12alg.py and the obsolete/ playgrounds keep their own copies.
+# The former is a separate model variant (m = 1.8, arm_length = .2286, fifth order series, all 12 states
+# algebraic), the latter are archived; neither is part of the closed loop or imported anywhere.
+
+m = 2.0  # drone_mass
+g = 9.81
+arm_length = .2212
+Ixx = 1.0
+Iyy = 1.0
+Izz = 1.0
+
+
+def trig(trig_order=None):
+    """sin and cos, exact for trig_order None, else their Taylor series up to x**trig_order."""
+    if trig_order is None:
+        return sin, cos
+
+    # the series start from their first term, sum() would start from int 0 and turn SX into MX
+    def sin_taylor(x):
+        return functools.reduce(lambda s, k: s + (-1)**k*x**(2*k+1)/math.factorial(2*k+1),
+                                range(1, (trig_order+1)//2), x)
+
+    def cos_taylor(x):
+        return functools.reduce(lambda s, k: s + (-1)**k*x**(2*k)/math.factorial(2*k),
+                                range(1, trig_order//2 + 1), 1)
+    return sin_taylor, cos_taylor
+
+
+class DroneDynamics:
+    """casadi Functions of the tilt-rotor model for one parameter set, built by dynamics().
+
+    rotBE(euler_ang), rotEB(euler_ang) and T(euler_ang) are 3x3, T_dot(euler_ang, euler_rates) is the
+    time derivative of T. f_acc(u, dtheta, euler_ang) are the body accelerations, euler_ang_vel(euler_ang,
+    dtheta) the euler angle rates, fspatial_acc(x, u, ddq) the spatial accelerations the euler_lagrange
+    equations set ddq to and accelerations(x, u) the ddq solving them. trig_order selects exact sin/cos
+    (None) or their Taylor series; tan is always exact.
+    """
+
+    def __init__(self, m=m, g=g, arm_length=arm_length, Ixx=Ixx, Iyy=Iyy, Izz=Izz, trig_order=None):
+        sin_, cos_ = trig(trig_order)
+        pos = SX.sym('pos', 3)
+        euler_ang = SX.sym('euler_ang', 3)
+        dpos = SX.sym('dpos', 3)
+        dtheta = SX.sym('dtheta', 3)
+        u = SX.sym('u', 8)
+        ddq = SX.sym('ddq', 6)
+        x = vertcat(pos, euler_ang, dpos, dtheta)
+
+        r, p, y = euler_ang[0], euler_ang[1], euler_ang[2]
+        rotBE = vertcat(
+            horzcat(cos_(y)*cos_(p), sin_(y)*cos_(p), -sin_(p)),
+            horzcat(cos_(y)*sin_(p)*sin_(r) - sin_(y)*cos_(r), sin_(y)*sin_(p)*sin_(r) + cos_(y)*cos_(r), cos_(p)*sin_(r)),
+            horzcat(cos_(y)*sin_(p)*cos_(r) + sin_(y)*sin_(r), sin_(y)*sin_(p)*cos_(r) - cos_(y)*sin_(r), cos_(p)*cos_(r)))
+        self.rotBE = Function('rotBE', [euler_ang], [cse(rotBE)], ['euler_ang'], ['rotBE'])
+        self.rotEB = Function('rotEB', [euler_ang], [cse(rotBE.T)], ['euler_ang'], ['rotEB'])
+
+        T = vertcat(
+            horzcat(1, sin_(r)*tan(p), cos_(r)*tan(p)),
+            horzcat(0, cos_(r), -sin_(r)),
+            horzcat(0, sin_(r)/cos_(p), cos_(r)/cos_(p)))
+        self.T = Function('T', [euler_ang], [cse(T)], ['euler_ang'], ['T'])
+
+        euler_rates = SX.sym('euler_rates', 3)
+        dr, dp = euler_rates[0], euler_rates[1]
+        T_dot = vertcat(
+            horzcat(0, cos_(r)*dr*tan(p) + dp*sin_(r)/cos_(p)**2, -sin_(r)*dr*tan(p) + dp*cos_(r)/cos_(p)**2),
+            horzcat(0, -dr*sin_(r), -dr*cos_(r)),
+            horzcat(0, cos_(r)*dr/cos_(p) + tan(p)*dp*sin_(r)/cos_(p), sin_(r)*dr/cos_(p) + tan(p)*dp*cos_(r)/cos_(p)))
+        self.T_dot = Function('T_dot', [euler_ang, euler_rates], [cse(T_dot)], ['euler_ang', 'euler_rates'], ['T_dot'])
+
+        T1, T2, T3, T4 = u[0], u[1], u[2], u[3]
+        tilt1, tilt2, tilt3, tilt4 = u[4], u[5], u[6], u[7]
+        droll, dpitch, dyaw = dtheta[0], dtheta[1], dtheta[2]
+        f_acc = vertcat(
+            (T2*sin_(tilt2) - T4*sin_(tilt4) - m*g*sin_(p))/m,
+            (T1*sin_(tilt1) - T3*sin_(tilt3) - m*g*sin_(r))/m,
+            (T1*cos_(tilt1) + T2*cos_(tilt2) + T3*cos_(tilt3) + T4*cos_(tilt4) - m*g*cos_(r)*cos_(p))/m,
+            (T2*cos_(tilt2)*arm_length - T4*cos_(tilt4)*arm_length + (Iyy*dpitch*dyaw + Izz*dpitch*dyaw))/Ixx,
+            (T1*cos_(tilt1)*arm_length - T3*cos_(tilt3)*arm_length + (-Ixx*droll*dyaw + Izz*droll*dyaw))/Iyy,
+            (T1*sin_(tilt1)*arm_length + T2*sin_(tilt2)*arm_length + T3*sin_(tilt3)*arm_length
+             + T4*sin_(tilt4)*arm_length + (Ixx*droll*dpitch - Iyy*droll*dpitch))/Izz)
+        self.f_acc = Function('f_acc', [u, dtheta, euler_ang], [cse(f_acc)], ['u', 'dtheta', 'euler_ang'], ['f_acc'])
+
+        euler_ang_vel = vertcat(
+            droll + dyaw*cos_(r)*tan(p) + dpitch*sin_(r)*tan(p),
+            dpitch*cos_(r) - dyaw*sin_(r),
+            dyaw*cos_(r)/cos_(p) + dpitch*sin_(r)/cos_(p))
+        self.euler_ang_vel = Function('euler_ang_vel', [euler_ang, dtheta], [cse(euler_ang_vel)],
+                                      ['euler_ang', 'dtheta'], ['euler_ang_vel'])
+
+        alpha_euler = mtimes(T, ddq[3:6]) + mtimes(self.T_dot(euler_ang, euler_ang_vel), dtheta)
+        w = skew(euler_ang_vel)
+        fspatial_linear_acc = (mtimes(rotBE.T, f_acc[0:3]) + 2*mtimes(w, dpos) + mtimes(skew(alpha_euler), pos)
+                               + mtimes(w, mtimes(w, pos)))
+        fspatial_acc = vertcat(fspatial_linear_acc, f_acc[3:6])
+        self.fspatial_acc = Function('fspatial_acc', [x, u, ddq], [cse(fspatial_acc)], ['x', 'u', 'ddq'], ['fspatial_acc'])
+
+        # fspatial_acc is affine in ddq (through alpha_euler), the model's accelerations solve ddq = fspatial_acc
+        residual = ddq - fspatial_acc
+        ddq_explicit = -solve(jacobian(residual, ddq), substitute(residual, ddq, DM.zeros(6)))
+        self.accelerations = Function('accelerations', [x, u], [cse(ddq_explicit)], ['x', 'u'], ['ddq'])
+
+
+@functools.lru_cache(maxsize=None)
+def dynamics(m=m, g=g, arm_length=arm_length, Ixx=Ixx, Iyy=Iyy, Izz=Izz, trig_order=None):
+    """The DroneDynamics of a parameter set, built on the first call and shared afterwards."""
+    return DroneDynamics(m, g, arm_length, Ixx, Iyy, Izz, trig_order)
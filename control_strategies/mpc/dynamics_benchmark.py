@@ -0,0 +1,51 @@
+import argparse
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from casadi import Function
+
+from closed_loop import build
+from global_vars_mpc import MPCContext
+
+# Model build time and expression sizes (instructions of the casadi functions) of the controller and simulator models and of the controller's
+# collocation NLP, plus the NLP function evaluation times of a few solves. Builds without the solver cache
+# so do_mpc constructs the NLP from the model expressions every time. --rev takes the controller and simulator
+# scripts from a git revision, e.g. the one before drone_dynamics.py replaced their inline copies of the model:
+#   --rev $(git log -1 --format=%H --diff-filter=A -- control_strategies/mpc/drone_dynamics.py)^
+# Run from the repository root: python control_strategies/mpc/dynamics_benchmark.py [--rev REV] [n_builds]
+
+
+def n_instructions(inputs, outputs):
+    return Function('f', inputs, outputs).n_instructions()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="model and NLP size of the controller and simulator scripts")
+    parser.add_argument('n_builds', nargs='?', type=int, default=3)
+    parser.add_argument('--rev', help="git revision of the scripts, default: the working tree")
+    args = parser.parse_args()
+    build_time = []
+    for _ in range(args.n_builds):
+        start = time.perf_counter()
+        mpc_controller, simulator, estimator = build(MPCContext(), args.rev, backend='ipopt', use_cache=False,
+                                                     codegen=False)
+        build_time.append(time.perf_counter() - start)
+    print("controller + simulator build: %.3f s (best of %d)" % (min(build_time), args.n_builds))
+    for name, model in (('controller model', mpc_controller.model), ('simulator model', simulator.model)):
+        print("%-18s rhs %6d instructions, alg %6d instructions" % (
+            name, model._rhs_fun.n_instructions(), model._alg_fun.n_instructions()))
+    nlp = mpc_controller.nlp
+    print("%-18s f %6d instructions, g %8d instructions" % (
+        'controller NLP', n_instructions([nlp['x'], nlp['p']], [nlp['f']]), n_instructions([nlp['x'], nlp['p']], [nlp['g']])))
+
+    mpc_controller.context.tvp.target_velocity = [0.2, 0.0, 0.0]
+    mpc_controller.set_initial_guess()
+    x0 = np.zeros((12, 1))
+    for _ in range(5):
+        mpc_controller.make_step(x0)
+    stats = mpc_controller.solver_stats
+    for key in ('nlp_f', 'nlp_g', 'nlp_grad_f', 'nlp_jac_g', 'nlp_hess_l'):
+        if stats.get('n_call_' + key):
+            print("%-12s %8.1f us per call" % (key, 1e6*stats['t_wall_' + key]/stats['n_call_' + key]))
@@ -0,0 +1,163 @@
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
+
+# Explicit MPC for the velocity tracking controller of 12_states_linear_controller.py: solve the online
+# MPC offline on a quasi random sample of the state/target space and answer online queries from a k-d
+# tree over the samples. The table is a function of theta = [x0 (12), target_velocity (3)]; the
+# remaining inputs of the online controller are held at the hover operating point the closed loop
+# starts from (previous input u0, zero acceleration), the bounds are the fixed ones of the script.
+# The table is therefore not a drop-in replacement for the online controller: it ignores the actual previous
+# input and last acceleration, and at 4096 samples its tilt is off by 0.10 rad on average (p95 0.33 rad).
+# Run from the repository root: python control_strategies/mpc/explicit_mpc.py [n_samples] [n_test]
+# (powers of two keep the Sobol sequences balanced)
+
+n_theta = 15
+
+# sampled entries of theta and their ranges, all other entries stay at zero
+sample_ranges = {
+    3: (-0.2, 0.2),  # roll
+    4: (-0.2, 0.2),  # pitch
+    6: (-0.5, 0.5),  # dx
+    7: (-0.5, 0.5),  # dy
+    8: (-0.5, 0.5),  # dz
+    12: (-0.5, 0.5),  # target dx
+    13: (-0.5, 0.5),  # target dy
+    14: (-0.5, 0.5),  # target dz
+}
+
+
+def sample_theta(n, ranges=sample_ranges, seed=0):
+    """n points of theta from a scrambled Sobol sequence over ranges."""
+    dims = sorted(ranges)
+    low = np.array([ranges[d][0] for d in dims])
+    high = np.array([ranges[d][1] for d in dims])
+    theta = np.zeros((n, n_theta))
+    theta[:, dims] = qmc.scale(qmc.Sobol(len(dims), seed=seed).random(n), low, high)
+    return theta
+
+
+def solve_online(mpc_controller, theta, u_nominal):
+    """First input of the online MPC at every row of theta, each solved from the same cold start."""
+    tvp = mpc_controller.context.tvp
+    u = np.zeros((len(theta), len(u_nominal)))
+    solve_time = np.zeros(len(theta))
+    for i, point in enumerate(theta):
+        x0 = point[:12].reshape(-1, 1)
+        tvp.x = x0
+        tvp.u = u_nominal
+        tvp.drone_accel = np.zeros((6, 1))
+        tvp.target_velocity = point[12:]
+        mpc_controller.x0 = x0
+        mpc_controller.u0 = u_nominal
+        mpc_controller.set_initial_guess()
+        start = time.perf_counter()
+        u[i] = np.array(mpc_controller.make_step(x0)).ravel()
+        solve_time[i] = time.perf_counter() - start
+    return u, solve_time
+
+
+class ExplicitMPC:
+    """Lookup table u(theta) over sampled solutions of the online MPC.
+
+    theta is [x0, target_velocity] only, the previous input and last acceleration of the online
+    controller are fixed at hover, see the module comment for the resulting error.
+    Queries are scaled to the unit box of the sampled ranges (and clipped to it, the table is only
+    valid inside) and answered by a local affine fit on the k nearest samples, which reproduces the
+    piecewise affine structure of the MPC law between samples. method='idw' uses inverse distance
+    weighting instead, which is cheaper but smooths over the region boundaries.
+    """
+
+    def __init__(self, theta, u, ranges=sample_ranges, k=None, method='affine'):
+        self.dims = np.array(sorted(ranges))
+        self.low = np.array([ranges[d][0] for d in self.dims])
+        self.high = np.array([ranges[d][1] for d in self.dims])
+        self.theta = np.asarray(theta, dtype=float)
+        self.u = np.asarray(u, dtype=float)
+        self.k = k or 2*(len(self.dims) + 1)
+        self.method = method
+        # the tilt inputs sit on their bounds for large parts of the space, keep the fit inside them
+        self.u_min = self.u.min(axis=0)
+        self.u_max = self.u.max(axis=0)
+        self.tree = cKDTree(self._scaled(self.theta))
+        self._S = np.ones((self.k, len(self.dims) + 1))
+
+    def _scaled(self, theta):
+        return np.clip((theta[..., self.dims] - self.low)/(self.high - self.low), 0.0, 1.0)
+
+    def evaluate(self, theta):
+        """Control for one theta (n_theta,), returns (n_u,)."""
+        q = self._scaled(np.asarray(theta, dtype=float))
+        dist, idx = self.tree.query(q, self.k)
+        if dist[0] == 0.0:
+            return self.u[idx[0]]
+        if self.method == 'idw':
+            w = 1.0/dist**2
+            return w @ self.u[idx] / w.sum()
+        # affine least squares fit u ~ a + G (s - q) on the neighbours, the offset a is the estimate at q
+        # (normal equations with a small ridge, a factor 2 cheaper than lstsq at this size)
+        S = self._S
+        S[:, 1:] = self.tree.data[idx] - q
+        G = S.T @ S
+        G[np.diag_indices_from(G)] += 1e-9
+        return np.clip(np.linalg.solve(G, S.T @ self.u[idx])[0], self.u_min, self.u_max)
+
+    def make_step(self, x0, target_velocity):
+        # the table has no tvp data of its own, the caller passes the target the online controller reads from it
+        theta = np.concatenate((np.asarray(x0, dtype=float).ravel(), np.asarray(target_velocity, dtype=float).ravel()))
+        return self.evaluate(theta).reshape(-1, 1)
+
+    def save(self, path):
+        np.savez(path, theta=self.theta, u=self.u, dims=self.dims, low=self.low, high=self.high,
+                 k=self.k, method=self.method)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        ranges = {int(d): (lo, hi) for d, lo, hi in zip(data['dims'], data['low'], data['high'])}
+        return cls(data['theta'], data['u'], ranges, int(data['k']), str(data['method']))
+
+
+def error_report(table, theta, u_online):
+    """Error of the table against online solutions at theta, per input group, plus lookup latency."""
+    start = time.perf_counter()
+    u_table = np.array([table.evaluate(point) for point in theta])
+    lookup = (time.perf_counter() - start)/len(theta)
+    err = np.abs(u_table - u_online)
+    lines = ["lookup %.1f us per query (%s, k=%d, %d samples)" % (1e6*lookup, table.method, table.k, len(table.theta))]
+    for name, cols in (('thrust [N]', slice(0, 4)), ('tilt [rad]', slice(4, 8))):
+        e = err[:, cols]
+        lines.append("%-11s mean %.4f  median %.4f  p95 %.4f  max %.4f" % (
+            name, e.mean(), np.median(e), np.percentile(e, 95), e.max()))
+    return "\n".join(lines), u_table
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('Agg')
+    from closed_loop import build
+
+    n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    n_test = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    mpc_controller, _, _ = build(backend='ipopt')
+    u_nominal = np.array(mpc_controller.u0.cat).reshape(-1, 1)
+
+    theta = sample_theta(n_samples)
+    start = time.perf_counter()
+    u, solve_time = solve_online(mpc_controller, theta, u_nominal)
+    print("offline: %d IPOPT solves in %.1f s (%.1f ms each)" % (n_samples, time.perf_counter() - start, 1e3*solve_time.mean()))
+
+    table = ExplicitMPC(theta, u)
+    table.save("control_strategies/mpc/explicit_mpc_table.npz")
+
+    # test points off the sample set, compared against fresh online solutions
+    theta_test = sample_theta(n_test, seed=1)
+    u_test, test_time = solve_online(mpc_controller, theta_test, u_nominal)
+    print("online IPOPT: %.1f ms per solve" % (1e3*test_time.mean()))
+    print("the table ignores the previous input and last acceleration, it is not a drop-in replacement")
+    for method in ('affine', 'idw'):
+        table.method = method
+        print(error_report(table, theta_test, u_test)[0])
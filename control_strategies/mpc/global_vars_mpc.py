@@ -3,8 +3,37 @@ import numpy as np
 m = .2286
 g = 9.81
 
+class _TVPField:
+    # column view into TVPData.buffer, assigning to it copies in place
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        return self if obj is None else obj._views[self.name]
+
+    def __set__(self, obj, value):
+        obj._views[self.name][:, 0] = np.ravel(value)
+
+
 class TVPData:
+    # Latest measurement and target handed to the tvp functions. The fields are views into one
+    # preallocated buffer laid out like one stage of the controller's tvp struct (last_state, last_input,
+    # last_acc, target_velocity), so tvp.x = x0 copies in place and a tvp function can write every
+    # stage of its template from the buffer at once.
+    __slots__ = ('buffer', '_views')
+    fields = (('x', 12), ('u', 8), ('drone_accel', 6), ('target_velocity', 3))
+    x = _TVPField()
+    u = _TVPField()
+    drone_accel = _TVPField()
+    target_velocity = _TVPField()
+
     def __init__(self, x, u, drone_accel, target_velocity):
+        self.buffer = np.zeros(sum(size for _, size in self.fields))
+        self._views = {}
+        offset = 0
+        for name, size in self.fields:
+            self._views[name] = self.buffer[offset:offset+size].reshape(size, 1)
+            offset += size
         self.x = x
         self.u = u
         self.drone_accel = drone_accel
@@ -19,15 +48,54 @@ target_velocity = np.array([0.01, 0.0, 0.0])
 tvp = TVPData(x0, u0, drone_acceleration, target_velocity)
 
 
-class MPCcont:
-        def __init__(self,controller):
+class MPCContext:
+        # one controller/simulator pair and the tvp data they share. The controller and simulator
+        # scripts register with mpc_context when it is in their exec globals, otherwise with
+        # default_context, so several pairs can be built and stepped in one process.
+        # reference is the controller's HorizonTVP, for per-stage previews over the horizon.
+        __slots__ = ('tvp', 'controller', 'sim', 'est', 'reference')
+
+        def __init__(self, tvp=None, controller=None, sim=None, est=None, reference=None):
+            self.tvp = tvp if tvp is not None else TVPData(x0, u0, drone_acceleration, target_velocity)
             self.controller = controller
-        
-mpc_global_controller = MPCcont(None)
-class MPCsim:
-        def __init__(self,sim, est):
             self.sim = sim
             self.est = est
-        
+            self.reference = reference
+
+
+default_context = MPCContext(tvp)
+# the single pair the scripts have always used
+mpc_global_controller = default_context
+global_simulator = default_context
+
+
+class MPCOptions:
+        def __init__(self, use_cache=True, codegen=False, backend='ipopt', warm_start=True, profile=None,
+                     n_horizon=4, qp_formulation='auto', discretization='collocation',
+                     linearization='symbolic', trig_order=3):
+            # reuse the serialized IPOPT solver from mpc_cache.cache_dir when the model is unchanged
+            self.use_cache = use_cache
+            # evaluate the NLP functions from generated and compiled C instead of casadi's virtual machine
+            self.codegen = codegen
+            # 'ipopt': do_mpc collocation NLP, 'qp': linear_qp_controller.LinearQPController,
+            # 'rti': rti_controller.RTIController (one SQP iteration per step on the nonlinear model)
+            self.backend = backend
+            # seed IPOPT with the previous solution shifted by one stage (warm_start.WarmStart)
+            self.warm_start = warm_start
+            # path of a Chrome trace of the controller loop in mpc_test_script.py (mpc_profiler.StepProfiler)
+            self.profile = profile
+            # prediction horizon of every backend in steps of t_step
+            self.n_horizon = n_horizon
+            # 'sparse', 'condensed' or 'auto' (by horizon length) QP layout of the qp backend
+            self.qp_formulation = qp_formulation
+            # ipopt backend: 'collocation' of the DAE model, or 'zoh' for a discrete-time model from the exact
+            # zero-order hold of its linearization, recomputed every step (the QP backends are always discrete)
+            self.discretization = discretization
+            # ipopt collocation: 'symbolic' jacobians of the dynamics at the last measurement inside the NLP, or
+            # 'numeric' A, B, C and residual evaluated once per step and passed in as tvp matrices
+            self.linearization = linearization
+            # sin/cos of the controller model: Taylor series up to this order (1, 3, 5, ...) or None for exact
+            self.trig_order = trig_order
+
 
-global_simulator = MPCsim(None,None)
+mpc_options = MPCOptions()
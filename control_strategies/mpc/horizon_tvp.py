@@ -0,0 +1,71 @@
+import numpy as np
+from casadi import DM
+
+# Per-stage time varying parameters for the controllers. HorizonTVP keeps the tvp values of all
+# n_horizon+1 stages in one (n_horizon+1, n_tvp) array laid out like the template's master vector, so
+# filling the template is a single copy instead of one struct assignment per stage and entry. Works with
+# the do_mpc MPC and with LinearQPController, whose templates share the same layout.
+
+
+class HorizonTVP:
+    """tvp function: the latest TVPData in every stage, with optional per-stage references on top.
+
+    preview(name, profile) replaces one tvp entry with a profile over the horizon, e.g. a
+    (n_horizon+1, 3) target velocity preview, or a callable profile(t_now) returning one.
+    set_stages(stages) takes a full (n_horizon+1, n_tvp) array instead; it is used as is until
+    set_stages(None). A model with more tvp entries than TVPData holds, like model_tools.zoh_model,
+    gets the TVPData entries first and fills the rest through previews.
+    """
+
+    def __init__(self, controller, tvp=None):
+        model = controller.model
+        self.template = controller.get_tvp_template()
+        self.n_tvp = model.n_tvp
+        self.n_stages = self.template.master.shape[0]//self.n_tvp
+        self.index = {name: np.array(model.tvp.f[name], dtype=int) for name in model.tvp.keys() if model.tvp.f[name]}
+        self.tvp = tvp
+        self.n_buffer = min(tvp.buffer.size, self.n_tvp) if tvp is not None else 0
+        self.stages = np.zeros((self.n_stages, self.n_tvp))
+        self.fixed_stages = None
+        self.previews = {}
+
+    def preview(self, name, profile):
+        """Per-stage values (n_stages, size) for the tvp entry name, a callable of t_now, or None to clear."""
+        if name not in self.index:
+            raise ValueError("unknown tvp entry " + name)
+        if profile is None:
+            self.previews.pop(name, None)
+        elif callable(profile):
+            self.previews[name] = profile
+        else:
+            self.previews[name] = self._check(name, profile)
+
+    def set_stages(self, stages):
+        if stages is not None:
+            stages = np.asarray(stages, dtype=float)
+            if stages.shape != (self.n_stages, self.n_tvp):
+                raise ValueError("expected stages of shape %s, got %s" % ((self.n_stages, self.n_tvp), stages.shape))
+        self.fixed_stages = stages
+
+    def _check(self, name, profile):
+        profile = np.asarray(profile, dtype=float)
+        shape = (self.n_stages, len(self.index[name]))
+        if profile.shape != shape:
+            raise ValueError("expected a %s preview of shape %s, got %s" % (name, shape, profile.shape))
+        return profile
+
+    def fill(self, stages):
+        """Write (n_stages, n_tvp) stage values into the template in one shot."""
+        # a fresh DM from a list converts faster than a slice assignment from the numpy array
+        self.template.master = DM(stages.ravel().tolist())
+        return self.template
+
+    def __call__(self, t_now):
+        if self.fixed_stages is not None:
+            return self.fill(self.fixed_stages)
+        stages = self.stages
+        if self.tvp is not None:
+            stages[:, :self.n_buffer] = self.tvp.buffer[:self.n_buffer]
+        for name, profile in self.previews.items():
+            stages[:, self.index[name]] = self._check(name, profile(t_now)) if callable(profile) else profile
+        return self.fill(stages)
@@ -0,0 +1,323 @@
+import time
+
+import numpy as np
+from casadi import *
+from casadi.tools import struct_symSX, entry
+
+from model_tools import ZOHDiscretization
+
+
+class QPData:
+    """Minimal stand-in for do_mpc's data object: data['_x'], data['_u'], data['_time'], data['t_wall']."""
+
+    def __init__(self):
+        self.fields = {'_time': [], '_x': [], '_u': [], 't_wall': [], 'success': []}
+
+    def update(self, **values):
+        for key, value in values.items():
+            self.fields.setdefault(key, []).append(np.asarray(value, dtype=float).reshape(1, -1))
+
+    def __getitem__(self, key):
+        if not self.fields[key]:
+            return np.zeros((0, 1))
+        return np.vstack(self.fields[key])
+
+
+class QPBounds:
+    """Accepts do_mpc style bounds['lower', '_u', 'u_th'] = value assignments."""
+
+    def __init__(self, model):
+        self.values = {
+            'lower': {'_x': model.x(-np.inf), '_u': model.u(-np.inf)},
+            'upper': {'_x': model.x(np.inf), '_u': model.u(np.inf)},
+        }
+
+    def __setitem__(self, key, value):
+        side, var_type, name = key
+        if var_type not in ('_x', '_u'):
+            raise ValueError("the QP backend only supports bounds on '_x' and '_u', got " + str(var_type))
+        self.values[side][var_type][name] = value
+
+    def __getitem__(self, key):
+        side, var_type, name = key
+        return self.values[side][var_type][name]
+
+    def vector(self, side, var_type):
+        return np.array(self.values[side][var_type].cat).ravel()
+
+
+class LinearQPController:
+    """Linear MPC on a do_mpc model, solved as a QP instead of a collocated NLP.
+
+    Takes the same configuration calls as do_mpc.controller.MPC (set_param, set_objective, set_rterm,
+    bounds, tvp function, x0/u0) so the controller scripts can switch backends. Every make_step the
+    model is linearized about the measured state and the previous input (the algebraic accelerations
+    are eliminated exactly since the euler_lagrange equations are affine in them), discretized with a
+    zero-order hold over t_step and the resulting convex QP is solved with casadi's qpsol (OSQP by default,
+    with tight tolerances and polishing, see _qpsol_opts). The applied u0 is clipped to the input bounds.
+
+    formulation 'sparse' keeps the states as multiple shooting variables. 'condensed' eliminates them
+    with the discretized dynamics and solves a dense QP in the n_u*n_horizon inputs only, with the
+    active set solver condensed_qpsol (DAQP by default). Condensing costs O(n_horizon**2) per step, so
+    'auto' only condenses up to condensing_horizon stages (see qp_formulation_benchmark.py).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.settings = {'n_horizon': 10, 't_step': 0.04, 'qpsol': 'osqp', 'qpsol_opts': {},
+                         'formulation': 'auto', 'condensing_horizon': 10, 'condensed_qpsol': 'daqp'}
+        self.bounds = QPBounds(model)
+        self.rterm_factor = model.u(0)
+        self.lterm_fun = None
+        self.mterm_fun = None
+        self.tvp_fun = None
+        self.data = QPData()
+        self.x0 = np.zeros(model.n_x)
+        self.u0 = np.zeros(model.n_u)
+        self.z0 = np.zeros(model.n_z)
+        self.t0 = 0.0
+        self.solver_stats = {}
+        self.flags = {'setup': False}
+
+    @property
+    def n_horizon(self):
+        return self.settings['n_horizon']
+
+    @property
+    def t_step(self):
+        return self.settings['t_step']
+
+    def set_param(self, **kwargs):
+        # collocation, robustness and nlpsol options of the do_mpc configuration do not apply to the QP
+        for key in ('n_horizon', 't_step', 'qpsol', 'qpsol_opts', 'formulation', 'condensing_horizon', 'condensed_qpsol'):
+            if key in kwargs:
+                self.settings[key] = kwargs[key]
+
+    def set_objective(self, mterm=None, lterm=None):
+        model = self.model
+        if lterm is None:
+            lterm = DM(0)
+        if mterm is None:
+            mterm = DM(0)
+        if depends_on(lterm, model.z.cat):
+            raise ValueError("the QP backend does not support a stage cost depending on algebraic states")
+        self.lterm_fun = Function('lterm', [model.x, model.u, model.tvp, model.p], [lterm])
+        self.mterm_fun = Function('mterm', [model.x, model.tvp, model.p], [mterm])
+
+    def set_rterm(self, **kwargs):
+        for name, value in kwargs.items():
+            self.rterm_factor[name] = value
+
+    def get_tvp_template(self):
+        return struct_symSX([entry('_tvp', repeat=self.n_horizon+1, struct=self.model.tvp)])(0)
+
+    def set_tvp_fun(self, tvp_fun):
+        self.tvp_fun = tvp_fun
+
+    def set_initial_guess(self):
+        self.u_prev = np.array(self.u0, dtype=float).reshape(-1)
+        self.w_guess = None
+
+    @property
+    def condensed(self):
+        formulation = self.settings['formulation']
+        if formulation not in ('auto', 'sparse', 'condensed'):
+            raise ValueError("formulation must be 'auto', 'sparse' or 'condensed', got " + str(formulation))
+        if formulation == 'auto':
+            return self.n_horizon <= self.settings['condensing_horizon']
+        return formulation == 'condensed'
+
+    def _qpsol_opts(self, qpsol):
+        opts = {'error_on_fail': False}
+        if qpsol == 'osqp':
+            # u0 is applied as is: at its default eps of 1e-3 OSQP's u0 is off by up to 0.2 here, polishing
+            # (with enough refinement for the longer horizons) recovers the exact active set solution
+            opts['osqp'] = {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6, 'polish': True,
+                            'polish_refine_iter': 10}
+        elif qpsol == 'qpoases':
+            opts['printLevel'] = 'none'
+        opts.update(self.settings['qpsol_opts'])
+        return opts
+
+    def _build_qp(self):
+        if self.condensed:
+            self._build_condensed_qp()
+        else:
+            self._build_sparse_qp()
+
+    def _build_sparse_qp(self):
+        model = self.model
+        n_x, n_u, n_tvp, n_p = model.n_x, model.n_u, model.n_tvp, model.n_p
+        N = self.n_horizon
+
+        X = SX.sym('X', n_x, N)
+        U = SX.sym('U', n_u, N)
+        x_init = SX.sym('x_init', n_x)
+        u_prev = SX.sym('u_prev', n_u)
+        Ad = SX.sym('Ad', n_x, n_x)
+        Bd = SX.sym('Bd', n_x, n_u)
+        dd = SX.sym('dd', n_x)
+        tvp = SX.sym('tvp', n_tvp, N+1)
+        p = SX.sym('p', n_p)
+
+        rterm = DM(self.rterm_factor.cat)
+        J = 0
+        g = []
+        x_k = x_init
+        u_last = u_prev
+        for k in range(N):
+            u_k = U[:, k]
+            J += self.lterm_fun(x_k, u_k, tvp[:, k], p)
+            J += sum1(rterm*(u_k - u_last)**2)
+            g.append(X[:, k] - (mtimes(Ad, x_k) + mtimes(Bd, u_k) + dd))
+            x_k = X[:, k]
+            u_last = u_k
+        J += self.mterm_fun(x_k, tvp[:, N], p)
+
+        w = vertcat(vec(X), vec(U))
+        params = vertcat(x_init, u_prev, vec(Ad), vec(Bd), dd, vec(tvp), p)
+        if not is_quadratic(J, w):
+            raise ValueError("the objective is not quadratic in the states and inputs")
+        qp = {'x': w, 'f': J, 'g': vertcat(*g), 'p': params}
+        self.S = qpsol('S', self.settings['qpsol'], qp, self._qpsol_opts(self.settings['qpsol']))
+
+        self.n_g = n_x*N
+        lb_x, ub_x = self.bounds.vector('lower', '_x'), self.bounds.vector('upper', '_x')
+        lb_u, ub_u = self.bounds.vector('lower', '_u'), self.bounds.vector('upper', '_u')
+        self.lbw = np.concatenate([np.tile(lb_x, N), np.tile(lb_u, N)])
+        self.ubw = np.concatenate([np.tile(ub_x, N), np.tile(ub_u, N)])
+        self.u_index = n_x*N
+
+    def _build_condensed_qp(self):
+        model = self.model
+        n_x, n_u, n_tvp, n_p = model.n_x, model.n_u, model.n_tvp, model.n_p
+        N = self.n_horizon
+
+        # the objective is quadratic, so its Hessian and its gradient at zero describe each stage exactly
+        x = SX.sym('x', n_x)
+        u = SX.sym('u', n_u)
+        tvp_k = SX.sym('tvp', n_tvp)
+        p_k = SX.sym('p', n_p)
+        l = self.lterm_fun(x, u, tvp_k, p_k)
+        if not is_quadratic(l, vertcat(x, u)):
+            raise ValueError("the objective is not quadratic in the states and inputs")
+        H_l, g_l = hessian(l, vertcat(x, u))
+        H_l, g_l = substitute([H_l, g_l], [x, u], [SX.zeros(n_x), SX.zeros(n_u)])
+        stage_cost = Function('stage_cost', [tvp_k, p_k], [H_l, g_l])
+        H_m, g_m = hessian(self.mterm_fun(x, tvp_k, p_k), x)
+        terminal_cost = Function('terminal_cost', [tvp_k, p_k], substitute([H_m, g_m], [x], [SX.zeros(n_x)]))
+
+        x_init = MX.sym('x_init', n_x)
+        u_prev = MX.sym('u_prev', n_u)
+        Ad = MX.sym('Ad', n_x, n_x)
+        Bd = MX.sym('Bd', n_x, n_u)
+        dd = MX.sym('dd', n_x)
+        tvp = MX.sym('tvp', n_tvp, N+1)
+        p = MX.sym('p', n_p)
+
+        # predicted states x_{k+1} = G[k] U + c[k] with U = [u_0, ..., u_{N-1}], G[k] is zero right of u_k
+        G, c = [], []
+        G_k, c_k = MX(n_x, 0), x_init
+        for k in range(N):
+            G_k = horzcat(mtimes(Ad, G_k), Bd)
+            c_k = mtimes(Ad, c_k) + dd
+            G.append(horzcat(G_k, MX(n_x, (N-k-1)*n_u)))
+            c.append(c_k)
+        stages = [stage_cost(tvp[:, k], p) for k in range(N)] + [terminal_cost(tvp[:, N], p)]
+        E = [DM.eye(N*n_u)[k*n_u:(k+1)*n_u, :] for k in range(N)]
+
+        # sum_k rterm*(u_k - u_{k-1})**2 with u_{-1} = u_prev: block tridiagonal Hessian, u_prev in the gradient
+        rterm = np.array(self.rterm_factor.cat, dtype=float).ravel()
+        R = np.zeros((N, n_u, N, n_u))
+        for k in range(N):
+            R[k, :, k, :] = np.diag(2*rterm*(2 if k < N-1 else 1))
+            if k > 0:
+                R[k, :, k-1, :] = R[k-1, :, k, :] = -np.diag(2*rterm)
+        H = DM(R.reshape(N*n_u, N*n_u))
+        g = mtimes(E[0].T, -2*DM(rterm)*u_prev)
+        for k in range(N):
+            H_k, g_k = stages[k]
+            # x_k u_k and u_k u_k terms of stage k, x_0 is the measured state
+            H_xu, H_uu = H_k[:n_x, n_x:], H_k[n_x:, n_x:]
+            g += mtimes(E[k].T, g_k[n_x:])
+            H += mtimes([E[k].T, H_uu, E[k]])
+            if k == 0:
+                g += mtimes(E[0].T, mtimes(H_xu.T, x_init))
+            else:
+                M = mtimes([G[k-1].T, H_xu, E[k]])
+                H += M + M.T
+                g += mtimes(E[k].T, mtimes(H_xu.T, c[k-1]))
+            # x_{k+1} x_{k+1} terms of the next stage or the terminal cost
+            H_next, g_next = stages[k+1]
+            Q, q = H_next[:n_x, :n_x], g_next[:n_x]
+            H += mtimes([G[k].T, Q, G[k]])
+            g += mtimes(G[k].T, mtimes(Q, c[k]) + q)
+
+        # finite state bounds become general constraints on the predicted states
+        lb_x, ub_x = self.bounds.vector('lower', '_x'), self.bounds.vector('upper', '_x')
+        bounded = [int(i) for i in np.nonzero(np.isfinite(lb_x) | np.isfinite(ub_x))[0]]
+        A = vertcat(*[G_row[bounded, :] for G_row in G])
+        c_bounded = vertcat(*[c_k[bounded] for c_k in c])
+        lba = DM(np.tile(lb_x[bounded], N)) - c_bounded
+        uba = DM(np.tile(ub_x[bounded], N)) - c_bounded
+        self.condense = Function('condense', [x_init, u_prev, Ad, Bd, dd, tvp, p], [H, g, A, lba, uba],
+                                 ['x_init', 'u_prev', 'Ad', 'Bd', 'dd', 'tvp', 'p'], ['h', 'g', 'a', 'lba', 'uba'])
+        qpsol = self.settings['condensed_qpsol']
+        self.S = conic('S', qpsol, {'h': H.sparsity(), 'a': A.sparsity()}, self._qpsol_opts(qpsol))
+
+        self.n_g = A.shape[0]
+        lb_u, ub_u = self.bounds.vector('lower', '_u'), self.bounds.vector('upper', '_u')
+        self.lbw = np.tile(lb_u, N)
+        self.ubw = np.tile(ub_u, N)
+        self.u_index = 0
+
+    def setup(self):
+        self.discretize = ZOHDiscretization(self.model, self.t_step)
+        self._build_qp()
+        self.set_initial_guess()
+        self.flags['setup'] = True
+
+    def _shifted(self, w):
+        # previous solution moved one stage forward (last stage repeated) as guess for the next step
+        n_x, n_u, N = self.model.n_x, self.model.n_u, self.n_horizon
+        n_states = self.u_index
+        X = w[:n_states].reshape(-1, n_x)
+        U = w[n_states:].reshape(N, n_u)
+        X[:-1] = X[1:].copy()
+        U[:-1] = U[1:].copy()
+        return w
+
+    def _first_input(self, w):
+        # an iterative QP solver meets the input bounds only up to its tolerance, never apply more than that
+        u0 = w[self.u_index:self.u_index+self.model.n_u]
+        return np.clip(u0, self.lbw[self.u_index:self.u_index+self.model.n_u],
+                       self.ubw[self.u_index:self.u_index+self.model.n_u]).reshape(-1, 1)
+
+    def _stage_tvp(self, tvp_num):
+        # the master vector is stage major, one reshape gives the (n_tvp, n_horizon+1) parameter block
+        return np.array(tvp_num.master).reshape(self.n_horizon+1, self.model.n_tvp).T
+
+    def make_step(self, x0):
+        start = time.time()
+        x0 = np.array(x0, dtype=float).reshape(-1)
+        tvp = self._stage_tvp(self.tvp_fun(self.t0)) if self.tvp_fun is not None else np.zeros((self.model.n_tvp, self.n_horizon+1))
+        p = np.zeros(self.model.n_p)
+
+        Ad, Bd, dd = self.discretize(x0, self.u_prev, tvp[:, 0], p)
+        if self.condensed:
+            args = self.condense(x_init=x0, u_prev=self.u_prev, Ad=Ad, Bd=Bd, dd=dd, tvp=tvp, p=p)
+            args.update(lbx=self.lbw, ubx=self.ubw)
+        else:
+            params = np.concatenate([x0, self.u_prev, Ad.ravel(order='F'), Bd.ravel(order='F'), dd, tvp.ravel(order='F'), p])
+            args = {'lbx': self.lbw, 'ubx': self.ubw, 'lbg': 0, 'ubg': 0, 'p': params}
+        if self.w_guess is not None:
+            args['x0'] = self.w_guess
+        sol = self.S(**args)
+        self.solver_stats = self.S.stats()
+        self.w_guess = self._shifted(np.array(sol['x']).ravel())
+
+        u0 = self._first_input(np.array(sol['x']).ravel())
+        self.u_prev = u0.reshape(-1)
+        self.data.update(_time=self.t0, _x=x0, _u=u0, t_wall=time.time()-start, success=self.solver_stats.get('success', True))
+        self.t0 += self.t_step
+        return u0
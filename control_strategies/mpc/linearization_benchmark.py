@@ -0,0 +1,49 @@
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from closed_loop import build
+from closed_loop_benchmark import run_scenario
+from dynamics_benchmark import n_instructions
+from global_vars_mpc import MPCContext
+
+# IPOPT with the linearization at the last measurement built symbolically into the collocation NLP vs. evaluated
+# numerically once per step and passed in as tvp matrices (mpc_options.linearization): expression sizes, NLP
+# function times and closed loop solve time and tracking on scenarios of closed_loop_benchmark.py.
+# Run from the repository root:
+#   python control_strategies/mpc/linearization_benchmark.py [scenario ...]
+
+linearizations = ('symbolic', 'numeric')
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or ['hover', 'step_velocity', 'desired_velocity_1']
+    for linearization in linearizations:
+        mpc_controller, _, _ = build(MPCContext(), backend='ipopt', discretization='collocation',
+                                     linearization=linearization)
+        nlp = mpc_controller.nlp
+        print("%-9s model alg %5d instructions, NLP g %6d, jac_g %6d instructions" % (
+            linearization, mpc_controller.model._alg_fun.n_instructions(),
+            n_instructions([nlp['x'], nlp['p']], [nlp['g']]),
+            mpc_controller.S.get_function('nlp_jac_g').n_instructions()))
+        mpc_controller.context.tvp.target_velocity = [0.2, 0.0, 0.0]
+        mpc_controller.set_initial_guess()
+        for _ in range(5):
+            mpc_controller.make_step(np.zeros((12, 1)))
+        # stats of the last solve
+        stats = mpc_controller.solver_stats
+        keys = [key for key in ('nlp_f', 'nlp_g', 'nlp_grad_f', 'nlp_jac_g', 'nlp_hess_l') if stats.get('n_call_' + key)]
+        print("          " + ", ".join("%s %.1f us" % (key, 1e6*stats['t_wall_' + key]/stats['n_call_' + key])
+                                      for key in keys[1:]) +
+              "; NLP functions %.3f ms of %.2f ms in IPOPT per solve" % (
+                  1e3*sum(stats['t_wall_' + key] for key in keys), 1e3*stats['t_wall_total']))
+    print("%-20s %-10s %7s %7s %6s %12s" % ("scenario", "", "p50 ms", "p95 ms", "iter", "rmse m/s"))
+    for name in names:
+        for linearization in linearizations:
+            metrics = run_scenario(name, 'ipopt', linearization=linearization)
+            print("%-20s %-10s %7.2f %7.2f %6.1f %12.4f%s" % (
+                name, linearization, metrics['solve_ms_p50'], metrics['solve_ms_p95'],
+                metrics['iterations_mean'], metrics['tracking_rmse'],
+                "  diverged after %d steps" % metrics['completed_steps'] if metrics['diverged'] else ""))
@@ -0,0 +1,215 @@
+import re
+import xml.etree.ElementTree as ET
+from math import factorial
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+from trajectories import Trajectory
+
+# Minimum snap trajectories through the gates of design/environment.xml. Each segment between two
+# waypoints is a 7th order polynomial per axis on normalized time tau = t/T_i. The snap integral is
+# minimized subject to the waypoints, continuity up to snap at the knots, a rest-to-rest (or given) start
+# state and, at gates, a velocity along the gate normal. The equality constrained QP is solved through
+# its sparse KKT system, whose LU factorization only depends on the segment times and gate normals and
+# is reused when only the gate positions change.
+
+environment_path = "design/environment.xml"
+
+n_coeffs = 8
+snap = 4
+n_dims = 3
+
+
+def gates_from_mjcf(path=environment_path):
+    """Gate centers (n, 3) and frames (n, 3, 3) from the gaitN_left/right/top/bottom bodies, in gate order.
+
+    The frame columns are the left->right and bottom->top directions and the gate normal; the gates
+    are built from capsules, so the frame follows from the body positions rather than the quats.
+    """
+    posts = {}
+    for body in ET.parse(path).getroot().iter('body'):
+        match = re.fullmatch(r'(gait\d+)_(left|right|top|bottom)', body.get('name', ''))
+        if match:
+            posts.setdefault(match.group(1), {})[match.group(2)] = np.array(body.get('pos').split(), dtype=float)
+    names = sorted(posts, key=lambda name: int(name[4:]))
+    centers = np.array([np.mean(list(posts[name].values()), axis=0) for name in names])
+    frames = np.array([_gate_frame(posts[name]['right'] - posts[name]['left'], posts[name]['top'] - posts[name]['bottom'])
+                       for name in names])
+    return centers, frames, names
+
+
+def _gate_frame(across, up):
+    across = across/np.linalg.norm(across)
+    up = up - (up @ across)*across
+    up = up/np.linalg.norm(up)
+    return np.column_stack((across, up, np.cross(across, up)))
+
+
+def _basis(r, tau, T):
+    # row vector with d^r/dt^r of [1, tau, ..., tau^7] at tau, t = tau*T
+    row = np.zeros(n_coeffs)
+    for k in range(r, n_coeffs):
+        row[k] = factorial(k)/factorial(k - r)*tau**(k - r)/T**r
+    return row
+
+
+def _snap_cost(T):
+    # integral over [0, T] of the squared 4th derivative, as a quadratic form in the coefficients
+    Q = np.zeros((n_coeffs, n_coeffs))
+    for k in range(snap, n_coeffs):
+        for l in range(snap, n_coeffs):
+            Q[k, l] = (factorial(k)/factorial(k - snap))*(factorial(l)/factorial(l - snap))/(k + l - 2*snap + 1)
+    return Q/T**(2*snap - 1)
+
+
+def _index(segment, dim):
+    start = (segment*n_dims + dim)*n_coeffs
+    return np.arange(start, start + n_coeffs)
+
+
+class MinSnapTrajectory(Trajectory):
+    """Piecewise polynomial solution, evaluated like the other trajectories (pos, vel, acc at t)."""
+
+    def __init__(self, coeffs, durations, t0=0.0):
+        self.coeffs = coeffs  # (n_segments, n_dims, n_coeffs) in normalized time
+        self.durations = durations
+        self.t0 = t0
+        self.knots = t0 + np.concatenate(([0.0], np.cumsum(durations)))
+        Trajectory.__init__(self, self._evaluate, duration=self.knots[-1])
+
+    def derivative(self, t, r):
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        i = np.clip(np.searchsorted(self.knots, t, side='right') - 1, 0, len(self.durations) - 1)
+        T = self.durations[i]
+        tau = np.clip((t - self.knots[i])/T, 0.0, 1.0)
+        k = np.arange(r, n_coeffs)
+        scale = np.array([factorial(j)/factorial(j - r) for j in k])
+        powers = tau[:, None]**(k - r)
+        return np.einsum('nk,ndk->nd', powers*scale, self.coeffs[i][:, :, r:])/T[:, None]**r
+
+    def _evaluate(self, t):
+        return self.derivative(t, 0), self.derivative(t, 1), self.derivative(t, 2)
+
+
+class MinSnapPlanner:
+    """Plans minimum snap trajectories and caches the KKT factorizations by segment times and gate normals."""
+
+    def __init__(self, speed=1.0, min_duration=0.2):
+        self.speed = speed
+        self.min_duration = min_duration
+        self.factorizations = {}
+        self.n_factorizations = 0
+
+    def durations(self, waypoints):
+        distance = np.linalg.norm(np.diff(waypoints, axis=0), axis=1)
+        return np.maximum(distance/self.speed, self.min_duration)
+
+    def _constraint_matrix(self, durations, normals):
+        """Equality constraints A c = b; returns A and a function that builds b from the waypoints."""
+        n_seg = len(durations)
+        rows, cols, vals = [], [], []
+        rhs = []  # ('pos', knot, dim) / ('start', r, dim) / ('zero',)
+        n_rows = 0
+
+        def add(entries, source):
+            nonlocal n_rows
+            for idx, row in entries:
+                nz = np.nonzero(row)[0]
+                rows.extend([n_rows]*len(nz))
+                cols.extend(idx[nz])
+                vals.extend(row[nz])
+            rhs.append(source)
+            n_rows += 1
+
+        for d in range(n_dims):
+            # start state: position, velocity, acceleration, jerk
+            for r in range(snap):
+                add([(_index(0, d), _basis(r, 0.0, durations[0]))], ('start', r, d))
+            # end: position, at rest
+            for r in range(snap):
+                add([(_index(n_seg - 1, d), _basis(r, 1.0, durations[-1]))], ('pos', n_seg, d) if r == 0 else ('zero',))
+            for j in range(1, n_seg):
+                add([(_index(j - 1, d), _basis(0, 1.0, durations[j - 1]))], ('pos', j, d))
+                add([(_index(j, d), _basis(0, 0.0, durations[j]))], ('pos', j, d))
+                for r in range(1, snap + 1):
+                    add([(_index(j - 1, d), _basis(r, 1.0, durations[j - 1])),
+                         (_index(j, d), -_basis(r, 0.0, durations[j]))], ('zero',))
+        # pass gates along their normal: no velocity in the gate plane
+        for j in range(1, n_seg):
+            if normals is not None and normals[j] is not None:
+                for axis in normals[j][:, :2].T:
+                    add([(_index(j, d), axis[d]*_basis(1, 0.0, durations[j])) for d in range(n_dims)], ('zero',))
+
+        A = sp.csc_matrix((vals, (rows, cols)), shape=(n_rows, n_seg*n_dims*n_coeffs))
+
+        # b only depends on the waypoints and the start state: gather it with index arrays
+        pos_rows = np.array([i for i, source in enumerate(rhs) if source[0] == 'pos'], dtype=int)
+        pos_index = np.array([source[1:] for source in rhs if source[0] == 'pos'], dtype=int).reshape(-1, 2)
+        start_rows = np.array([i for i, source in enumerate(rhs) if source[0] == 'start'], dtype=int)
+        start_index = np.array([source[1:] for source in rhs if source[0] == 'start'], dtype=int).reshape(-1, 2)
+
+        def rhs_vector(waypoints, start_derivatives):
+            b = np.zeros(n_rows)
+            b[pos_rows] = waypoints[pos_index[:, 0], pos_index[:, 1]]
+            start_state = np.vstack((waypoints[:1], start_derivatives))
+            b[start_rows] = start_state[start_index[:, 0], start_index[:, 1]]
+            return b
+        return A, rhs_vector
+
+    def kkt(self, durations, normals):
+        """Sparse KKT matrix [[Q, A'], [A, 0]] of the QP, the right hand side builder and the number of coefficients."""
+        A, rhs_vector = self._constraint_matrix(durations, normals)
+        Q = sp.block_diag([_snap_cost(T) for T in durations for _ in range(n_dims)], format='csc')
+        return sp.bmat([[Q, A.T], [A, None]], format='csc'), rhs_vector, Q.shape[0]
+
+    def _factorization(self, durations, normals):
+        key = (np.round(durations, 9).tobytes(),
+               None if normals is None else tuple(None if n is None else np.round(n, 9).tobytes() for n in normals))
+        if key not in self.factorizations:
+            kkt, rhs_vector, n_vars = self.kkt(durations, normals)
+            self.factorizations[key] = (splu(kkt), rhs_vector, n_vars)
+            self.n_factorizations += 1
+        return self.factorizations[key]
+
+    def plan(self, waypoints, normals=None, durations=None, start_derivatives=None, t0=0.0):
+        """Minimum snap trajectory through waypoints (n+1, 3) starting at waypoints[0] at time t0.
+
+        normals[j] is the gate frame (3, 3) at waypoints[j] or None; durations default to the distance
+        at the planner speed; start_derivatives are the start velocity, acceleration and jerk (rest
+        by default).
+        """
+        waypoints = np.asarray(waypoints, dtype=float)
+        durations = self.durations(waypoints) if durations is None else np.asarray(durations, dtype=float)
+        if start_derivatives is None:
+            start_derivatives = np.zeros((snap - 1, n_dims))
+        lu, rhs_vector, n_vars = self._factorization(durations, normals)
+        b = rhs_vector(waypoints, start_derivatives)
+        solution = lu.solve(np.concatenate((np.zeros(n_vars), b)))
+        coeffs = solution[:n_vars].reshape(len(durations), n_dims, n_coeffs)
+        return MinSnapTrajectory(coeffs, durations, t0)
+
+    def plan_gates(self, start, centers, frames=None):
+        """Trajectory from start through the gate centers, crossing every gate along its normal."""
+        waypoints = np.vstack((start, centers))
+        normals = None if frames is None else [None] + list(frames)
+        return self.plan(waypoints, normals)
+
+    def replan(self, trajectory, t_now, centers, frames=None):
+        """Replan from the state of trajectory at t_now through the remaining gate centers.
+
+        The segment times of the previous plan are kept for the remaining gates, so when t_now is a
+        knot (a gate was just passed) and only the gate positions moved, the cached factorization is
+        reused and replanning is a single triangular solve.
+        """
+        state = [trajectory.derivative(t_now, r)[0] for r in range(snap)]
+        remaining = trajectory.knots[trajectory.knots > t_now + 1e-9]
+        n_keep = len(centers)
+        if len(remaining) >= n_keep:
+            durations = np.diff(np.concatenate(([t_now], remaining[-n_keep:])))
+        else:
+            durations = None
+        waypoints = np.vstack((state[0], centers))
+        normals = None if frames is None else [None] + list(frames)
+        return self.plan(waypoints, normals, durations, start_derivatives=state[1:], t0=t_now)
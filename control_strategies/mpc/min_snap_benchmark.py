@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+
+from min_snap import MinSnapPlanner, gates_from_mjcf, _gate_frame
+
+# Planning time of the minimum snap planner for 10-100 gates: cold plan (KKT assembly + sparse LU),
+# re-solve with moved gates (cached factorization) and replanning from a gate through the remaining
+# ones, first cold and then with the remaining gates moved again. The dense KKT solve is for reference.
+# Run from the repository root: python control_strategies/mpc/min_snap_benchmark.py
+
+
+def random_course(n_gates, seed=0):
+    """Gates spaced ~1.5 m apart along a random walk, each facing the direction of travel."""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0.0, 0.6, n_gates))
+    steps = 1.5*np.column_stack((np.cos(heading), np.sin(heading), rng.normal(0.0, 0.2, n_gates)))
+    centers = np.cumsum(steps, axis=0) + [0.0, 0.0, 1.0]
+    frames = np.array([_gate_frame(np.cross([0.0, 0.0, 1.0], step), [0.0, 0.0, 1.0]) for step in steps])
+    return centers, frames
+
+
+def timed(fun, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fun()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    centers, frames, names = gates_from_mjcf()
+    planner = MinSnapPlanner()
+    cold, traj = timed(lambda: MinSnapPlanner().plan_gates(np.zeros(3), centers, frames))
+    print("environment.xml: %d gates, %.1f s trajectory, planned in %.2f ms" % (len(names), traj.duration, 1e3*cold))
+
+    print("gates | cold plan | moved gates (cached) | replan cold | replan moved (cached) | dense KKT")
+    for n_gates in (10, 25, 50, 100):
+        centers, frames = random_course(n_gates)
+        start = np.zeros(3) + [0.0, 0.0, 1.0]
+        cold, traj = timed(lambda: MinSnapPlanner().plan_gates(start, centers, frames))
+
+        planner = MinSnapPlanner()
+        traj = planner.plan_gates(start, centers, frames)
+        moved = centers + np.random.default_rng(1).normal(0.0, 0.05, centers.shape)
+        durations = traj.durations
+        cached, _ = timed(lambda: planner.plan(np.vstack((start, moved)), [None] + list(frames), durations))
+
+        t_gate = traj.knots[1]
+        replan_cold, _ = timed(lambda: MinSnapPlanner().replan(traj, t_gate, moved[1:], frames[1:]))
+        planner.replan(traj, t_gate, moved[1:], frames[1:])
+        replan_cached, replanned = timed(lambda: planner.replan(traj, t_gate, moved[1:] + 0.01, frames[1:]))
+
+        kkt = planner.kkt(durations, [None] + list(frames))[0].toarray()
+        dense, _ = timed(lambda: np.linalg.solve(kkt, np.ones(len(kkt))), repeat=1)
+
+        print("%5d | %7.2f ms | %17.2f ms | %8.2f ms | %18.2f ms | %6.1f ms (%d unknowns)" % (
+            n_gates, 1e3*cold, 1e3*cached, 1e3*replan_cold, 1e3*replan_cached, 1e3*dense, len(kkt)))
@@ -0,0 +1,299 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from casadi import SX, DM, Function, vertcat
+
+from global_vars_mpc import MPCContext
+from model_tools import explicit_rhs
+from rti_controller import rk4_step
+
+# Where does the linearized model of 12_states_lin_sim.py drift from the nonlinear one of
+# 12_states_nonlin_sim.py? simple_differential.py answers this for one input over 40 steps; this
+# samples thousands of initial states and input sequences instead. Both do_mpc models are turned into
+# explicit RK4 steps (algebraic accelerations eliminated by model_tools.explicit_rhs, stepped by
+# rti_controller.rk4_step) that casadi maps over a chunk of samples in its thread pool. As in
+# simple_differential.py the linear model is re-linearized at its own last state, input and
+# finite-difference acceleration after every step (relinearize_every=1), every k steps or, with 0, never.
+# The L2 divergence |x_lin - x_nonlin| is reduced on the fly: per-step count, mean, std and max over
+# all samples (Chan's parallel update of one chunk at a time), the same for its log10, and the mean
+# log10 divergence at the last step binned over two features of the sample per heatmap. The logs keep
+# a few exploding samples from swamping the typical case. Trajectories and per-step norms are never kept.
+# Run from the repository root:
+#   python control_strategies/mpc/model_discrepancy.py [n_samples] [--n-steps 40] [--relinearize-every 1]
+#       [--chunk-size 1000] [--out control_strategies/mpc/model_discrepancy]
+
+t_step = 0.04
+m = 2.0  # drone_mass of the simulator scripts
+g = 9.81
+hover_input = np.array([m*g/4]*4 + [0.0]*4)
+# divergences below this count as exact agreement in the log10 statistics, log10(0) would be -inf and
+# be counted as a blown up (non-finite) sample
+divergence_floor = 1e-16
+
+# sample feature -> (label, function of (x0, u) with u of shape (n, n_steps, 8))
+features = {
+    'roll': ('initial roll [rad]', lambda x0, u: x0[:, 3]),
+    'pitch': ('initial pitch [rad]', lambda x0, u: x0[:, 4]),
+    'yaw': ('initial yaw [rad]', lambda x0, u: x0[:, 5]),
+    'speed': ('initial speed [m/s]', lambda x0, u: np.linalg.norm(x0[:, 6:9], axis=1)),
+    'body_rate': ('initial body rate [rad/s]', lambda x0, u: np.linalg.norm(x0[:, 9:12], axis=1)),
+    'thrust': ('mean thrust / hover thrust', lambda x0, u: u[:, :, 0:4].mean(axis=(1, 2))/hover_input[0]),
+    'tilt': ('mean |tilt| [rad]', lambda x0, u: np.abs(u[:, :, 4:8]).mean(axis=(1, 2))),
+}
+default_heatmaps = (('roll', 'pitch'), ('yaw', 'body_rate'), ('speed', 'body_rate'), ('thrust', 'tilt'))
+
+
+def log_divergence(divergence):
+    """log10 of the divergence floored at divergence_floor, NaN and inf (blown up samples) stay non-finite."""
+    return np.log10(np.maximum(divergence, divergence_floor))
+
+
+def load_model(script, name):
+    """The do_mpc model the simulator script builds, exec'd with its own MPCContext."""
+    scope = {'mpc_context': MPCContext()}
+    with open(script) as f:
+        exec(f.read(), scope)
+    return scope[name]
+
+
+def model_step(model, t_step=t_step, n_substeps=4):
+    """casadi Function (x, u, tvp) -> x after t_step with u and tvp held, rti_controller.rk4_step on the
+    explicit model with tvp appended to the held input."""
+    f = explicit_rhs(model)
+    p = DM.zeros(model.n_p)
+    step = rk4_step(lambda x, v: f(x, v[:model.n_u], v[model.n_u:], p), model.n_x, model.n_u + model.n_tvp,
+                    t_step, n_substeps)
+    x = SX.sym('x', model.n_x)
+    u = SX.sym('u', model.n_u)
+    tvp = SX.sym('tvp', model.n_tvp)
+    return Function('model_step', [x, u, tvp], [step(x, vertcat(u, tvp))], ['x', 'u', 'tvp'], ['x_next'])
+
+
+def sample(n, n_steps, rng, angle=0.3, yaw=0.3, speed=1.0, body_rate=0.5, position=0.5, thrust=0.3, tilt=0.3,
+           input_noise=0.02):
+    """n initial states (n, 12) and input sequences (n, n_steps, 8) around hover.
+
+    roll and pitch lie within +-angle, yaw within +-yaw: the linear model's third order sin/cos series
+    are only meant for small angles and a full turn of yaw would dominate every statistic.
+    Every sequence starts from a random constant input (thrust within +-thrust of hover, tilts within
+    +-tilt) and random walks from there with steps of input_noise relative to those ranges.
+    """
+    x0 = np.zeros((n, 12))
+    x0[:, 0:3] = rng.uniform(-position, position, (n, 3))
+    x0[:, 3:5] = rng.uniform(-angle, angle, (n, 2))
+    x0[:, 5] = rng.uniform(-yaw, yaw, n)
+    x0[:, 6:9] = rng.uniform(-speed, speed, (n, 3))
+    x0[:, 9:12] = rng.uniform(-body_rate, body_rate, (n, 3))
+    base = np.empty((n, 1, 8))
+    base[:, 0, 0:4] = hover_input[0]*(1 + rng.uniform(-thrust, thrust, (n, 4)))
+    base[:, 0, 4:8] = rng.uniform(-tilt, tilt, (n, 4))
+    scale = np.array([hover_input[0]*thrust]*4 + [tilt]*4)
+    walk = np.cumsum(rng.normal(0.0, input_noise, (n, n_steps, 8))*scale, axis=1)
+    u = base + walk
+    u[:, :, 0:4] = np.maximum(u[:, :, 0:4], 0.0)
+    return x0, u
+
+
+class RunningStats:
+    """Per-step count, mean, std and max of values streamed in one step and chunk of samples at a time.
+
+    Non-finite values (a model that blew up) are counted in n_nonfinite and left out of the moments.
+    """
+
+    def __init__(self, n_steps):
+        self.count = np.zeros(n_steps)
+        self.mean = np.zeros(n_steps)
+        self.m2 = np.zeros(n_steps)
+        self.max = np.full(n_steps, -np.inf)
+        self.n_nonfinite = np.zeros(n_steps, dtype=int)
+
+    def update(self, step, values):
+        finite = values[np.isfinite(values)]
+        self.n_nonfinite[step] += values.size - finite.size
+        if not finite.size:
+            return
+        # merge the chunk's moments into the running ones (Chan et al.)
+        n_a, n_b = self.count[step], finite.size
+        mean_b = finite.mean()
+        delta = mean_b - self.mean[step]
+        n = n_a + n_b
+        self.mean[step] += delta*n_b/n
+        self.m2[step] += np.sum((finite - mean_b)**2) + delta**2*n_a*n_b/n
+        self.count[step] = n
+        self.max[step] = max(self.max[step], finite.max())
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2/np.maximum(self.count - 1, 1))
+
+
+class BinnedMean:
+    """Mean of a value over a 2D grid of two sample features, accumulated chunk by chunk."""
+
+    def __init__(self, x_edges, y_edges):
+        self.x_edges = x_edges
+        self.y_edges = y_edges
+        self.total = np.zeros((len(x_edges) - 1, len(y_edges) - 1))
+        self.count = np.zeros_like(self.total)
+
+    def update(self, x, y, values):
+        finite = np.isfinite(values)
+        ix = np.clip(np.searchsorted(self.x_edges, x[finite], side='right') - 1, 0, self.total.shape[0] - 1)
+        iy = np.clip(np.searchsorted(self.y_edges, y[finite], side='right') - 1, 0, self.total.shape[1] - 1)
+        np.add.at(self.total, (ix, iy), values[finite])
+        np.add.at(self.count, (ix, iy), 1)
+
+    @property
+    def mean(self):
+        with np.errstate(invalid='ignore'):
+            return np.where(self.count > 0, self.total/np.maximum(self.count, 1), np.nan)
+
+
+class DiscrepancyStudy:
+    """Streaming linear vs. nonlinear divergence statistics over sampled initial states and inputs.
+
+    run(n_samples) processes the samples in chunks of chunk_size, each chunk stepped through both
+    models by casadi maps ('thread' parallelization over n_threads, all cores by default), and
+    accumulates stats (RunningStats over the steps) and heatmaps (BinnedMean of the log10 divergence
+    at the last step per feature pair).
+    """
+
+    def __init__(self, n_steps=40, relinearize_every=1, chunk_size=1000, heatmaps=default_heatmaps, n_bins=12,
+                 parallelization='thread', n_threads=None, n_substeps=4, **sample_ranges):
+        linear = load_model("control_strategies/mpc/12_states_lin_sim.py", 'mpc_model')
+        nonlinear = load_model("control_strategies/mpc/12_states_nonlin_sim.py", 'mpc_modelsim')
+        # the linear simulator's tvp entries: last_state, last_input, last_acc
+        assert linear.tvp.keys()[1:] == ['last_state', 'last_input', 'last_acc']
+        self.linear_step = model_step(linear, n_substeps=n_substeps)
+        self.nonlinear_step = model_step(nonlinear, n_substeps=n_substeps)
+        self.n_steps = n_steps
+        self.relinearize_every = relinearize_every
+        self.chunk_size = chunk_size
+        self.parallelization = parallelization
+        self.n_threads = n_threads or os.cpu_count()
+        self.sample_ranges = sample_ranges
+        self.maps = {}
+        self.stats = RunningStats(n_steps)
+        self.log_stats = RunningStats(n_steps)
+        self.n_samples = 0
+        self.heatmaps = {}
+        self.heatmap_pairs = heatmaps
+        self.n_bins = n_bins
+
+    def _mapped(self, n):
+        if n not in self.maps:
+            args = (n, self.parallelization, min(self.n_threads, n)) if self.parallelization == 'thread' else \
+                (n, self.parallelization)
+            self.maps[n] = (self.linear_step.map(*args), self.nonlinear_step.map(*args))
+        return self.maps[n]
+
+    def _heatmap_edges(self, x0, u):
+        # bin edges from the first chunk's feature ranges, later samples outside go to the edge bins
+        for pair in self.heatmap_pairs:
+            edges = [np.linspace(*np.percentile(features[name][1](x0, u), [0.5, 99.5]), self.n_bins + 1)
+                     for name in pair]
+            self.heatmaps[pair] = BinnedMean(*edges)
+
+    def run_chunk(self, x0, u):
+        n = x0.shape[0]
+        linear_step, nonlinear_step = self._mapped(n)
+        if not self.heatmaps:
+            self._heatmap_edges(x0, u)
+        x_lin = x0.T.copy()
+        x_nonlin = x0.T.copy()
+        last_dx = x_lin[6:12].copy()
+        linearization = np.vstack([x_lin, np.tile(hover_input[:, None], (1, n)), np.zeros((6, n))])
+        for i in range(self.n_steps):
+            u_i = u[:, i].T
+            x_lin = np.array(linear_step(x_lin, u_i, linearization))
+            x_nonlin = np.array(nonlinear_step(x_nonlin, u_i, DM.zeros(0, n)))
+            divergence = np.linalg.norm(x_lin - x_nonlin, axis=0)
+            self.stats.update(i, divergence)
+            self.log_stats.update(i, log_divergence(divergence))
+            if self.relinearize_every and (i + 1) % self.relinearize_every == 0:
+                # like simple_differential.py: tvp.x, tvp.u and tvp.drone_accel from the linear model itself
+                linearization = np.vstack([x_lin, u_i, (x_lin[6:12] - last_dx)/t_step])
+            last_dx = x_lin[6:12].copy()
+        for pair, heatmap in self.heatmaps.items():
+            heatmap.update(features[pair[0]][1](x0, u), features[pair[1]][1](x0, u), log_divergence(divergence))
+        self.n_samples += n
+
+    def run(self, n_samples, seed=0):
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_samples, self.chunk_size):
+            x0, u = sample(min(self.chunk_size, n_samples - start), self.n_steps, rng, **self.sample_ranges)
+            self.run_chunk(x0, u)
+        return self
+
+    def save(self, prefix):
+        """prefix.npz with the statistics and heatmaps, prefix.png with the plots."""
+        import matplotlib.pyplot as plt
+        arrays = {'count': self.stats.count, 'mean': self.stats.mean, 'std': self.stats.std, 'max': self.stats.max,
+                  'n_nonfinite': self.stats.n_nonfinite, 'log10_mean': self.log_stats.mean,
+                  'log10_std': self.log_stats.std}
+        for (a, b), heatmap in self.heatmaps.items():
+            arrays['heatmap_%s_%s' % (a, b)] = heatmap.mean
+            arrays['edges_%s_%s_x' % (a, b)] = heatmap.x_edges
+            arrays['edges_%s_%s_y' % (a, b)] = heatmap.y_edges
+        np.savez(prefix + '.npz', **arrays)
+
+        fig, axes = plt.subplots(1, len(self.heatmaps) + 1, figsize=(5*(len(self.heatmaps) + 1), 4))
+        steps = np.arange(1, self.n_steps + 1)
+        log_mean, log_std = self.log_stats.mean, self.log_stats.std
+        axes[0].plot(steps, 10**log_mean, label='geometric mean')
+        axes[0].fill_between(steps, 10**(log_mean - log_std), 10**(log_mean + log_std), alpha=.3,
+                             label='x/ 1 geometric std')
+        axes[0].plot(steps, self.stats.mean, ':', label='mean')
+        axes[0].plot(steps, self.stats.max, '--', label='max')
+        axes[0].set_yscale('log')
+        axes[0].set_xlabel('step')
+        axes[0].set_ylabel('|x_lin - x_nonlin|')
+        axes[0].legend()
+        for ax, ((a, b), heatmap) in zip(axes[1:], self.heatmaps.items()):
+            image = ax.pcolormesh(heatmap.x_edges, heatmap.y_edges, heatmap.mean.T, shading='flat')
+            fig.colorbar(image, ax=ax, label='mean log10 |x_lin - x_nonlin| at step %d' % self.n_steps)
+            ax.set_xlabel(features[a][0])
+            ax.set_ylabel(features[b][0])
+        relinearized = 'relinearized every %d steps' % self.relinearize_every if self.relinearize_every else \
+            'never relinearized'
+        fig.suptitle('linear vs. nonlinear model, %d samples, %s' % (self.n_samples, relinearized))
+        fig.tight_layout()
+        fig.savefig(prefix + '.png', dpi=100)
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('Agg')
+    parser = argparse.ArgumentParser(description="linear vs. nonlinear simulator model divergence study")
+    parser.add_argument('n_samples', nargs='?', type=int, default=5000)
+    parser.add_argument('--n-steps', type=int, default=40)
+    parser.add_argument('--relinearize-every', type=int, default=1, help="0: never re-linearize")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--n-threads', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='control_strategies/mpc/model_discrepancy')
+    args = parser.parse_args()
+
+    study = DiscrepancyStudy(n_steps=args.n_steps, relinearize_every=args.relinearize_every,
+                             chunk_size=args.chunk_size, n_threads=args.n_threads)
+    start = time.perf_counter()
+    study.run(args.n_samples, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    print("%d samples x %d steps in %.1f s (%.0f samples/s)" % (study.n_samples, args.n_steps, elapsed,
+                                                                study.n_samples/elapsed))
+    stats = study.stats
+    for i in sorted({0, 4, 9, 19, args.n_steps - 1}):
+        if i < args.n_steps:
+            print("step %3d  geometric mean %.3e  mean %.3e  std %.3e  max %.3e  non-finite %d" % (
+                i + 1, 10**study.log_stats.mean[i], stats.mean[i], stats.std[i], stats.max[i], stats.n_nonfinite[i]))
+    for (a, b), heatmap in study.heatmaps.items():
+        worst = np.unravel_index(np.nanargmax(heatmap.mean), heatmap.mean.shape)
+        best = np.unravel_index(np.nanargmin(heatmap.mean), heatmap.mean.shape)
+        print("%-16s mean log10 final divergence %6.2f in the best cell (%s %.2f, %s %.2f), %6.2f in the worst (%s %.2f, %s %.2f)"
+              % (a + ' x ' + b, heatmap.mean[best], a, heatmap.x_edges[best[0]], b, heatmap.y_edges[best[1]],
+                 heatmap.mean[worst], a, heatmap.x_edges[worst[0]], b, heatmap.y_edges[worst[1]]))
+    study.save(args.out)
+    print("wrote %s.npz and %s.png" % (args.out, args.out))
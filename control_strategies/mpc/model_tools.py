@@ -0,0 +1,160 @@
+import numpy as np
+import scipy.linalg
+import do_mpc
+from casadi import *
+
+
+# Helpers to turn the do_mpc DAE models of the tilt-rotor into explicit / linear state space form.
+# Both the controller model (linearized euler_lagrange) and the simulator model are affine in the
+# algebraic accelerations z = [ddpos, ddtheta], so z can be eliminated exactly.
+
+
+def model_symbols(model):
+    x = SX.sym('x', model.n_x)
+    u = SX.sym('u', model.n_u)
+    z = SX.sym('z', model.n_z)
+    tvp = SX.sym('tvp', model.n_tvp)
+    p = SX.sym('p', model.n_p)
+    w = SX.sym('w', model.n_w)
+    return x, u, z, tvp, p, w
+
+
+def eliminate_algebraic(model, x, u, tvp, p, w):
+    """Expression for z solving alg(x, u, z) = 0, for models whose algebraic equations are affine in z."""
+    z = SX.sym('z', model.n_z)
+    alg = model._alg_fun(x, u, z, tvp, p, w)
+    if not is_linear(alg, z):
+        raise ValueError("the algebraic equations are not affine in z and cannot be eliminated explicitly")
+    J_z = jacobian(alg, z)
+    alg_0 = substitute(alg, z, DM.zeros(model.n_z))
+    return -solve(J_z, alg_0)
+
+
+def explicit_dynamics(x, u, z, rhs, alg):
+    """casadi Function f(x, u) -> xdot from symbolic rhs(x, u, z), with z solved from alg(x, u, z) = 0.
+
+    x, u and z are (vertcats of) symbols; alg has to be affine in z.
+    """
+    if not is_linear(alg, z):
+        raise ValueError("the algebraic equations are not affine in z and cannot be eliminated explicitly")
+    z_explicit = -solve(jacobian(alg, z), substitute(alg, z, DM.zeros(z.shape)))
+    return Function('explicit_dynamics', [x, u], [substitute(rhs, z, z_explicit)], ['x', 'u'], ['xdot'])
+
+
+def explicit_rhs(model):
+    """casadi Function rhs(x, u, tvp, p) -> xdot with the algebraic states eliminated."""
+    x, u, _, tvp, p, w = model_symbols(model)
+    z = eliminate_algebraic(model, x, u, tvp, p, w)
+    rhs = model._rhs_fun(x, u, z, tvp, p, DM.zeros(model.n_w))
+    return Function('explicit_rhs', [x, u, tvp, p], [rhs], ['x', 'u', 'tvp', 'p'], ['xdot'])
+
+
+def linearization(model):
+    """casadi Function (x, u, tvp, p) -> (A, B, c) with xdot ~= A x + B u + c around (x, u)."""
+    x, u, _, tvp, p, _ = model_symbols(model)
+    rhs = explicit_rhs(model)(x, u, tvp, p)
+    A = jacobian(rhs, x)
+    B = jacobian(rhs, u)
+    c = rhs - mtimes(A, x) - mtimes(B, u)
+    return Function('linearization', [x, u, tvp, p], [A, B, c], ['x', 'u', 'tvp', 'p'], ['A', 'B', 'c'])
+
+
+def zoh_discretize(A, B, c, dt):
+    """Exact zero-order-hold discretization x+ = Ad x + Bd u + cd of xdot = A x + B u + c."""
+    A = np.asarray(A)
+    B = np.asarray(B)
+    c = np.asarray(c).reshape(-1, 1)
+    n_x, n_u = B.shape
+    # matrix exponential of the augmented system [[A, B, c], [0, 0, 0]]
+    M = np.zeros((n_x + n_u + 1, n_x + n_u + 1))
+    M[:n_x, :n_x] = A
+    M[:n_x, n_x:n_x+n_u] = B
+    M[:n_x, -1:] = c
+    E = scipy.linalg.expm(M*dt)
+    return E[:n_x, :n_x], E[:n_x, n_x:n_x+n_u], E[:n_x, -1]
+
+
+class ZOHDiscretization:
+    """Ad, Bd, dd of the exact ZOH discretization of a model linearized at (x, u, tvp, p).
+
+    The matrices are only recomputed when the linearization point changes; n_evaluations counts
+    the linearizations actually done.
+    """
+
+    def __init__(self, model, t_step):
+        self.linearize = linearization(model)
+        self.t_step = t_step
+        self.point = None
+        self.matrices = None
+        self.n_evaluations = 0
+
+    def __call__(self, x, u, tvp, p):
+        point = np.concatenate([np.ravel(x), np.ravel(u), np.ravel(tvp), np.ravel(p)]).astype(float)
+        if self.point is None or not np.array_equal(point, self.point):
+            A, B, c = self.linearize(x, u, tvp, p)
+            self.matrices = zoh_discretize(A, B, c, self.t_step)
+            self.point = point
+            self.n_evaluations += 1
+        return self.matrices
+
+
+class CachedFunction:
+    """Numeric outputs of a casadi Function, only re-evaluated when its inputs change.
+
+    The function is evaluated through a copy with all inputs and outputs stacked into one vector each,
+    a casadi call costs about as much per converted argument as the evaluation itself for these small
+    functions. n_evaluations counts the evaluations actually done.
+    """
+
+    def __init__(self, function):
+        inputs = [SX.sym(function.name_in(i), function.sparsity_in(i)) for i in range(function.n_in())]
+        outputs = [densify(output) for output in function.call(inputs)]
+        self.function = Function(function.name() + '_flat', [vertcat(*[vec(i) for i in inputs])],
+                                 [vertcat(*[vec(o) for o in outputs])])
+        self.shapes = [output.shape for output in outputs]
+        self.offsets = np.cumsum([0] + [output.numel() for output in outputs])
+        self.point = None
+        self.outputs = None
+        self.n_evaluations = 0
+
+    def __call__(self, *args):
+        point = np.concatenate([np.ravel(arg) for arg in args]).astype(float)
+        if self.point is None or not np.array_equal(point, self.point):
+            flat = self.function(point).full().ravel()
+            self.outputs = [flat[start:stop].reshape(shape, order='F') for start, stop, shape
+                            in zip(self.offsets[:-1], self.offsets[1:], self.shapes)]
+            self.point = point
+            self.n_evaluations += 1
+        return self.outputs
+
+
+def zoh_model(model):
+    """Discrete-time do_mpc model x+ = Ad x + Bd u + dd for a setup continuous (DAE) model.
+
+    The variables (_x, _u, _tvp, _p) keep their names and shapes, the algebraic states are dropped
+    and Ad, Bd, dd become the extra tvp entries zoh_Ad, zoh_Bd and zoh_dd, to be filled from a
+    ZOHDiscretization of model every step. Aux expressions are carried over with z eliminated.
+    """
+    discrete = do_mpc.model.Model('discrete')
+    variables = {}
+    for var_type, struct in (('_x', model.x), ('_u', model.u), ('_tvp', model.tvp), ('_p', model.p)):
+        variables[var_type] = [discrete.set_variable(var_type, name, struct[name].shape)
+                               for name in struct.keys() if name != 'default']
+    Ad = discrete.set_variable('_tvp', 'zoh_Ad', (model.n_x, model.n_x))
+    Bd = discrete.set_variable('_tvp', 'zoh_Bd', (model.n_x, model.n_u))
+    dd = discrete.set_variable('_tvp', 'zoh_dd', (model.n_x, 1))
+
+    x, u, tvp, p = [vertcat(*[vec(v) for v in variables[var_type]]) for var_type in ('_x', '_u', '_tvp', '_p')]
+    x_next = mtimes(Ad, x) + mtimes(Bd, u) + dd
+    for name in model.x.keys():
+        if name != 'default':
+            discrete.set_rhs(name, x_next[model.x.f[name]])
+
+    w = DM.zeros(model.n_w)
+    z = eliminate_algebraic(model, x, u, tvp, p, w)
+    aux = model._aux_expression_fun(x, u, z, tvp, p)
+    for name in model.aux.keys():
+        if name != 'default':
+            discrete.set_expression(name, reshape(aux[model.aux.f[name]], model.aux[name].shape))
+    discrete.setup()
+    return discrete
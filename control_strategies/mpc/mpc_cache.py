@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import casadi
+import do_mpc
+
+from mpc_codegen import compiled_nlpsol
+
+
+# Compiled solvers are stored next to the scripts unless MPC_CACHE_DIR points elsewhere
+# (e.g. a directory shared between sim workers).
+cache_dir = os.environ.get('MPC_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mpc_cache'))
+
+
+def _to_json(value):
+    # numpy arrays / casadi DM end up in the parameter dicts of the controller scripts
+    return np.asarray(value).tolist()
+
+
+def model_hash(params, source_path=None):
+    """Key for the cache: model/controller parameters, library versions and the sources that build the model.
+
+    source_path is one path or a list of paths: the script and every module that shapes the NLP.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(params, sort_keys=True, default=_to_json).encode())
+    h.update(casadi.__version__.encode())
+    h.update(do_mpc.__version__.encode())
+    if source_path is not None:
+        for path in [source_path] if isinstance(source_path, str) else source_path:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def solver_path(key, name='nlpsol'):
+    return os.path.join(cache_dir, name + '_' + key + '.casadi')
+
+
+def load_or_build(path, build):
+    """Load a serialized casadi Function from path, or build it and store it there."""
+    if os.path.exists(path):
+        return casadi.Function.load(path)
+    fun = build()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary name first so that concurrent workers never load a half written file
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    fun.save(tmp_path)
+    os.replace(tmp_path, path)
+    return fun
+
+
+def _nlpsol_scopes(mpc):
+    # do_mpc creates the IPOPT solver with a module level reference to casadi's nlpsol: either a star
+    # import (do_mpc 4) or an attribute of the castools namespace (do_mpc 5). Collect every namespace
+    # along the class hierarchy that holds such a reference.
+    scopes = []
+
+    def add(namespace):
+        if namespace.get('nlpsol') is casadi.nlpsol and not any(namespace is scope for scope in scopes):
+            scopes.append(namespace)
+
+    for cls in type(mpc).__mro__:
+        module = sys.modules.get(cls.__module__)
+        if module is None:
+            continue
+        add(vars(module))
+        for value in list(vars(module).values()):
+            if hasattr(value, '__dict__') and not isinstance(value, type):
+                add(vars(value))
+    return scopes
+
+
+def cached_setup(mpc, params, source_path=None, use_cache=True, codegen=False):
+    """Drop-in for mpc.setup() that reuses the serialized IPOPT solver if nothing changed.
+
+    do_mpc still builds its model and NLP structures (they are needed to pack parameters and unpack
+    results in make_step), but the nlpsol construction, which derives the Jacobian and Hessian
+    functions, is skipped on a cache hit. With codegen=True the NLP functions are emitted as C,
+    compiled into a shared library in cache_dir and IPOPT evaluates them from there; the library
+    is the cached artifact in that mode, regardless of use_cache. Returns the setup wall time in seconds.
+    """
+    start = time.time()
+    if not use_cache and not codegen:
+        mpc.setup()
+        return time.time() - start
+
+    key = model_hash(params, source_path)
+    path = solver_path(key)
+    scopes = _nlpsol_scopes(mpc)
+    originals = [scope['nlpsol'] for scope in scopes]
+
+    def nlpsol_cached(name, solver, nlp, opts={}):
+        if codegen:
+            return compiled_nlpsol(name, solver, nlp, opts, key, cache_dir)
+        return load_or_build(path, lambda: casadi.nlpsol(name, solver, nlp, opts))
+
+    for scope in scopes:
+        scope['nlpsol'] = nlpsol_cached
+    try:
+        mpc.setup()
+    finally:
+        for scope, original in zip(scopes, originals):
+            scope['nlpsol'] = original
+    return time.time() - start
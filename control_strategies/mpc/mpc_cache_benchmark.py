@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Measures the controller startup (model + NLP + solver construction) in a fresh process,
+# once with an empty cache (cold) and once with the solver from the first run on disk (warm).
+# Run from the repository root like the other mpc scripts.
+
+startup_snippet = """
+import sys, time
+sys.path.insert(0, 'control_strategies/mpc')
+import matplotlib
+matplotlib.use('Agg')
+start = time.time()
+with open("control_strategies/mpc/12_states_linear_controller.py") as f:
+    exec(f.read())
+print("STARTUP", time.time() - start)
+"""
+
+
+def startup_time(cache_dir):
+    env = dict(os.environ, MPC_CACHE_DIR=cache_dir)
+    out = subprocess.run([sys.executable, "-c", startup_snippet], env=env, capture_output=True, text=True, check=True).stdout
+    for line in out.splitlines():
+        if line.startswith("STARTUP"):
+            return float(line.split()[1])
+    raise RuntimeError("startup time not found in output:\n" + out)
+
+
+if __name__ == '__main__':
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    cold = []
+    warm = []
+    for i in range(n_runs):
+        cache_dir = tempfile.mkdtemp(prefix="mpc_cache_")
+        try:
+            cold.append(startup_time(cache_dir))
+            warm.append(startup_time(cache_dir))
+        finally:
+            shutil.rmtree(cache_dir)
+        print("run", i, "cold", cold[-1], "warm", warm[-1])
+
+    print("cold startup: mean %.3f s, min %.3f s" % (sum(cold)/len(cold), min(cold)))
+    print("warm startup: mean %.3f s, min %.3f s" % (sum(warm)/len(warm), min(warm)))
+    print("speedup: %.2fx" % (min(cold)/min(warm)))
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import shlex
+import subprocess
+
+import casadi
+
+
+# Compiler and flags for the generated NLP functions. -O3 on the ~5 MB generated file takes about
+# two minutes (-O1 about one), it only happens once per cache key.
+compiler = os.environ.get('CC', 'gcc')
+compiler_flags = shlex.split(os.environ.get('MPC_CODEGEN_FLAGS', '-O3'))
+
+
+def generate_c(solver, name, build_dir):
+    """Write C code for the functions IPOPT evaluates (nlp_f, nlp_g, nlp_grad_f, nlp_jac_g, nlp_hess_l)."""
+    os.makedirs(build_dir, exist_ok=True)
+    # generate_dependencies always writes to the working directory
+    cwd = os.getcwd()
+    os.chdir(build_dir)
+    try:
+        c_file = solver.generate_dependencies(name + '.c')
+    finally:
+        os.chdir(cwd)
+    return os.path.join(build_dir, c_file)
+
+
+def compile_shared(c_path, so_path):
+    tmp_path = so_path + '.' + str(os.getpid()) + '.tmp'
+    subprocess.run([compiler, '-fPIC', '-shared', *compiler_flags, c_path, '-o', tmp_path], check=True)
+    os.replace(tmp_path, so_path)
+    return so_path
+
+
+def compiled_nlpsol(name, solver, nlp, opts, key, build_dir):
+    """nlpsol whose NLP functions are loaded from a shared library, compiled once per key and toolchain."""
+    # a library built with another compiler or other flags is not reused
+    toolchain = hashlib.sha256(' '.join([compiler] + compiler_flags).encode()).hexdigest()[:8]
+    lib_name = 'nlp_' + key + '_' + toolchain
+    so_path = os.path.join(build_dir, lib_name + '.so')
+    if not os.path.exists(so_path):
+        interpreted = casadi.nlpsol(name, solver, nlp, opts)
+        compile_shared(generate_c(interpreted, lib_name, build_dir), so_path)
+    return casadi.nlpsol(name, solver, so_path, opts)
@@ -0,0 +1,133 @@
+import json
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Per-phase timing of the controller loop. StepProfiler wraps the phases of a controller's make_step
+# on the instance (tvp and p functions, the casadi solver call, the rest of do_mpc's solve and the
+# data.update calls that store the result) and records one timeline entry per call. After every step
+# the casadi solver stats are added: t_wall per NLP function, IPOPT's own time (including the linear
+# solver, which casadi does not time separately) and the iteration count. Phases of the surrounding
+# loop such as the simulator can be added with profiler.phase(name). save_chrome_trace writes the
+# timeline as Chrome trace JSON (chrome://tracing, https://ui.perfetto.dev).
+
+
+class _Timed:
+    # callable wrapper that records every call, other attributes go to the wrapped object
+    def __init__(self, profiler, name, fun):
+        self._profiler = profiler
+        self._name = name
+        self._fun = fun
+
+    def __call__(self, *args, **kwargs):
+        with self._profiler.phase(self._name):
+            return self._fun(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._fun, name)
+
+
+class StepProfiler:
+    """Timeline of make_step phases for a do_mpc MPC or a LinearQPController.
+
+    step_fun replaces mpc_controller.make_step as the profiled step, e.g. WarmStart.make_step.
+    Times are kept in seconds from the profiler's creation; events are (name, start, duration, step),
+    solver_events additionally carry the number of calls of the NLP function.
+    """
+
+    solver_phase = 'nlp_solver'
+
+    def __init__(self, mpc_controller, step_fun=None):
+        self.mpc = mpc_controller
+        self.step_fun = step_fun if step_fun is not None else mpc_controller.make_step
+        self.t_origin = time.perf_counter()
+        self.events = []
+        self.solver_events = []
+        self.iterations = {}
+        self.n_steps = 0
+        self.step = 0  # index of the current step, phases after make_step belong to the same step
+        self._solver_call = None
+        for attr in ('tvp_fun', 'p_fun'):
+            self.wrap(mpc_controller, attr)
+        self.wrap(mpc_controller, 'S', self.solver_phase)
+        self.wrap(mpc_controller, 'solve', 'solve')
+        if hasattr(mpc_controller, 'data'):
+            self.wrap(mpc_controller.data, 'update', 'store_data')
+
+    def wrap(self, obj, attr, name=None):
+        """Time every call of obj.attr as the phase name (attr by default), if obj has it."""
+        fun = getattr(obj, attr, None)
+        if fun is not None and not isinstance(fun, _Timed):
+            setattr(obj, attr, _Timed(self, name or attr, fun))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            event = (name, start - self.t_origin, time.perf_counter() - start, self.step)
+            self.events.append(event)
+            if name == self.solver_phase:
+                self._solver_call = event
+
+    def make_step(self, x0):
+        self.step = self.n_steps
+        with self.phase('make_step'):
+            u0 = self.step_fun(x0)
+        self._record_solver_stats()
+        self.n_steps += 1
+        return u0
+
+    def _record_solver_stats(self):
+        stats = getattr(self.mpc, 'solver_stats', {})
+        if self._solver_call is None or self._solver_call[3] != self.step:
+            return
+        _, start, duration, step = self._solver_call
+        if stats.get('iter_count', -1) >= 0:
+            self.iterations[step] = stats['iter_count']
+        # casadi only reports totals per function, so the function times are laid out one after the
+        # other inside the solver call; whatever is left is the solver's own time
+        offset = start
+        for key in sorted(stats):
+            if key.startswith('t_wall_') and key != 't_wall_total' and stats[key] > 0:
+                name = key[len('t_wall_'):]
+                self.solver_events.append((name, offset, stats[key], step, stats.get('n_call_' + name)))
+                offset += stats[key]
+        self.solver_events.append(('solver_internal', offset, max(start + duration - offset, 0.0), step, None))
+
+    def summary(self):
+        """Mean, p95 and total time per phase in ms, plus the solver iterations."""
+        durations = {}
+        for name, _, duration, _ in self.events:
+            durations.setdefault(name, []).append(duration)
+        for name, _, duration, _, _ in self.solver_events:
+            durations.setdefault(self.solver_phase + '/' + name, []).append(duration)
+        lines = ["%-28s %8s %8s %10s %7s" % ("phase", "mean ms", "p95 ms", "total ms", "calls")]
+        for name, values in durations.items():
+            values = 1e3*np.array(values)
+            lines.append("%-28s %8.3f %8.3f %10.1f %7d" % (name, values.mean(), np.percentile(values, 95), values.sum(), len(values)))
+        iterations = list(self.iterations.values())
+        if iterations:
+            lines.append("solver iterations: mean %.1f, max %d over %d steps" % (np.mean(iterations), max(iterations), len(iterations)))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        trace = []
+        for name, start, duration, step in self.events:
+            trace.append({'name': name, 'ph': 'X', 'ts': 1e6*start, 'dur': 1e6*duration, 'pid': 0, 'tid': 0,
+                          'args': {'step': step}})
+        for name, start, duration, step, n_calls in self.solver_events:
+            trace.append({'name': name, 'cat': self.solver_phase, 'ph': 'X', 'ts': 1e6*start, 'dur': 1e6*duration,
+                          'pid': 0, 'tid': 0, 'args': {'step': step, 'n_calls': n_calls}})
+        starts = {step: start for name, start, _, step in self.events if name == 'make_step'}
+        for step, iterations in self.iterations.items():
+            if step in starts:
+                trace.append({'name': 'iterations', 'ph': 'C', 'ts': 1e6*starts[step], 'pid': 0,
+                              'args': {'iter_count': iterations}})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
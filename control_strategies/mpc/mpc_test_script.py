@@ -5,9 +5,10 @@ import math
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import time
-from global_vars_mpc import tvp
-from global_vars_mpc import global_simulator
-from global_vars_mpc import mpc_global_controller
+from global_vars_mpc import default_context
+from global_vars_mpc import mpc_options
+from warm_start import WarmStart
+from mpc_profiler import StepProfiler
 
 
 
@@ -18,13 +19,23 @@ with open("control_strategies/mpc/12_states_nonlin_sim.py") as f:
     exec(f.read())
 
 
-mpc_controller = mpc_global_controller.controller
-simulator = global_simulator.sim
-estimator = global_simulator.est
+tvp = default_context.tvp
+mpc_controller = default_context.controller
+simulator = default_context.sim
+estimator = default_context.est
 
 mpc_controller.set_initial_guess()
 simulator.set_initial_guess()
 
+warm_start = None
+if mpc_options.warm_start and mpc_options.backend == 'ipopt':
+    warm_start = WarmStart(mpc_controller)
+
+profiler = None
+if mpc_options.profile:
+    profiler = StepProfiler(mpc_controller, warm_start.make_step if warm_start is not None else None)
+    profiler.wrap(warm_start, 'shift', 'warm_start_shift')
+
 dt = .04
 curr_roll = 0.0
 curr_pitch =0.0
@@ -48,20 +59,33 @@ for target_vel in desired_velocities:
     for i in range(40):
         start = time.time()
         
-        u0 = mpc_controller.make_step(x0)
+        if profiler is not None:
+            u0 = profiler.make_step(x0)
+        elif warm_start is not None:
+            u0 = warm_start.make_step(x0)
+        else:
+            u0 = mpc_controller.make_step(x0)
 
         end = time.time()
         print("Computation time: ", end-start)
+        if warm_start is not None:
+            print("IPOPT iterations: ", warm_start.iterations[-1])
         
-        ynext= simulator.make_step(u0)
-        x0 = estimator.make_step(ynext)
+        if profiler is not None:
+            with profiler.phase('simulator'):
+                ynext = simulator.make_step(u0)
+                x0 = estimator.make_step(ynext)
+        else:
+            ynext= simulator.make_step(u0)
+            x0 = estimator.make_step(ynext)
         print("sim")
         # sim is pos, theta, dpos, dtheta
         # controller is dpos, dtheta, theta, pos 
-        drone_acceleration = (np.array(x0[6:12]) - last_x0_dot )/dt
+        # tvp fields are preallocated, the acceleration estimate is written straight into its buffer
         tvp.x = x0
         tvp.u = u0
-        tvp.drone_accel = drone_acceleration
+        np.subtract(x0[6:12], last_x0_dot, out=tvp.drone_accel)
+        tvp.drone_accel /= dt
         print("target velocity is ", tvp.target_velocity)
         
         # print("u")
@@ -73,7 +97,18 @@ for target_vel in desired_velocities:
         # print("a")
         # print(drone_acceleration)
         print(i)
-        last_x0_dot = np.array(x0[6:12])
+        last_x0_dot[:] = x0[6:12]
+
+if warm_start is not None:
+    iterations = np.array(warm_start.iterations).reshape(len(desired_velocities), -1)
+    for target_vel, target_iterations in zip(desired_velocities, iterations):
+        print("target velocity", target_vel, "IPOPT iterations: first", target_iterations[0],
+              "mean", target_iterations.mean(), "max", target_iterations.max())
+
+if profiler is not None:
+    print(profiler.summary())
+    profiler.save_chrome_trace(mpc_options.profile)
+    print("Chrome trace written to", mpc_options.profile)
 
 fig, ax = plt.subplots()
 
@@ -0,0 +1,21 @@
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+from closed_loop import build, closed_loop_latency, latency_summary, dt
+
+# Per-step latency of the linearized tilt-rotor MPC solved by IPOPT over the collocated DAE
+# vs. the structured QP backend (linear_qp_controller.LinearQPController).
+# Run from the repository root: python control_strategies/mpc/qp_benchmark.py [n_steps]
+
+if __name__ == '__main__':
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    for backend in ("ipopt", "qp"):
+        start = time.time()
+        mpc_controller, simulator, estimator = build(backend=backend)
+        print("%-12s setup %.2f s" % (backend, time.time() - start))
+        latency = closed_loop_latency(mpc_controller, simulator, estimator, n_steps, [0.2, 0.0, 0.0])
+        print(latency_summary(backend, latency))
+    print("t_step budget: %.1f ms" % (1e3*dt))
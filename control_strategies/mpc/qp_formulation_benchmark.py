@@ -0,0 +1,48 @@
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from closed_loop import build, closed_loop_latency, dt
+from global_vars_mpc import MPCContext
+
+# Per-step solve time of the QP backend with the sparse (states and inputs as variables) and the condensed
+# (inputs only, states eliminated) formulation over horizons 4 to 100, on the velocity step of
+# qp_benchmark.py. Also checks the first input of both against the exact solution of the same QP, the condensed
+# problem solved by the active set solver qpOASES, so the column measures the formulation and its solver settings.
+# Run from the repository root:
+#   python control_strategies/mpc/qp_formulation_benchmark.py [n_steps] [condensed_qpsol ...]
+
+horizons = (1, 2, 3, 4, 10, 20, 50, 100)
+
+
+def run(n_horizon, formulation, n_steps, **settings):
+    mpc_controller, simulator, estimator = build(MPCContext(), backend='qp', n_horizon=n_horizon,
+                                                 qp_formulation=formulation)
+    if settings:
+        mpc_controller.set_param(**settings)
+        mpc_controller.setup()
+    latency = closed_loop_latency(mpc_controller, simulator, estimator, n_steps, [0.2, 0.0, 0.0])
+    n_w = mpc_controller.lbw.size
+    return 1e3*latency[1:], n_w, mpc_controller.n_g, mpc_controller.data['_u'][0]
+
+
+if __name__ == '__main__':
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    solvers = sys.argv[2:] or [None]
+    print("horizon | formulation          | variables | constraints | p50 ms | p95 ms | max |u0 - u0_exact|")
+    for n_horizon in horizons:
+        u_exact = run(n_horizon, 'condensed', 1, condensed_qpsol='qpoases')[3]
+        latency, n_w, n_g, u0 = run(n_horizon, 'sparse', n_steps)
+        print("%7d | %-20s | %9d | %11d | %6.2f | %6.2f | %.1e" % (n_horizon, 'sparse', n_w, n_g,
+                                                                 np.percentile(latency, 50), np.percentile(latency, 95),
+                                                                 np.max(np.abs(u0 - u_exact))))
+        for qpsol in solvers:
+            settings = {'condensed_qpsol': qpsol} if qpsol else {}
+            latency, n_w, n_g, u0 = run(n_horizon, 'condensed', n_steps, **settings)
+            name = 'condensed' + (' (%s)' % qpsol if qpsol else '')
+            print("%7d | %-20s | %9d | %11d | %6.2f | %6.2f | %.1e" % (n_horizon, name, n_w, n_g,
+                                                                     np.percentile(latency, 50), np.percentile(latency, 95),
+                                                                     np.max(np.abs(u0 - u_exact))))
+    print("t_step budget: %.1f ms" % (1e3*dt))
@@ -0,0 +1,168 @@
+import time
+
+import numpy as np
+from casadi import *
+
+from linear_qp_controller import LinearQPController
+
+
+def rk4_step(dynamics, n_x, n_u, t_step, n_substeps=1):
+    """casadi Function (x, u) -> x_next taking n_substeps RK4 steps of dynamics over t_step."""
+    x = SX.sym('x', n_x)
+    u = SX.sym('u', n_u)
+    h = t_step/n_substeps
+    x_next = x
+    for _ in range(n_substeps):
+        k1 = dynamics(x_next, u)
+        k2 = dynamics(x_next + h/2*k1, u)
+        k3 = dynamics(x_next + h/2*k2, u)
+        k4 = dynamics(x_next + h*k3, u)
+        x_next = x_next + h/6*(k1 + 2*k2 + 2*k3 + k4)
+    return Function('rk4_step', [x, u], [x_next], ['x', 'u'], ['x_next'])
+
+
+class RTIController(LinearQPController):
+    """Real-time iteration MPC on the nonlinear model: one Gauss-Newton SQP iteration per step.
+
+    dynamics is the nonlinear model as a casadi Function (x, u) -> xdot; the do_mpc model still
+    provides the objective, tvp layout and bounds, configured like the other backends. The horizon is
+    multiple shooting over an RK4 discretization, linearized along the previous solution shifted by
+    one stage. The objective has to be quadratic in x and u, so its Gauss-Newton Hessian is exact.
+
+    Each step is split in two phases. prepare() linearizes all stages, which needs no measurement,
+    and runs right after the previous feedback. feedback(x0) only embeds the measured state in the
+    prepared QP and solves it. make_step does both and records t_feedback and t_preparation in data.
+    When the QP fails, feedback applies and linearizes along the previous solution shifted by one stage.
+    """
+
+    def __init__(self, model, dynamics):
+        LinearQPController.__init__(self, model)
+        self.dynamics = dynamics
+        self.settings.update({'n_substeps': 1})
+        self.prepared = None
+
+    def set_param(self, **kwargs):
+        LinearQPController.set_param(self, **kwargs)
+        if 'n_substeps' in kwargs:
+            self.settings['n_substeps'] = kwargs['n_substeps']
+
+    def _build_qp(self):
+        model = self.model
+        n_x, n_u, n_tvp, n_p = model.n_x, model.n_u, model.n_tvp, model.n_p
+        N = self.n_horizon
+
+        # stage linearizations of the discretized dynamics, all stages in one mapped call
+        x = SX.sym('x', n_x)
+        u = SX.sym('u', n_u)
+        x_next = rk4_step(self.dynamics, n_x, n_u, self.t_step, self.settings['n_substeps'])(x, u)
+        stage = Function('stage', [x, u], [x_next, jacobian(x_next, x), jacobian(x_next, u)])
+        self.linearize_stages = stage.map(N)
+
+        X = SX.sym('X', n_x, N)
+        U = SX.sym('U', n_u, N)
+        x_init = SX.sym('x_init', n_x)
+        u_prev = SX.sym('u_prev', n_u)
+        x_bar = SX.sym('x_bar', n_x, N)
+        u_bar = SX.sym('u_bar', n_u, N)
+        F = SX.sym('F', n_x, N)
+        A = SX.sym('A', n_x, n_x*N)
+        B = SX.sym('B', n_x, n_u*N)
+        tvp = SX.sym('tvp', n_tvp, N+1)
+        p = SX.sym('p', n_p)
+
+        rterm = DM(self.rterm_factor.cat)
+        J = 0
+        g = []
+        x_k = x_init
+        u_last = u_prev
+        for k in range(N):
+            u_k = U[:, k]
+            J += self.lterm_fun(x_k, u_k, tvp[:, k], p)
+            J += sum1(rterm*(u_k - u_last)**2)
+            A_k = A[:, k*n_x:(k+1)*n_x]
+            B_k = B[:, k*n_u:(k+1)*n_u]
+            g.append(X[:, k] - (F[:, k] + mtimes(A_k, x_k - x_bar[:, k]) + mtimes(B_k, u_k - u_bar[:, k])))
+            x_k = X[:, k]
+            u_last = u_k
+        J += self.mterm_fun(x_k, tvp[:, N], p)
+
+        w = vertcat(vec(X), vec(U))
+        params = vertcat(x_init, u_prev, vec(x_bar), vec(u_bar), vec(F), vec(A), vec(B), vec(tvp), p)
+        if not is_quadratic(J, w):
+            raise ValueError("the objective is not quadratic in the states and inputs")
+        qp = {'x': w, 'f': J, 'g': vertcat(*g), 'p': params}
+        self.S = qpsol('S', self.settings['qpsol'], qp, self._qpsol_opts(self.settings['qpsol']))
+
+        self.n_g = n_x*N
+        lb_x, ub_x = self.bounds.vector('lower', '_x'), self.bounds.vector('upper', '_x')
+        lb_u, ub_u = self.bounds.vector('lower', '_u'), self.bounds.vector('upper', '_u')
+        self.lbw = np.concatenate([np.tile(lb_x, N), np.tile(lb_u, N)])
+        self.ubw = np.concatenate([np.tile(ub_x, N), np.tile(ub_u, N)])
+        self.u_index = n_x*N
+
+    def setup(self):
+        self._build_qp()
+        self.flags['setup'] = True
+        self.set_initial_guess()
+
+    def set_initial_guess(self):
+        # linearize around the initial state held at the initial input
+        LinearQPController.set_initial_guess(self)
+        n_x, n_u, N = self.model.n_x, self.model.n_u, self.n_horizon
+        x0 = np.array(self.x0, dtype=float).reshape(-1)
+        self.x_bar = np.tile(x0.reshape(-1, 1), (1, N + 1))
+        self.u_bar = np.tile(self.u_prev.reshape(-1, 1), (1, N))
+        self.w_guess = np.concatenate([self.x_bar[:, 1:].ravel(order='F'), self.u_bar.ravel(order='F')])
+        if self.flags['setup']:
+            self.prepare()
+
+    def prepare(self):
+        """Preparation phase: linearize every stage along the current guess (no measurement needed)."""
+        start = time.perf_counter()
+        F, A, B = self.linearize_stages(self.x_bar[:, :-1], self.u_bar)
+        self.prepared = np.concatenate([self.x_bar[:, :-1].ravel(order='F'), self.u_bar.ravel(order='F'),
+                                        np.array(F).ravel(order='F'), np.array(A).ravel(order='F'),
+                                        np.array(B).ravel(order='F')])
+        self.t_preparation = time.perf_counter() - start
+
+    def feedback(self, x0):
+        """Feedback phase: embed the measured state in the prepared QP and solve it."""
+        start = time.perf_counter()
+        x0 = np.array(x0, dtype=float).reshape(-1)
+        tvp = self._stage_tvp(self.tvp_fun(self.t0)) if self.tvp_fun is not None else np.zeros((self.model.n_tvp, self.n_horizon+1))
+        p = np.zeros(self.model.n_p)
+        params = np.concatenate([x0, self.u_prev, self.prepared, tvp.ravel(order='F'), p])
+        sol = self.S(lbx=self.lbw, ubx=self.ubw, lbg=0, ubg=0, p=params, x0=self.w_guess)
+        self.solver_stats = self.S.stats()
+        if self.solver_stats.get('success', True):
+            w = np.array(sol['x']).ravel()
+        else:
+            # the next linearization would follow whatever the failed solve returned, continue along the
+            # previous solution shifted by one stage instead; data['success'] records the failure
+            w = self.w_guess.copy()
+        u0 = self._first_input(w)
+        self.t_feedback = time.perf_counter() - start
+        self._store_guess(x0, w)
+        return u0
+
+    def _store_guess(self, x0, w):
+        # the next linearization trajectory: this solution shifted by one stage, last stage repeated
+        n_x, n_u, N = self.model.n_x, self.model.n_u, self.n_horizon
+        X = w[:n_x*N].reshape(N, n_x).T
+        U = w[n_x*N:].reshape(N, n_u).T
+        self.x_bar[:, :-1] = X
+        self.x_bar[:, -1] = X[:, -1]
+        self.u_bar[:, :-1] = U[:, 1:]
+        self.u_bar[:, -1] = U[:, -1]
+        self.w_guess = self._shifted(w)
+
+    def make_step(self, x0):
+        start = time.time()
+        u0 = self.feedback(x0)
+        self.u_prev = u0.reshape(-1)
+        self.prepare()
+        self.data.update(_time=self.t0, _x=np.array(x0, dtype=float).reshape(-1), _u=u0, t_wall=time.time()-start,
+                         success=self.solver_stats.get('success', True),
+                         t_feedback=self.t_feedback, t_preparation=self.t_preparation)
+        self.t0 += self.t_step
+        return u0
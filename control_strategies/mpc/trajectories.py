@@ -0,0 +1,107 @@
+import numpy as np
+
+# Reference trajectories for the MPC scripts. Every trajectory is evaluated in closed form on an array
+# of times, so a tvp function can pull the n_horizon+1 stages it needs at t_now without building the
+# whole path: traj.window(t_now, t_step, n_horizon) -> pos, vel, acc, each (n_horizon+1, 3).
+
+
+class Trajectory:
+    """Position, velocity and acceleration references as vectorized functions of time.
+
+    fun(t) takes a 1-d array of times and returns pos, vel, acc as (len(t), 3) arrays.
+    """
+
+    def __init__(self, fun, duration=np.inf):
+        self.fun = fun
+        self.duration = duration
+
+    def sample(self, t):
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        return self.fun(t)
+
+    def window(self, t_now, t_step, n_horizon):
+        """References at t_now, t_now + t_step, ..., t_now + n_horizon*t_step."""
+        return self.sample(t_now + t_step*np.arange(n_horizon + 1))
+
+    def windows(self, t_step, n_horizon, t0=0.0, t_end=None):
+        """Lazily yield (t_now, pos, vel, acc) horizon windows, advancing one t_step per window."""
+        t_end = self.duration if t_end is None else t_end
+        k = 0
+        while t0 + k*t_step <= t_end:
+            t_now = t0 + k*t_step
+            yield (t_now,) + self.window(t_now, t_step, n_horizon)
+            k += 1
+
+    def waypoints(self, t_step, t_end=None):
+        """The whole path sampled every t_step, in one vectorized evaluation."""
+        t_end = self.duration if t_end is None else t_end
+        t = np.arange(int(round(t_end/t_step)) + 1)*t_step
+        return (t,) + self.sample(t)
+
+
+def _stack(*columns):
+    return np.stack(np.broadcast_arrays(*columns), axis=-1)
+
+
+def circle(radius=1.0, period=10.0, center=(0.0, 0.0, 0.0), phase=0.0):
+    """Horizontal circle around center, counter clockwise."""
+    return helix(radius, period, 0.0, center, phase)
+
+
+def helix(radius=1.0, period=10.0, climb_rate=0.1, center=(0.0, 0.0, 0.0), phase=0.0):
+    """Circle in the x-y plane around center, climbing at climb_rate (m/s) along z."""
+    w = 2*np.pi/period
+    cx, cy, cz = center
+
+    def fun(t):
+        c = np.cos(w*t + phase)
+        s = np.sin(w*t + phase)
+        pos = _stack(cx + radius*c, cy + radius*s, cz + climb_rate*t)
+        vel = _stack(-radius*w*s, radius*w*c, climb_rate)
+        acc = _stack(-radius*w**2*c, -radius*w**2*s, 0.0)
+        return pos, vel, acc
+    return Trajectory(fun)
+
+
+def lemniscate(size=1.0, period=10.0, center=(0.0, 0.0, 0.0)):
+    """Figure eight (lemniscate of Gerono) in the x-y plane, size is the half width along x."""
+    w = 2*np.pi/period
+    cx, cy, cz = center
+
+    def fun(t):
+        s1 = np.sin(w*t)
+        c1 = np.cos(w*t)
+        s2 = np.sin(2*w*t)
+        c2 = np.cos(2*w*t)
+        pos = _stack(cx + size*s1, cy + size/2*s2, cz)
+        vel = _stack(size*w*c1, size*w*c2, 0.0)
+        acc = _stack(-size*w**2*s1, -2*size*w**2*s2, 0.0)
+        return pos, vel, acc
+    return Trajectory(fun)
+
+
+def polyline(points, speed=0.5):
+    """Straight segments through points (n, 3) at constant speed, holding the last point at the end.
+
+    Velocity jumps at the corners, the acceleration reference is zero.
+    """
+    points = np.asarray(points, dtype=float)
+    segments = np.diff(points, axis=0)
+    lengths = np.linalg.norm(segments, axis=1)
+    keep = lengths > 0
+    segments, lengths = segments[keep], lengths[keep]
+    starts = points[:-1][keep]
+    t_knots = np.concatenate(([0.0], np.cumsum(lengths)/speed))
+    directions = segments/lengths[:, None]
+
+    def fun(t):
+        if len(lengths) == 0:
+            pos = np.broadcast_to(points[0], (len(t), 3)).copy()
+            return pos, np.zeros_like(pos), np.zeros_like(pos)
+        i = np.clip(np.searchsorted(t_knots, t, side='right') - 1, 0, len(lengths) - 1)
+        tau = np.clip(t - t_knots[i], 0.0, lengths[i]/speed)
+        pos = starts[i] + directions[i]*speed*tau[:, None]
+        moving = (t >= t_knots[0]) & (t < t_knots[-1])
+        vel = directions[i]*speed*moving[:, None]
+        return pos, vel, np.zeros_like(pos)
+    return Trajectory(fun, duration=t_knots[-1])
@@ -0,0 +1,84 @@
+import argparse
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from closed_loop import build
+from closed_loop_benchmark import run_scenario, scenarios
+from drone_dynamics import dynamics
+from dynamics_benchmark import n_instructions
+from global_vars_mpc import MPCContext
+
+# Accuracy/latency sweep over the sin/cos approximation of the controller model (mpc_options.trig_order):
+# Taylor series of order 1, 3 and 5 and exact trigonometry. For every order the closed loop scenarios of
+# closed_loop_benchmark.py report solve time and velocity tracking, and the model mismatch: RMS difference of
+# the accelerations of the approximated model and of the exact one (the nonlinear simulator's) at the states
+# and inputs the closed loop visited. The summary averages over the scenarios and marks the Pareto optimal
+# orders in solve time against tracking error.
+# Run from the repository root:
+#   python control_strategies/mpc/trig_order_benchmark.py [--backend ipopt|qp|rti] [--orders 1 3 5 exact] [scenario ...]
+
+
+def parse_order(order):
+    return None if order == 'exact' else int(order)
+
+
+def format_order(order):
+    return 'exact' if order is None else str(order)
+
+
+def acceleration_mismatch(trig_order, x, u):
+    """RMS of the acceleration difference between the trig_order model and the exact one at the rows of x, u."""
+    model = dynamics(trig_order=trig_order).accelerations.map(x.shape[0])
+    exact = dynamics().accelerations.map(x.shape[0])
+    error = np.array(model(x.T, u.T)) - np.array(exact(x.T, u.T))
+    return np.sqrt(np.mean(np.sum(error**2, axis=0)))
+
+
+def pareto_front(points):
+    """Indices of the points no other point beats in both coordinates."""
+    return [i for i, (a, b) in enumerate(points)
+            if not any(c <= a and d <= b and (c, d) != (a, b) for c, d in points)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="trig approximation order sweep of the controller model")
+    parser.add_argument('scenarios', nargs='*', help="any of %s, default: hover step_velocity desired_velocity_1"
+                        % ", ".join(scenarios))
+    parser.add_argument('--backend', default='ipopt', choices=('ipopt', 'qp', 'rti'))
+    parser.add_argument('--orders', nargs='+', default=['1', '3', '5', 'exact'])
+    args = parser.parse_args()
+    names = args.scenarios or ['hover', 'step_velocity', 'desired_velocity_1']
+    orders = [parse_order(order) for order in args.orders]
+
+    for order in orders:
+        if args.backend == 'ipopt':
+            mpc_controller, _, _ = build(MPCContext(), backend=args.backend, trig_order=order)
+            nlp = mpc_controller.nlp
+            print("order %-5s model alg %5d instructions, NLP g %6d instructions" % (
+                format_order(order), mpc_controller.model._alg_fun.n_instructions(),
+                n_instructions([nlp['x'], nlp['p']], [nlp['g']])))
+
+    print("%-20s %-6s %7s %7s %6s %12s %14s" % ("scenario", "order", "p50 ms", "p95 ms", "iter", "rmse m/s",
+                                              "mismatch m/s2"))
+    summary = {order: [] for order in orders}
+    for name in names:
+        for order in orders:
+            history = {}
+            metrics = run_scenario(name, args.backend, history=history, trig_order=order)
+            mismatch = acceleration_mismatch(order, history['x'], history['u'])
+            summary[order].append((metrics['solve_ms_p50'], metrics['tracking_rmse'], mismatch))
+            iterations = "-" if metrics['iterations_mean'] is None else "%.1f" % metrics['iterations_mean']
+            print("%-20s %-6s %7.2f %7.2f %6s %12.4f %14.2e%s" % (
+                name, format_order(order), metrics['solve_ms_p50'], metrics['solve_ms_p95'], iterations,
+                metrics['tracking_rmse'], mismatch,
+                "  diverged after %d steps" % metrics['completed_steps'] if metrics['diverged'] else ""))
+
+    means = [np.mean(summary[order], axis=0) for order in orders]
+    front = pareto_front([(mean[0], mean[1]) for mean in means])
+    print("\nmean over %d scenarios" % len(names))
+    print("%-6s %7s %12s %14s" % ("order", "p50 ms", "rmse m/s", "mismatch m/s2"))
+    for i, (order, mean) in enumerate(zip(orders, means)):
+        print("%-6s %7.2f %12.4f %14.2e%s" % (format_order(order), mean[0], mean[1], mean[2],
+                                            "  pareto" if i in front else ""))
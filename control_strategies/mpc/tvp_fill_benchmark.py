@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import do_mpc
+from casadi.tools import struct_symSX, entry
+
+from global_vars_mpc import TVPData, x0, u0, drone_acceleration, target_velocity
+from horizon_tvp import HorizonTVP
+
+# Cost of filling the controller tvp template at horizons 4, 20 and 100: per-stage struct assignment
+# (the old tvp function, looping over every stage), HorizonTVP's one-shot write of the latest data and
+# of a per-stage target velocity preview, and reading the stages back as the QP controller does.
+# Run from the repository root: python control_strategies/mpc/tvp_fill_benchmark.py
+
+
+class _Controller:
+    # just enough of a controller for HorizonTVP: the model and the do_mpc tvp template layout
+    def __init__(self, model, n_horizon):
+        self.model = model
+        self.n_horizon = n_horizon
+
+    def get_tvp_template(self):
+        return struct_symSX([entry('_tvp', repeat=self.n_horizon+1, struct=self.model.tvp)])(0)
+
+
+def controller_model():
+    model = do_mpc.model.Model('continuous')
+    x = model.set_variable('_x', 'x', (12, 1))
+    model.set_variable('_tvp', 'last_state', (12, 1))
+    model.set_variable('_tvp', 'last_input', (8, 1))
+    model.set_variable('_tvp', 'last_acc', (6, 1))
+    model.set_variable('_tvp', 'target_velocity', (3, 1))
+    model.set_rhs('x', -x)
+    model.setup()
+    return model
+
+
+def timed(fun, repeat=2000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fun()
+    return (time.perf_counter() - start)/repeat
+
+
+if __name__ == '__main__':
+    model = controller_model()
+    tvp = TVPData(x0, u0, drone_acceleration, target_velocity)
+    print("horizon | per-stage struct | one-shot | one-shot + preview | stages (struct) | stages (reshape)")
+    for n_horizon in (4, 20, 100):
+        controller = _Controller(model, n_horizon)
+        template = controller.get_tvp_template()
+
+        def per_stage(t_now=0.0):
+            for k in range(n_horizon+1):
+                template['_tvp', k, 'last_state'] = tvp.x
+                template['_tvp', k, 'last_input'] = tvp.u
+                template['_tvp', k, 'last_acc'] = tvp.drone_accel
+                template['_tvp', k, 'target_velocity'] = tvp.target_velocity
+            return template
+
+        one_shot = HorizonTVP(controller, tvp)
+        preview = HorizonTVP(controller, tvp)
+        profile = np.linspace(0.0, 1.0, n_horizon+1)[:, None]*[1.0, 0.5, 0.0]
+        preview.preview('target_velocity', profile)
+        assert np.allclose(np.array(per_stage().master), np.array(one_shot(0.0).master))
+
+        filled = one_shot(0.0)
+        struct_stages = lambda: np.hstack([np.array(filled['_tvp', k]).reshape(-1, 1) for k in range(n_horizon+1)])
+        reshape_stages = lambda: np.array(filled.master).reshape(n_horizon+1, model.n_tvp).T
+        assert np.array_equal(struct_stages(), reshape_stages())
+
+        repeat = 20000//(n_horizon+1)
+        print("%7d | %13.1f us | %5.1f us | %15.1f us | %12.1f us | %13.1f us" % (
+            n_horizon, 1e6*timed(per_stage, repeat), 1e6*timed(lambda: one_shot(0.0), repeat),
+            1e6*timed(lambda: preview(0.0), repeat), 1e6*timed(struct_stages, repeat),
+            1e6*timed(reshape_stages, repeat)))
@@ -0,0 +1,90 @@
+import numpy as np
+from casadi import DM
+
+
+# IPOPT only uses the multipliers passed by casadi (lam_x0, lam_g0) with warm_start_init_point. The
+# small bound pushes keep the shifted guess where it is instead of moving it into the interior, and
+# a small initial barrier parameter avoids re-solving the already converged part of the problem.
+warm_start_opts = {
+    'ipopt.warm_start_init_point': 'yes',
+    'ipopt.warm_start_bound_push': 1e-8,
+    'ipopt.warm_start_bound_frac': 1e-8,
+    'ipopt.warm_start_slack_bound_push': 1e-8,
+    'ipopt.warm_start_slack_bound_frac': 1e-8,
+    'ipopt.warm_start_mult_bound_push': 1e-8,
+    'ipopt.mu_init': 1e-5,
+}
+
+
+def _copy_stage(struct, name, src, dst):
+    # the stage entries of do_mpc's opt_x are nested lists over scenarios and collocation points
+    def copy(index):
+        value = struct[(name, src) + index]
+        if isinstance(value, list):
+            for i in range(len(value)):
+                copy(index + (i,))
+        else:
+            struct[(name, dst) + index] = value
+    copy(())
+
+
+def shift_struct(struct):
+    """Shift every staged entry of an opt_x shaped struct one stage forward, repeating the last stage."""
+    for name in struct.keys():
+        stages = struct[name]
+        if not isinstance(stages, list):
+            continue
+        for k in range(len(stages) - 1):
+            _copy_stage(struct, name, k + 1, k)
+
+
+def shift_stage_blocks(values, n_head, n_stages):
+    """Shift a vector laid out as [head, stage_0, ..., stage_{n-1}] by one stage.
+
+    do_mpc orders its constraints as the initial state constraint (n_x rows) followed by one equally
+    sized block per stage. A vector that does not fit that layout raises ValueError, shifting it
+    blockwise anyway would hand IPOPT multipliers of the wrong constraints.
+    """
+    values = np.array(values, dtype=float).ravel()
+    n_stage = (values.size - n_head)//n_stages
+    if n_stage <= 0 or n_head + n_stage*n_stages != values.size:
+        raise ValueError("%d constraints do not split into a head of %d and %d equal stage blocks"
+                         % (values.size, n_head, n_stages))
+    stages = values[n_head:].reshape(n_stages, n_stage)
+    stages[:-1] = stages[1:].copy()
+    return values
+
+
+class WarmStart:
+    """Seeds each do_mpc make_step with the previous primal/dual solution shifted by one stage.
+
+    The shift is the same permutation every step: it is found once by shifting the entry indices with
+    shift_struct / shift_stage_blocks and then applied to opt_x, lam_x and lam_g as numpy gathers.
+    """
+
+    def __init__(self, mpc):
+        self.mpc = mpc
+        self.n_horizon = len(mpc.opt_x_num['_u'])
+        n_x = mpc.opt_x.shape[0]
+        index = mpc.opt_x(DM(np.arange(n_x, dtype=float)))
+        shift_struct(index)
+        self.x_perm = np.array(index.cat, dtype=int).ravel()
+        n_g = mpc.nlp_cons_lb.shape[0]
+        self.g_perm = shift_stage_blocks(np.arange(n_g), mpc.model.n_x, self.n_horizon).astype(int)
+        self.solved = False
+        self.iterations = []
+
+    def shift(self):
+        mpc = self.mpc
+        # lam_x has the layout of opt_x
+        mpc.opt_x_num.master = DM(np.array(mpc.opt_x_num.cat).ravel()[self.x_perm])
+        mpc.lam_x_num = DM(np.array(mpc.lam_x_num).ravel()[self.x_perm])
+        mpc.lam_g_num = DM(np.array(mpc.lam_g_num).ravel()[self.g_perm])
+
+    def make_step(self, x0):
+        if self.solved:
+            self.shift()
+        u0 = self.mpc.make_step(x0)
+        self.solved = True
+        self.iterations.append(self.mpc.solver_stats['iter_count'])
+        return u0
@@ -0,0 +1,162 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+import mujoco as mj
+import numpy as np
+
+from design.design_cache import cached_model
+from design.make_design import load_grid
+
+# hover rollout: start at hover_height tilted by tilt0 about x, with contacts off so that only the
+# thrust allocation and the rigid body dynamics are scored
+hover_height = 1.0
+tilt0 = np.deg2rad(1.0)
+n_steps = 100
+max_stable_tilt = np.deg2rad(30.0)
+
+columns = ['name', 'mass', 'com', 'inertia', 'n_thrusters', 'hover_thrust', 'thruster_forces',
+           'allocation_residual', 'drift', 'max_tilt', 'max_rate', 'stable', 'error']
+
+
+def thruster_positions(grid):
+    nodes = load_grid(grid)['NODES']
+    return np.array([pos for name, pos in nodes.items() if 'thruster' in name], dtype=float).reshape(-1, 3)
+
+
+def hover_allocation(mass, gravity, arms):
+    """Vertical thrust per thruster that carries the weight without a roll or pitch moment.
+
+    arms are the thruster positions relative to the center of mass (n, 3). Returns the minimum norm
+    solution and the residual of [sum f - m g, sum f y, -sum f x].
+    """
+    A = np.vstack((np.ones(len(arms)), arms[:, 1], -arms[:, 0]))
+    b = np.array([mass * gravity, 0.0, 0.0])
+    forces = np.linalg.lstsq(A, b, rcond=None)[0]
+    return forces, np.linalg.norm(A @ forces - b)
+
+
+def hover_rollout(model, body, arms, forces, n_steps=n_steps):
+    """Open loop hover with the allocated thrust applied at every thruster through mj_applyFT."""
+    model.opt.disableflags |= mj.mjtDisableBit.mjDSBL_CONTACT
+    data = mj.MjData(model)
+    qpos = model.jnt_qposadr[model.body_jntadr[body]]
+    data.qpos[qpos:qpos + 3] = [0.0, 0.0, hover_height]
+    data.qpos[qpos + 3:qpos + 7] = [np.cos(tilt0 / 2), np.sin(tilt0 / 2), 0.0, 0.0]
+    mj.mj_forward(model, data)
+
+    com0 = data.xipos[body].copy()
+    max_tilt = 0.0
+    max_rate = 0.0
+    torque = np.zeros(3)
+    for _ in range(n_steps):
+        data.qfrc_applied[:] = 0.0
+        R = data.xmat[body].reshape(3, 3)
+        for arm, f in zip(arms, forces):
+            mj.mj_applyFT(model, data, f * R[:, 2], torque, data.xipos[body] + R @ arm, body, data.qfrc_applied)
+        mj.mj_step(model, data)
+        max_tilt = max(max_tilt, np.arccos(np.clip(data.xmat[body][8], -1.0, 1.0)))
+        max_rate = max(max_rate, np.linalg.norm(data.cvel[body][:3]))
+    drift = np.linalg.norm(data.xipos[body] - com0)
+    return drift, max_tilt, max_rate
+
+
+def evaluate(item):
+    """One results row for a (name, grid) pair, errors are reported in the row instead of raised."""
+    name, grid = item
+    row = dict(name=name, mass=np.nan, com=np.full(3, np.nan), inertia=np.full((3, 3), np.nan), n_thrusters=0,
+               hover_thrust=np.nan, thruster_forces=np.zeros(0), allocation_residual=np.nan, drift=np.nan,
+               max_tilt=np.nan, max_rate=np.nan, stable=False, error='')
+    try:
+        model = cached_model(grid, free=True)
+        body = model.body('uav').id
+        positions = thruster_positions(grid)
+
+        # the design is a single body, its inertia tensor follows from the principal axes
+        R = np.zeros(9)
+        mj.mju_quat2Mat(R, model.body_iquat[body])
+        R = R.reshape(3, 3)
+        row['mass'] = model.body_mass[body]
+        row['com'] = model.body_ipos[body].copy()
+        row['inertia'] = R @ np.diag(model.body_inertia[body]) @ R.T
+        row['n_thrusters'] = len(positions)
+        if len(positions) == 0:
+            raise ValueError('design has no thrusters')
+
+        gravity = -model.opt.gravity[2]
+        arms = positions - row['com']
+        forces, residual = hover_allocation(row['mass'], gravity, arms)
+        row['hover_thrust'] = row['mass'] * gravity
+        row['thruster_forces'] = forces
+        row['allocation_residual'] = residual
+
+        drift, max_tilt, max_rate = hover_rollout(model, body, arms, forces)
+        row['drift'] = drift
+        row['max_tilt'] = max_tilt
+        row['max_rate'] = max_rate
+        row['stable'] = bool(np.isfinite(max_tilt) and max_tilt < max_stable_tilt)
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    return row
+
+
+def iter_designs(sources):
+    """(name, grid) pairs from grid json files, directories of them, or '-' for one json grid per stdin line."""
+    for source in sources:
+        if source == '-':
+            for i, line in enumerate(sys.stdin):
+                if line.strip():
+                    grid = json.loads(line)
+                    yield grid.pop('name', 'stdin_%d' % i), grid
+            continue
+        path = Path(source)
+        for file in sorted(path.glob('*.json')) if path.is_dir() else [path]:
+            yield str(file), load_grid(str(file))
+
+
+def to_columns(rows):
+    """Stack result rows into one array per column, thruster forces are NaN padded to the widest design."""
+    n_max = max([len(row['thruster_forces']) for row in rows] + [0])
+    out = {}
+    for column in columns:
+        values = [row[column] for row in rows]
+        if column == 'thruster_forces':
+            padded = np.full((len(rows), n_max), np.nan)
+            for i, forces in enumerate(values):
+                padded[i, :len(forces)] = forces
+            out[column] = padded
+        elif column in ('name', 'error'):
+            out[column] = np.array(values, dtype=str)
+        else:
+            out[column] = np.array(values)
+    return out
+
+
+def run(designs, n_workers=None, chunksize=4):
+    """Evaluate an iterable of (name, grid) pairs in a process pool, returns the columns and the wall time."""
+    n_workers = n_workers or os.cpu_count()
+    start = time.perf_counter()
+    if n_workers == 1:
+        rows = [evaluate(item) for item in designs]
+    else:
+        with multiprocessing.Pool(n_workers) as pool:
+            rows = list(pool.imap(evaluate, designs, chunksize))
+    return to_columns(rows), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="score grid designs: mass, inertia, hover thrust and a hover rollout")
+    parser.add_argument('sources', nargs='+', help="grid json files, directories of them, or - for json lines on stdin")
+    parser.add_argument('--out', default='design_results.npz', help="columnar output (numpy npz, one array per column)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    results, elapsed = run(iter_designs(args.sources), args.workers)
+    np.savez(args.out, **results)
+    n = len(results['name'])
+    print("%d designs in %.2f s (%.1f designs/s), %d stable, %d failed -> %s"
+          % (n, elapsed, n / elapsed, results['stable'].sum(), (results['error'] != '').sum(), args.out))
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+# designs per second of the batch pipeline for 1..num_cores workers on the design cache sweep,
+# after one pass that fills a fresh MJB cache
+os.environ['DESIGN_CACHE_DIR'] = tempfile.mkdtemp()
+
+from design.batch_designs import run
+from design.design_cache_benchmark import sweep
+
+n_designs = 100
+
+
+if __name__ == '__main__':
+    designs = [('sweep_%d' % i, grid) for i, grid in enumerate(sweep()[:n_designs])]
+    _, cold = run(designs, n_workers=1)
+    print("%d designs, %d cores, cold cache with 1 worker: %.2f s (%.1f designs/s)"
+          % (len(designs), os.cpu_count(), cold, len(designs) / cold))
+    base = None
+    for n_workers in range(1, os.cpu_count() + 1):
+        results, elapsed = run(designs, n_workers)
+        base = base or elapsed
+        print("workers %2d: %6.2f s, %6.1f designs/s, speedup %.2fx, %d stable"
+              % (n_workers, elapsed, len(designs) / elapsed, base / elapsed, results['stable'].sum()))
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import mujoco as mj
+from dm_control import mjcf, mujoco
+
+from design import make_design
+from design.make_design import Design, env_model_path, load_grid
+import examples.components.fuselage
+import examples.components.thruster
+import examples.components.tubes
+
+# Compiled designs are stored as MJB files next to this module unless DESIGN_CACHE_DIR points elsewhere
+# (e.g. a directory shared between sweep workers).
+cache_dir = Path(os.environ.get('DESIGN_CACHE_DIR', Path(__file__).parent / '.design_cache'))
+
+# everything besides the grid that ends up in the compiled model: the component defaults, the
+# grid parsing (arm quats) and the environment the design is attached to
+_sources = [
+    examples.components.fuselage.__file__,
+    examples.components.thruster.__file__,
+    examples.components.tubes.__file__,
+    make_design.__file__,
+    env_model_path,
+]
+
+
+def design_key(grid, free=False):
+    """Content hash of a grid design (path or parsed dict) plus component defaults, environment and MuJoCo version."""
+    h = hashlib.sha256()
+    h.update(json.dumps({'grid': load_grid(grid), 'free': free}, sort_keys=True).encode())
+    for source in _sources:
+        with open(source, 'rb') as f:
+            h.update(f.read())
+    h.update(mj.__version__.encode())
+    return h.hexdigest()[:16]
+
+
+def design_path(key):
+    return cache_dir / ('design_' + key + '.mjb')
+
+
+def compile_design(grid, free=False):
+    """Build the mjcf tree for a grid design and compile it, returns the MjModel."""
+    design = Design(free)
+    design.parse_grid(grid)
+    return mjcf.Physics.from_mjcf_model(design.model).model.ptr
+
+
+def cached_model(grid, use_cache=True, free=False):
+    """MjModel of a grid design, loaded from the MJB cache when the same design was compiled before.
+
+    free=True gives the design body a free joint so that it can be simulated.
+    """
+    if not use_cache:
+        return compile_design(grid, free)
+    path = design_path(design_key(grid, free))
+    if path.exists():
+        return mj.MjModel.from_binary_path(str(path))
+    model = compile_design(grid, free)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # write to a temporary name first so that concurrent workers never load a half written file
+    tmp_path = path.with_suffix('.' + str(os.getpid()) + '.tmp')
+    mj.mj_saveModel(model, str(tmp_path), None)
+    os.replace(tmp_path, path)
+    return model
+
+
+def cached_physics(grid, use_cache=True, free=False):
+    """dm_control Physics of a grid design, see cached_model."""
+    return mujoco.Physics.from_model(cached_model(grid, use_cache, free))
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# sweep of perturbed copies of example_quad.json in which each layout recurs several times, compiled
+# once without the cache and once through a fresh MJB cache
+n_unique = 20
+n_designs = 200
+
+
+def sweep(seed=0):
+    from design.make_design import load_grid, quad_model
+    rng = np.random.default_rng(seed)
+    base = load_grid(quad_model)
+    unique = []
+    for _ in range(n_unique):
+        grid = {'EDGES': base['EDGES'], 'NODES': {}}
+        for name, pos in base['NODES'].items():
+            scale = 1.0 if name == 'core' else rng.uniform(0.8, 1.5)
+            grid['NODES'][name] = [round(scale * p, 4) for p in pos]
+        unique.append(grid)
+    return [unique[i] for i in rng.integers(0, n_unique, n_designs)]
+
+
+def timed(grids, use_cache):
+    from design.design_cache import cached_model
+    start = time.perf_counter()
+    inertias = []
+    for grid in grids:
+        model = cached_model(grid, use_cache=use_cache)
+        inertias.append(np.hstack((model.body_mass, model.body_inertia.ravel())))
+    return time.perf_counter() - start, np.array(inertias)
+
+
+if __name__ == '__main__':
+    os.environ['DESIGN_CACHE_DIR'] = tempfile.mkdtemp()
+    grids = sweep()
+    uncached, reference = timed(grids, use_cache=False)
+    cold, _ = timed(grids, use_cache=True)
+    warm, inertias = timed(grids, use_cache=True)
+    same = np.array_equal(reference, inertias)
+    print("%d designs, %d unique layouts" % (n_designs, n_unique))
+    print("no cache:             %7.3f s (%.2f ms/design)" % (uncached, 1e3 * uncached / n_designs))
+    print("cache, first sweep:   %7.3f s (%.2f ms/design)" % (cold, 1e3 * cold / n_designs))
+    print("cache, repeat sweep:  %7.3f s (%.2f ms/design)" % (warm, 1e3 * warm / n_designs))
+    print("compile time saved on the first sweep: %.0f%%, cached models identical: %s"
+          % (100 * (1 - cold / uncached), same))
@@ -9,20 +9,30 @@ from pathlib import Path
 env_model_path = Path(__file__).parent / "environment.xml"
 quad_model = Path(__file__).parent /  "example_quad.json"
 
+def load_grid(path):
+    if isinstance(path, dict):
+        return path
+    f = open(path)
+    data = json.load(f)
+    f.close()
+    return data
+
+
 class Design:
     body: str
     model: mjcf.RootElement
 
-    def __init__(self):
+    def __init__(self, free=False):
         self.model = mjcf.from_file(env_model_path)
-        self.body = self.model.worldbody.add('body')
+        self.body = self.model.worldbody.add('body', name='uav')
+        if free:
+            # let the design fly instead of being welded to the world, needed for rollouts
+            self.body.add('freejoint')
 
     def parse_grid(self, path):
         """TODO: figure out how to determine quats from grid representation and add sensors/sites/actuators"""
-        # load json with grid data
-        f = open(path)
-        data = json.load(f)
-        f.close()
+        # load json with grid data, sweeps may also pass the parsed dict directly
+        data = load_grid(path)
 
         quats = [
             [.924, 0.0, 0.0, 0.483],
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import mujoco as mj
+import numpy as np
+
+
+def headless_args(simend):
+    # command line switches shared by the GLFW scripts, unknown arguments are left alone
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--headless", action="store_true", help="step without a window")
+    parser.add_argument("--simend", type=float, default=simend, help="simulated seconds to run")
+    parser.add_argument("--render-every", type=int, default=0,
+                        help="render offscreen every n physics steps (0 disables rendering)")
+    args, _ = parser.parse_known_args()
+    return args
+
+
+class HeadlessStats:
+    def __init__(self, sim_time, wall_time, n_steps, frames):
+        self.sim_time = sim_time  # simulated seconds
+        self.wall_time = wall_time  # wall clock seconds
+        self.n_steps = n_steps  # physics steps taken
+        self.frames = frames  # offscreen frames, (n_frames, height, width, 3) uint8
+
+    @property
+    def realtime_factor(self):
+        return self.sim_time / self.wall_time if self.wall_time > 0 else np.inf
+
+    def report(self):
+        print("headless: %.2f s simulated in %.2f s wall (%d steps, %.1fx real time, %d frames)"
+              % (self.sim_time, self.wall_time, self.n_steps, self.realtime_factor, len(self.frames)))
+
+
+def run_headless(model, data, simend, render_every=0, width=640, height=480, camera=-1, on_frame=None):
+    """Step until data.time >= simend as fast as possible, without a window or vsync.
+
+    Controller callbacks installed with mj.set_mjcb_control run as usual. With render_every > 0 a
+    frame is rendered offscreen every render_every physics steps (needs MUJOCO_GL=egl or osmesa on
+    machines without a display) and either passed to on_frame or kept in the returned stats.
+    """
+    renderer = mj.Renderer(model, height, width) if render_every > 0 else None
+    frames = []
+    n_steps = 0
+    sim_start = data.time
+
+    start = time.perf_counter()
+    while data.time < simend:
+        mj.mj_step(model, data)
+        n_steps += 1
+        if renderer is not None and n_steps % render_every == 0:
+            renderer.update_scene(data, camera)
+            pixels = renderer.render()
+            if on_frame is not None:
+                on_frame(pixels)
+            else:
+                frames.append(pixels)
+    wall_time = time.perf_counter() - start
+
+    if renderer is not None:
+        renderer.close()
+    frames = np.array(frames, dtype=np.uint8).reshape(-1, height, width, 3)
+    return HeadlessStats(data.time - sim_start, wall_time, n_steps, frames)
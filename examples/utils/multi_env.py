@@ -0,0 +1,165 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import mujoco as mj
+import numpy as np
+
+quad_model = Path(__file__).parent.parent.parent / "quadrotor.xml"
+
+state_spec = mj.mjtState.mjSTATE_FULLPHYSICS
+
+
+def _chunks(n_envs, n_workers):
+    # contiguous env ranges, one per worker
+    bounds = np.linspace(0, n_envs, n_workers + 1).astype(int)
+    return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def _buffer_shapes(model, n_envs, n_steps):
+    return {
+        "time": (n_envs, n_steps + 1),
+        "qpos": (n_envs, n_steps + 1, model.nq),
+        "qvel": (n_envs, n_steps + 1, model.nv),
+        "sensordata": (n_envs, n_steps + 1, model.nsensordata),
+        "ctrl": (n_envs, n_steps, model.nu),
+        "state": (n_envs, mj.mj_stateSize(model, state_spec)),
+    }
+
+
+def _record(out, i, k, data):
+    out["time"][i, k] = data.time
+    out["qpos"][i, k] = data.qpos
+    out["qvel"][i, k] = data.qvel
+    out["sensordata"][i, k] = data.sensordata
+
+
+def _run_chunk(model, datas, lo, hi, n_steps, out, ctrl=None, policy=None):
+    """Step envs lo..hi for n_steps, writing their trajectories into rows lo..hi of out.
+
+    ctrl is an open loop input, (n_envs, nu) or (n_envs, n_steps, nu). policy(model, data, env, step)
+    is called before every step instead and sets data.ctrl itself.
+    """
+    for i, data in zip(range(lo, hi), datas):
+        mj.mj_forward(model, data)
+        _record(out, i, 0, data)
+        for k in range(n_steps):
+            if policy is not None:
+                policy(model, data, i, k)
+            elif ctrl is not None:
+                data.ctrl[:] = ctrl[i] if ctrl.ndim == 2 else ctrl[i, k]
+            out["ctrl"][i, k] = data.ctrl
+            mj.mj_step(model, data)
+            _record(out, i, k + 1, data)
+        mj.mj_getState(model, data, out["state"][i], state_spec)
+
+
+_worker_model = None
+
+
+def _init_worker(xml_path):
+    # each process compiles the model once and reuses it for every rollout
+    global _worker_model
+    _worker_model = mj.MjModel.from_xml_path(str(xml_path))
+
+
+def _process_chunk(shm_names, shapes, lo, hi, n_steps, states, ctrl, policy):
+    blocks = {name: shared_memory.SharedMemory(name=shm_name) for name, shm_name in shm_names.items()}
+    try:
+        out = {name: np.ndarray(shapes[name], dtype=np.float64, buffer=blocks[name].buf) for name in blocks}
+        datas = []
+        for state in states:
+            data = mj.MjData(_worker_model)
+            mj.mj_setState(_worker_model, data, state, state_spec)
+            datas.append(data)
+        _run_chunk(_worker_model, datas, lo, hi, n_steps, out, ctrl, policy)
+        del out
+    finally:
+        for block in blocks.values():
+            block.close()
+
+
+class MultiEnv:
+    """N independent MjData instances of one compiled model, stepped across a worker pool.
+
+    backend='thread' shares the model and the output arrays between threads, mj_step releases the
+    GIL so the physics runs concurrently. backend='process' compiles the model once per worker
+    process and writes trajectories into shared memory, policies then have to be picklable.
+    """
+
+    def __init__(self, n_envs, xml_path=quad_model, n_workers=None, backend="thread"):
+        if backend not in ("thread", "process"):
+            raise ValueError("backend must be 'thread' or 'process', got %r" % backend)
+        self.xml_path = xml_path
+        self.model = mj.MjModel.from_xml_path(str(xml_path))
+        self.datas = [mj.MjData(self.model) for _ in range(n_envs)]
+        self.n_envs = n_envs
+        self.n_workers = min(n_workers or os.cpu_count(), n_envs)
+        self.backend = backend
+        if backend == "thread":
+            self.pool = ThreadPoolExecutor(self.n_workers)
+        else:
+            self.pool = ProcessPoolExecutor(self.n_workers, initializer=_init_worker, initargs=(xml_path,))
+
+    def reset(self, qpos=None, qvel=None):
+        # initial conditions per env, (n_envs, nq) and (n_envs, nv), default is the model's qpos0
+        for i, data in enumerate(self.datas):
+            mj.mj_resetData(self.model, data)
+            if qpos is not None:
+                data.qpos[:] = qpos[i]
+            if qvel is not None:
+                data.qvel[:] = qvel[i]
+
+    def rollout(self, n_steps, ctrl=None, policy=None):
+        """Advance every env n_steps and return the trajectories as a dict of arrays.
+
+        time, qpos, qvel and sensordata are (n_envs, n_steps + 1, ...) including the initial
+        state, ctrl is (n_envs, n_steps, nu).
+        """
+        if ctrl is not None:
+            ctrl = np.asarray(ctrl, dtype=np.float64)
+        shapes = _buffer_shapes(self.model, self.n_envs, n_steps)
+        chunks = _chunks(self.n_envs, self.n_workers)
+
+        if self.backend == "thread":
+            out = {name: np.empty(shape) for name, shape in shapes.items()}
+            futures = [self.pool.submit(_run_chunk, self.model, self.datas[lo:hi], lo, hi, n_steps, out, ctrl, policy)
+                       for lo, hi in chunks]
+            for future in futures:
+                future.result()
+            return out
+
+        blocks = {name: shared_memory.SharedMemory(create=True, size=max(8 * int(np.prod(shape)), 1))
+                  for name, shape in shapes.items()}
+        try:
+            shm_names = {name: block.name for name, block in blocks.items()}
+            states = np.empty(shapes["state"])
+            for i, data in enumerate(self.datas):
+                mj.mj_getState(self.model, data, states[i], state_spec)
+            futures = [self.pool.submit(_process_chunk, shm_names, shapes, lo, hi, n_steps, states[lo:hi],
+                                        ctrl, policy)
+                       for lo, hi in chunks]
+            for future in futures:
+                future.result()
+            out = {name: np.ndarray(shapes[name], dtype=np.float64, buffer=blocks[name].buf).copy()
+                   for name in blocks}
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+
+        # keep the parent's MjData in sync so consecutive rollouts continue where the last one ended
+        for i, data in enumerate(self.datas):
+            mj.mj_setState(self.model, data, out["state"][i], state_spec)
+            mj.mj_forward(self.model, data)
+        return out
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,47 @@
+import os
+import time
+
+import numpy as np
+
+from examples.utils.multi_env import MultiEnv
+
+# env steps per second of MultiEnv for 1..num_cores workers, open loop thrust with random initial heights
+n_envs = 64
+n_steps = 500
+
+
+def initial_conditions(model, seed=0):
+    rng = np.random.default_rng(seed)
+    qpos = np.tile(model.qpos0, (n_envs, 1))
+    qpos[:, 2] += rng.uniform(0.5, 2.0, n_envs)
+    ctrl = np.zeros((n_envs, model.nu))
+    ctrl[:, :4] = rng.uniform(0.0, 1.0, (n_envs, 4))
+    return qpos, ctrl
+
+
+def benchmark(backend, n_workers):
+    with MultiEnv(n_envs, n_workers=n_workers, backend=backend) as envs:
+        qpos, ctrl = initial_conditions(envs.model)
+        envs.reset(qpos)
+        envs.rollout(10, ctrl)  # spin up the pool
+        envs.reset(qpos)
+        start = time.perf_counter()
+        out = envs.rollout(n_steps, ctrl)
+        elapsed = time.perf_counter() - start
+    return elapsed, out
+
+
+if __name__ == '__main__':
+    n_cores = os.cpu_count()
+    print("%d envs x %d steps, %d cores" % (n_envs, n_steps, n_cores))
+    reference = None
+    for backend in ("thread", "process"):
+        base = None
+        for n_workers in range(1, n_cores + 1):
+            elapsed, out = benchmark(backend, n_workers)
+            base = base or elapsed
+            if reference is None:
+                reference = out["qpos"]
+            deviation = np.abs(out["qpos"] - reference).max()
+            print("%-8s workers %2d: %7.3f s, %9.0f env steps/s, speedup %.2fx, max |qpos - reference| %.1e"
+                  % (backend, n_workers, elapsed, n_envs * n_steps / elapsed, base / elapsed, deviation))
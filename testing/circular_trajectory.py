@@ -1,28 +1,21 @@
 import numpy as np
 
 
-def calculate_circle_waypoints():
+def calculate_circle_waypoints(radius=1.0, total_time=100, time_step=0.01, start_point=(0.0, 0.0, 0.0)):
+    """Start point followed by one waypoint per time step around a circle centered on it.
+
+    Returns an array of shape (num_waypoints + 1, 3, 1). For position, velocity and acceleration
+    references see control_strategies/mpc/trajectories.py.
+    """
 
     # circular trajectory parameters
-    radius = 1.0
-    circumference = 2*3.14*1
-    time_step = 0.01
-    total_time = 100
     num_waypoints = int(total_time / time_step)
-    angle_increment = 2 * 3.14 / num_waypoints
-
-
-    start_point = [[0.0], [0.0], [0.0]]
-    waypoints = np.array([start_point])
+    angle = np.arange(num_waypoints) * (2 * np.pi / num_waypoints)
 
-    for step in range(num_waypoints):
-        angle = step * angle_increment
-        x = np.array([start_point[0][0] + radius * np.cos(angle)])
-        y = np.array([start_point[1][0] + radius * np.sin(angle)])
-        z = np.array([start_point[2][0]])
-        # print(np.array([x, y, z]))
-        waypoints = np.append(waypoints, np.array([[x, y, z]]), axis=0)
+    waypoints = np.empty((num_waypoints + 1, 3, 1))
+    waypoints[0, :, 0] = start_point
+    waypoints[1:, 0, 0] = start_point[0] + radius * np.cos(angle)
+    waypoints[1:, 1, 0] = start_point[1] + radius * np.sin(angle)
+    waypoints[1:, 2, 0] = start_point[2]
 
     return waypoints
-
-
@@ -5,6 +5,10 @@ import sympy as sp
 from sympy.matrices import Matrix
 import math
 import os
+import sys
+# the repository root, so examples.utils resolves when the script is run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from examples.utils.headless import headless_args, run_headless
 
 xml_path = 'quadrotor.xml' #xml file (assumes this is in the same folder as this file)
 simend = 200 #simulation time
@@ -285,23 +289,28 @@ data = mj.MjData(model)                # MuJoCo data
 cam = mj.MjvCamera()                        # Abstract camera
 opt = mj.MjvOption()                        # visualization options
 
-# Init GLFW, create window, make OpenGL context current, request v-sync
-glfw.init()
-window = glfw.create_window(1200, 900, "Demo", None, None)
-glfw.make_context_current(window)
-glfw.swap_interval(1)
-
-# initialize visualization data structures
-mj.mjv_defaultCamera(cam)
-mj.mjv_defaultOption(opt)
-scene = mj.MjvScene(model, maxgeom=10000)
-context = mj.MjrContext(model, mj.mjtFontScale.mjFONTSCALE_150.value)
-
-# install GLFW mouse and keyboard callbacks
-glfw.set_key_callback(window, keyboard)
-glfw.set_cursor_pos_callback(window, mouse_move)
-glfw.set_mouse_button_callback(window, mouse_button)
-glfw.set_scroll_callback(window, scroll)
+# --headless steps as fast as possible without a window, see examples/utils/headless.py
+args = headless_args(simend)
+simend = args.simend
+
+if not args.headless:
+    # Init GLFW, create window, make OpenGL context current, request v-sync
+    glfw.init()
+    window = glfw.create_window(1200, 900, "Demo", None, None)
+    glfw.make_context_current(window)
+    glfw.swap_interval(1)
+
+    # initialize visualization data structures
+    mj.mjv_defaultCamera(cam)
+    mj.mjv_defaultOption(opt)
+    scene = mj.MjvScene(model, maxgeom=10000)
+    context = mj.MjrContext(model, mj.mjtFontScale.mjFONTSCALE_150.value)
+
+    # install GLFW mouse and keyboard callbacks
+    glfw.set_key_callback(window, keyboard)
+    glfw.set_cursor_pos_callback(window, mouse_move)
+    glfw.set_mouse_button_callback(window, mouse_button)
+    glfw.set_scroll_callback(window, scroll)
 
 # Example on how to set camera configuration
 # cam.azimuth = 90
@@ -315,36 +324,39 @@ init_controller(model,data)
 #set the controller
 mj.set_mjcb_control(controller)
 
-while not glfw.window_should_close(window):
-    time_prev = data.time
+if args.headless:
+    run_headless(model, data, simend, render_every=args.render_every).report()
+else:
+    while not glfw.window_should_close(window):
+        time_prev = data.time
 
-    while (data.time - time_prev < 1.0/60.0):
-        mj.mj_step(model, data)
+        while (data.time - time_prev < 1.0/60.0):
+            mj.mj_step(model, data)
 
-    if (data.time>=simend):
-        break;
+        if (data.time>=simend):
+            break;
     
 
 
-    # get framebuffer viewport
-    viewport_width, viewport_height = glfw.get_framebuffer_size(
-        window)
-    viewport = mj.MjrRect(0, 0, viewport_width, viewport_height)
+        # get framebuffer viewport
+        viewport_width, viewport_height = glfw.get_framebuffer_size(
+            window)
+        viewport = mj.MjrRect(0, 0, viewport_width, viewport_height)
 
-    #print camera configuration (help to initialize the view)
-    # if (print_camera_config==1):
-    #     print('cam.azimuth =',cam.azimuth,';','cam.elevation =',cam.elevation,';','cam.distance = ',cam.distance)
-    #     print('cam.lookat =np.array([',cam.lookat[0],',',cam.lookat[1],',',cam.lookat[2],'])')
+        #print camera configuration (help to initialize the view)
+        # if (print_camera_config==1):
+        #     print('cam.azimuth =',cam.azimuth,';','cam.elevation =',cam.elevation,';','cam.distance = ',cam.distance)
+        #     print('cam.lookat =np.array([',cam.lookat[0],',',cam.lookat[1],',',cam.lookat[2],'])')
 
-    # Update scene and render
-    mj.mjv_updateScene(model, data, opt, None, cam,
-                       mj.mjtCatBit.mjCAT_ALL.value, scene)
-    mj.mjr_render(viewport, scene, context)
+        # Update scene and render
+        mj.mjv_updateScene(model, data, opt, None, cam,
+                           mj.mjtCatBit.mjCAT_ALL.value, scene)
+        mj.mjr_render(viewport, scene, context)
 
-    # swap OpenGL buffers (blocking call due to v-sync)
-    glfw.swap_buffers(window)
+        # swap OpenGL buffers (blocking call due to v-sync)
+        glfw.swap_buffers(window)
 
-    # process pending GUI events, call GLFW callbacks
-    glfw.poll_events()
+        # process pending GUI events, call GLFW callbacks
+        glfw.poll_events()
 
-glfw.terminate()
\ No newline at end of file
+    glfw.terminate()